@@ -1,81 +1,91 @@
 # --------------------------------------------------------------
 #  SMART ATTENDANCE – LOW LATENCY ( < 100 ms per frame )
 # --------------------------------------------------------------
+from metrics import metrics, FrameProfiler, startup
 import cv2
-import os
+import threading
+import time
 import numpy as np
-import pandas as pd
 from datetime import datetime
-from deepface import DeepFace
-from mtcnn import MTCNN                     # <-- fast detector
-from scipy.spatial.distance import cosine
+from attendance import AttendanceLog
+from gallery import Gallery
+from core_recognition import create_detector, embed_faces, enrollment_photos, face_quality, model_spec
+from motion import MotionGate, merge_boxes
+from tracking import FaceTracker
 import warnings
 warnings.filterwarnings("ignore")
 
 # ---------------------------
 # CONFIG
 # ---------------------------
-KNOWN_FOLDER   = 'ImagesAttendance'   # known faces (one clear photo per person)
-CSV_FILE       = 'Attendance.csv'
-RECOG_MODEL    = 'VGG-Face'          # fast & accurate
-DETECTOR       = 'mtcnn'             # 'opencv' also works
-FRAME_SKIP     = 5                   # recognise only every Nth frame
-FACE_SIZE      = 224                 # model input size
-CONF_THRESHOLD = 0.60                # cosine similarity threshold (higher = stricter)
+KNOWN_FOLDER   = 'ImagesAttendance'   # <class>/<name>.jpg, or a <class>/<name>/ folder of several photos
+CSV_FILE       = 'AttendanceLogs/Attendance_{date}.csv'   # one file per day
+RECOG_MODEL    = 'VGG-Face'          # any core_recognition.MODELS entry, e.g. 'Facenet', 'ArcFace-int8'
+DETECTOR       = 'mtcnn'             # 'yunet', 'opencv-dnn', 'haar' also work
+DETECT_SCALE   = 0.5                 # detect on a downscaled frame
+REVERIFY_EVERY = 30                  # re-embed a tracked face every Nth frame
+VOTES_NEEDED   = 3                   # agreeing recognitions before marking
+FACE_SIZE      = model_spec(RECOG_MODEL).input_size[::-1]   # model input (w, h)
+CONF_THRESHOLD = model_spec(RECOG_MODEL).threshold    # calibrated per model (higher = stricter)
+MAX_BATCH      = 32                  # faces per embedding forward pass
+SHOW_TIMINGS   = True                # p50 / p95 per stage drawn on the video
+PROFILE_FRAMES = 0                   # > 0: cProfile this many frames, then print the report
+MOTION_GATE    = True                # skip detection while nothing in the picture moves
 
 # ---------------------------
-# 1. Load known faces → embeddings (once)
+# 1. Load known faces → embeddings (in the background; the window opens at once)
 # ---------------------------
-print("[INFO] Loading known faces and computing embeddings...")
-known_names = []
-known_embeddings = []
-
-detector = MTCNN() if DETECTOR == 'mtcnn' else None
-
-for file in os.listdir(KNOWN_FOLDER):
-    if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-        path = os.path.join(KNOWN_FOLDER, file)
-        img  = cv2.imread(path)
-        if img is None:
-            continue
+gallery = Gallery()
+detector = None
+ready = threading.Event()
+
+def load_known_faces():
+    global detector
+    print("[INFO] Loading known faces and computing embeddings...")
+    with startup.phase('models'):
+        det = create_detector(DETECTOR, scale=DETECT_SCALE)
+        det.detect(np.zeros((480, 640, 3), np.uint8))                      # warm-up
+        embed_faces([np.zeros((FACE_SIZE[1], FACE_SIZE[0], 3), np.uint8)], RECOG_MODEL)
+
+    with startup.phase('gallery'):
+        found = []
+        for key, path, name, class_name in enrollment_photos(KNOWN_FOLDER):
+            img  = cv2.imread(path)
+            if img is None:
+                continue
 
-        # detect face in known image (single face expected)
-        if DETECTOR == 'mtcnn':
-            det = detector.detect_faces(img)
-            if not det:
+            # detect face in known image (single face expected), full resolution
+            boxes = det.detect(img, scale=1.0)
+            if not boxes:
                 continue
-            x, y, w, h = det[0]['box']
+            x, y, w, h, conf = max(boxes, key=lambda d: d[4])
             face = img[y:y+h, x:x+w]
-        else:   # fallback to DeepFace (slower but safe)
-            face = DeepFace.extract_faces(img, detector_backend='retinaface',
-                                          enforce_detection=True, grayscale=False)[0]
-            fa = face['facial_area']
-            face = img[fa['y']:fa['y']+fa['h'], fa['x']:fa['x']+fa['w']]
+            found.append((name, class_name, key, face_quality(face, conf), cv2.resize(face, FACE_SIZE)))
+
+        # every enrollment photo in batched forward passes
+        embs = embed_faces([f[4] for f in found], RECOG_MODEL, MAX_BATCH)
+        for (name, class_name, key, quality, _), emb in zip(found, embs):
+            if emb is not None:
+                # several photos of one person are kept as samples around a centroid
+                gallery.add_sample(name, emb, class_name, quality=quality, sample_id=key)
 
-        face = cv2.resize(face, (FACE_SIZE, FACE_SIZE))
-        emb  = DeepFace.represent(face, model_name=RECOG_MODEL,
-                                  enforce_detection=False, detector_backend='skip')[0]['embedding']
-        known_embeddings.append(emb)
-        known_names.append(os.path.splitext(file)[0])
+    print(f"[INFO] Loaded {len(gallery)} known face(s).")
+    detector = det
+    ready.set()
+    startup.mark('recognition ready')
 
-print(f"[INFO] Loaded {len(known_names)} known face(s).")
+threading.Thread(target=load_known_faces, name='warm-up', daemon=True).start()
 
 # ---------------------------
 # 2. Attendance helper
 # ---------------------------
-def markAttendance(name):
-    now = datetime.now()
-    dateStr = now.strftime('%Y-%m-%d')
-    timeStr = now.strftime('%H:%M:%S')
-    if not os.path.exists(CSV_FILE):
-        pd.DataFrame(columns=['Name','Date','Time']).to_csv(CSV_FILE, index=False)
-
-    df = pd.read_csv(CSV_FILE)
-    if not ((df['Name'] == name) & (df['Date'] == dateStr)).any():
-        new = pd.DataFrame([{'Name':name, 'Date':dateStr, 'Time':timeStr}])
-        df = pd.concat([df, new], ignore_index=True)
-        df.to_csv(CSV_FILE, index=False)
-        print(f"[MARKED] {name} @ {timeStr}")
+attendance_log = AttendanceLog(CSV_FILE)
+
+def markAttendance(name, class_name=None):
+    # O(1): in-memory duplicate check + buffered append, no CSV re-read;
+    # keyed by (name, class) so namesakes in different classes are both marked
+    if attendance_log.mark(name, class_name=class_name):
+        print(f"[MARKED] {name} ({class_name}) @ {datetime.now().strftime('%H:%M:%S')}")
 
 # ---------------------------
 # 3. Webcam loop (fast)
@@ -84,71 +94,89 @@ cap = cv2.VideoCapture(0)
 cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
+tracker = FaceTracker(reverify_every=REVERIFY_EVERY, min_score=CONF_THRESHOLD,
+                      votes_needed=VOTES_NEEDED)
+gate = MotionGate() if MOTION_GATE else None
+faces = []
 frame_counter = 0
+profiler = FrameProfiler(PROFILE_FRAMES, mode='cprofile', path='profile.txt')
 print("[INFO] Webcam started – press 'q' to quit")
+startup.mark('window')
 
 while True:
     ret, frame = cap.read()
     if not ret:
         break
 
-    frame_counter += 1
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-    # ---------- 3a. Detect faces (fast) ----------
-    faces = []
-    if DETECTOR == 'mtcnn':
-        detections = detector.detect_faces(rgb)
-        for d in detections:
-            if d['confidence'] > 0.9:
-                x, y, w, h = d['box']
-                faces.append((x, y, w, h))
-    else:
-        # fallback DeepFace (still faster than RetinaFace every frame)
-        try:
-            dfaces = DeepFace.extract_faces(rgb, detector_backend='opencv',
-                                            enforce_detection=False, grayscale=False)
-            for f in dfaces:
-                fa = f['facial_area']
-                faces.append((fa['x'], fa['y'], fa['w'], fa['h']))
-        except:
-            pass
-
-    # ---------- 3b. Recognise only every FRAME_SKIP ----------
-    if frame_counter % FRAME_SKIP == 0 and faces:
-        for (x, y, w, h) in faces:
-            face_crop = rgb[y:y+h, x:x+w]
-            if face_crop.size == 0:
-                continue
-            face_crop = cv2.resize(face_crop, (FACE_SIZE, FACE_SIZE))
-
-            # get embedding (fast – model already loaded)
-            try:
-                emb_live = DeepFace.represent(face_crop, model_name=RECOG_MODEL,
-                                              enforce_detection=False,
-                                              detector_backend='skip')[0]['embedding']
-            except:
-                continue
+    if not ready.is_set():
+        cv2.putText(frame, "Loading face recognition...", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+        cv2.imshow('Smart Attendance – Low Latency', frame)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+        continue
 
-            # cosine similarity with all known embeddings
-            similarities = [1 - cosine(emb_live, known_emb) for known_emb in known_embeddings]
-            max_sim = max(similarities)
-            if max_sim >= CONF_THRESHOLD:
-                idx = similarities.index(max_sim)
-                name = known_names[idx]
-
-                # draw
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0,255,0), 2)
-                cv2.putText(frame, f"{name} ({max_sim:.2f})",
-                            (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
+    frame_start = time.perf_counter()
+    profiler.frame()
+    frame_counter += 1
 
-                markAttendance(name)
+    # ---------- 3a. Detect faces (fast, on a downscaled frame; only where something moved) ----------
+    motion = gate.check(frame) if gate else None
+    if motion is None or motion.rois is None:
+        faces = [d[:4] for d in detector.detect(frame)]
+    elif not motion.skip:
+        faces = merge_boxes(faces, [d[:4] for d in detector.detect(frame, motion.rois)], motion.rois)
+
+    # ---------- 3b. Track; recognise only new / doubtful / stale tracks ----------
+    tracks = tracker.update(faces)
+    todo, _ = tracker.split(tracks)
+    boxes, crops = [], []
+    for t in todo:
+        x, y, w, h = t.box
+        face_crop = frame[max(0, y):y+h, max(0, x):x+w]    # BGR, like the enrollment crops
+        if face_crop.size == 0:
+            continue
+        boxes.append(t)
+        crops.append(cv2.resize(face_crop, FACE_SIZE))
+
+    if crops:
+        # embed every face of the frame in one forward pass (model already loaded)
+        embs = embed_faces(crops, RECOG_MODEL, MAX_BATCH)
+        todo = [t for t, e in zip(boxes, embs) if e is not None]
+        live_embs = [e for e in embs if e is not None]
+
+        # cosine similarity of every face against every known embedding at once
+        with metrics.span('match'):
+            matches = gallery.match(live_embs) if live_embs else []
+        for t, top in zip(todo, matches):
+            if top and top[0].score >= CONF_THRESHOLD:
+                if tracker.assign(t, top[0].name, top[0].score, top[0].class_name):
+                    markAttendance(t.name, t.class_name)
+            else:
+                tracker.assign(t, "Unknown", top[0].score if top else 0.0)
+
+    # draw every track with the identity carried forward
+    for t in tracks:
+        if t.name is not None:
+            x, y, w, h = t.box
+            color = (0,255,0) if t.confirmed else (0,255,255)
+            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+            cv2.putText(frame, f"{t.name} ({t.score:.2f})",
+                        (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
 
     # ---------- 3c. Show ----------
+    metrics.record('frame', time.perf_counter() - frame_start)
+    if SHOW_TIMINGS:
+        metrics.overlay(frame, ['frame', f'detect.{detector.name}', 'embed.model', 'match'], (10, 460))
+    if frame_counter % 300 == 0:
+        print(f"[METRICS] {metrics.log_line()}")
+        if gate:
+            print(f"[MOTION] {gate.stats()}")
     cv2.imshow('Smart Attendance – Low Latency', frame)
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
 cap.release()
 cv2.destroyAllWindows()
-print("[INFO] Stopped. Attendance saved to", CSV_FILE)
\ No newline at end of file
+attendance_log.close()
+print("[INFO] Stopped. Attendance saved to", attendance_log.path or CSV_FILE)
\ No newline at end of file
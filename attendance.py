@@ -0,0 +1,253 @@
+# attendance.py
+import csv
+import os
+import re
+import threading
+from datetime import datetime
+
+from metrics import metrics
+
+CSV_HEADER = ['Name', 'Date', 'Time', 'Class']
+_OLD_HEADER = CSV_HEADER[:3]            # files written before the Class column
+_ROW = re.compile(r'^.+,\d{4}-\d{2}-\d{2},\d{2}:\d{2}:\d{2}(,.*)?$')
+
+
+def _parse(line):
+    """``[name, date, time, class or None]``, or None if ``line`` is not a row."""
+    row = next(csv.reader([line]), None)
+    if not row or len(row) not in (3, 4):
+        return None
+    return row[:3] + [row[3] if len(row) == 4 and row[3] else None]
+
+
+class AttendanceLog:
+    """Append-only attendance CSV with an in-memory "marked today" set.
+
+    Students are keyed by ``(name, class_name)``, so namesakes in different
+    classes are both marked.  ``path`` may contain ``{date}`` to rotate to
+    one file per day.  Rows are
+    buffered and flushed every ``flush_every`` marks or ``flush_interval``
+    seconds, so a mark costs O(1) no matter how long the history is.  On
+    (re)start today's names are recovered by reading the file backwards from
+    its end, and a torn last line left by a crash is cut off.  Files started
+    before the Class column existed keep their three columns; a name marked
+    in one without a class counts as marked for every class that day.
+    """
+
+    def __init__(self, path='AttendanceLogs/Attendance_{date}.csv', flush_every=50,
+                 flush_interval=1.0, fsync=False):
+        self.path_pattern = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.date = None
+        self.path = None
+        self.marked = set()         # (name, class_name) marked on self.date
+        self.rows_written = 0
+        self._columns = len(CSV_HEADER)
+        self._file = None
+        self._writer = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    # ---------- public ----------
+    def mark(self, name, when=None, class_name=None):
+        """Append ``name`` of ``class_name`` for today unless already marked; True if a row was written."""
+        with metrics.span('csv.mark'):
+            return self._mark(name, when, class_name)
+
+    def _mark(self, name, when, class_name):
+        when = when or datetime.now()
+        date_str = when.strftime('%Y-%m-%d')
+        with self._lock:
+            if date_str != self.date:
+                self._open(date_str)
+            if self._is_marked(name, class_name):
+                return False
+            self.marked.add((name, class_name))
+            row = [name, date_str, when.strftime('%H:%M:%S'), class_name or '']
+            self._writer.writerow(row[:self._columns])
+            self.rows_written += 1
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._flush_locked()
+        return True
+
+    def is_marked(self, name, date_str=None, class_name=None):
+        return (date_str or datetime.now().strftime('%Y-%m-%d')) == self.date and self._is_marked(name, class_name)
+
+    def _is_marked(self, name, class_name):
+        return (name, class_name) in self.marked or (name, None) in self.marked
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._flush_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # ---------- internals ----------
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _flush_locked(self):
+        if self._file is None or not self._pending:
+            return
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def _open(self, date_str):
+        self._flush_locked()
+        if self._file is not None:
+            self._file.close()
+        self.path = self.path_pattern.format(date=date_str)
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._repair_tail(self.path)
+        self.marked = self._recover(self.path, date_str)
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._columns = len(CSV_HEADER) if new else self._header_columns(self.path)
+        self._file = open(self.path, 'a', newline='', buffering=1 << 16)
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        if new:
+            self._writer.writerow(CSV_HEADER)
+            self._pending += 1
+        self.date = date_str
+
+    @staticmethod
+    def _header_columns(path):
+        with open(path, newline='') as f:
+            header = next(csv.reader(f), None)
+        return len(_OLD_HEADER) if header == _OLD_HEADER else len(CSV_HEADER)
+
+    @staticmethod
+    def _repair_tail(path):
+        """Make sure the file ends with a complete line."""
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            start = max(0, f.tell() - 4096)
+            f.seek(start)
+            tail = f.read()
+            if tail.endswith(b'\n'):
+                return
+            cut = tail.rfind(b'\n')
+            last = tail[cut + 1:].decode('utf-8', 'replace')
+            if _ROW.match(last) or last in (','.join(CSV_HEADER), ','.join(_OLD_HEADER)) \
+                    or (cut < 0 and start > 0):
+                f.write(b'\n')          # complete row, just missing its newline
+            else:
+                f.truncate(start + cut + 1)
+                print(f"[CSV] Dropped torn last line in {path}")
+
+    @staticmethod
+    def _recover(path, date_str, block=1 << 16):
+        """``(name, class_name)`` already marked on ``date_str``, reading backwards until an older date."""
+        marked = set()
+        if not os.path.exists(path):
+            return marked
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            carry = b''
+            while pos > 0:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step) + carry
+                lines = chunk.split(b'\n')
+                carry = lines.pop(0) if pos > 0 else b''
+                for raw in reversed(lines):
+                    row = _parse(raw.decode('utf-8', 'replace')) if raw else None
+                    if row is None or row[:3] == _OLD_HEADER:
+                        continue
+                    if row[1] < date_str:
+                        return marked
+                    if row[1] == date_str:
+                        marked.add((row[0], row[3]))
+        return marked
+
+
+class PresenceCache:
+    """Per-session, per-day set of students already marked present.
+
+    Checked before any attendance I/O so repeat sightings cost one set
+    lookup.  ``check_and_add`` only holds a key as in flight; it counts as
+    present once ``add`` reports its row written, and ``release`` (unknown
+    student, failed write) lets the next sighting try again.
+    ``seed(date_str)`` returns the keys already recorded that day (e.g. from
+    the database); the sets are re-seeded when the day or the session
+    changes.
+    """
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.session = None
+        self.date = None
+        self.hits = 0
+        self.misses = 0
+        self._present = set()
+        self._pending = set()       # handed to the writer, not yet written
+        self._lock = threading.Lock()
+
+    def start_session(self, session):
+        with self._lock:
+            if session != self.session:
+                self.session = session
+                self._reset(datetime.now().strftime('%Y-%m-%d'))
+
+    def _reset(self, date_str):
+        self.date = date_str
+        self._present = set(self.seed(date_str)) if self.seed else set()
+        self._pending = set()
+
+    def check_and_add(self, key, when=None):
+        """True if ``key`` is neither present nor in flight today (go and mark it), else False."""
+        date_str = (when or datetime.now()).strftime('%Y-%m-%d')
+        with self._lock:
+            if date_str != self.date:
+                self._reset(date_str)       # midnight rollover
+            if key in self._present or key in self._pending:
+                self.hits += 1
+                metrics.incr('presence.hits')
+                return False
+            self.misses += 1
+            metrics.incr('presence.misses')
+            self._pending.add(key)
+            return True
+
+    def add(self, key, date_str=None):
+        """``key``'s row for ``date_str`` was written: it is present."""
+        with self._lock:
+            if (date_str or self.date) == self.date:
+                self._pending.discard(key)
+                self._present.add(key)
+
+    def release(self, key):
+        """``key``'s mark recorded nothing: the next sighting tries again."""
+        with self._lock:
+            self._pending.discard(key)
+
+    def discard(self, key):
+        with self._lock:
+            self._present.discard(key)
+            self._pending.discard(key)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'present': len(self._present), 'pending': len(self._pending),
+                'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0}
@@ -0,0 +1,316 @@
+# batch_attendance.py
+"""Take attendance offline from recorded lecture videos and folders of class photos.
+
+    python batch_attendance.py lectures/monday.mp4 photos/Class_10A --sample-fps 1
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2
+
+from attendance import AttendanceLog, PresenceCache
+from database import init_db, AttendanceWriter, present_students
+
+VIDEO_EXTS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v', '.wmv')
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+# ==================== SOURCES ====================
+def expand_sources(paths):
+    """``(label, kind, item)`` for each video, and one per folder of images."""
+    for path in paths:
+        if os.path.isdir(path):
+            images = []
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                for f in sorted(files):
+                    full = os.path.join(root, f)
+                    if f.lower().endswith(VIDEO_EXTS):
+                        yield full, 'video', full
+                    elif f.lower().endswith(IMAGE_EXTS):
+                        images.append(full)
+            if images:
+                yield path, 'images', images
+        elif path.lower().endswith(IMAGE_EXTS):
+            yield path, 'images', [path]
+        else:
+            yield path, 'video', path
+
+
+def _video_info(path):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+    return fps, count
+
+
+def _step(fps, sample_fps):
+    return max(1, round(fps / sample_fps)) if sample_fps else 1
+
+
+def source_length(kind, item, sample_fps):
+    """Number of frames the source will yield (0 if the container does not say)."""
+    if kind == 'images':
+        return len(item)
+    fps, count = _video_info(item)
+    return -(-count // _step(fps, sample_fps))
+
+
+def video_frames(path, sample_fps, start=None):
+    """``(when, frame)`` every ``1/sample_fps`` seconds of video.
+
+    Frames in between are grabbed but never decoded.  Without ``start`` the
+    recording is assumed to end at the file's modification time.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"[WARN] Cannot open {path}")
+        return
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    if start is None:
+        duration = (cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0) / fps
+        start = datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=duration)
+    step = _step(fps, sample_fps)
+    idx = 0
+    try:
+        while True:
+            if idx % step == 0:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield start + timedelta(seconds=idx / fps), frame
+            elif not cap.grab():
+                break
+            idx += 1
+    finally:
+        cap.release()
+
+
+def image_frames(paths, start=None):
+    """``(when, frame)`` per readable image; time is ``start`` or the file's mtime."""
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            print(f"[WARN] Cannot read {path}")
+            continue
+        yield start or datetime.fromtimestamp(os.path.getmtime(path)), frame
+
+
+def batches(sources, sample_fps, batch_size, start=None):
+    """``((label, whens), frames)`` chunks of up to ``batch_size`` frames, never spanning sources."""
+    for label, kind, item in sources:
+        frames = video_frames(item, sample_fps, start) if kind == 'video' else image_frames(item, start)
+        whens, chunk = [], []
+        for when, frame in frames:
+            whens.append(when)
+            chunk.append(frame)
+            if len(chunk) == batch_size:
+                yield (label, whens), chunk
+                whens, chunk = [], []
+        if chunk:
+            yield (label, whens), chunk
+
+
+# ==================== RECOGNITION ====================
+_worker_recognizer = None
+
+def _init_worker(recognizer_kwargs, gallery_path=None):
+    global _worker_recognizer
+    # one worker per core: keep each one single-threaded
+    os.environ.setdefault('OMP_NUM_THREADS', '1')
+    os.environ.setdefault('TF_NUM_INTRAOP_THREADS', '1')
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+    cv2.setNumThreads(1)
+    from core_recognition import FaceRecognizer
+    if gallery_path:
+        # map the parent's gallery instead of loading a private copy
+        from shared_gallery import attach
+        recognizer_kwargs = dict(recognizer_kwargs, gallery=attach(gallery_path))
+    _worker_recognizer = FaceRecognizer(**recognizer_kwargs)
+
+def _worker_recognize(frames, class_name, fallback):
+    return _worker_recognizer.recognize_many(frames, class_name, fallback)
+
+
+def recognize_batches(chunks, recognizer_kwargs, workers, class_name=None, fallback=False,
+                      shared_gallery=True):
+    """Yield ``(meta, results)`` in input order, with at most ``2 * workers`` batches in flight.
+
+    With ``shared_gallery`` this process loads the gallery once and the
+    workers map it (see shared_gallery.py); they are spawned rather than
+    forked, since the parent may have built a model to embed new photos.
+    """
+    if workers <= 0:
+        from core_recognition import FaceRecognizer
+        recognizer = FaceRecognizer(**recognizer_kwargs)
+        for meta, frames in chunks:
+            yield meta, recognizer.recognize_many(frames, class_name, fallback)
+        return
+    publisher, context, gallery_path = None, None, None
+    if shared_gallery:
+        from core_recognition import FaceRecognizer
+        from shared_gallery import GalleryPublisher
+        publisher = GalleryPublisher(FaceRecognizer(**dict(recognizer_kwargs, lazy=False)).gallery)
+        context, gallery_path = multiprocessing.get_context('spawn'), publisher.path
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(recognizer_kwargs, gallery_path)) as pool:
+            pending = deque()
+            for meta, frames in chunks:
+                pending.append((meta, pool.submit(_worker_recognize, frames, class_name, fallback)))
+                if len(pending) >= 2 * workers:
+                    meta, future = pending.popleft()
+                    yield meta, future.result()
+            while pending:
+                meta, future = pending.popleft()
+                yield meta, future.result()
+    finally:
+        if publisher is not None:
+            publisher.close()
+
+
+# ==================== MARKING ====================
+class BatchMarker:
+    """Deduplicated DB + CSV marking for offline runs.
+
+    A name must be recognised in ``min_hits`` sampled frames of one source
+    before it is marked; repeats are dropped by the presence cache before any
+    I/O, and the DB's unique index catches the rest.
+    """
+
+    def __init__(self, db_path=None, csv_path='AttendanceLogs/Attendance_{date}.csv', min_hits=1):
+        init_db(db_path)
+        self.min_hits = min_hits
+        self.hits = Counter()
+        self.marked = 0
+        self.log = AttendanceLog(csv_path)
+        self.presence = PresenceCache(seed=lambda date_str: present_students(date_str, db_path))
+        self.writer = AttendanceWriter(db_path, on_inserted=self._inserted, on_failed=self._failed)
+
+    def observe(self, label, when, results):
+        for r in results:
+            if r.name in ("Unknown", "Error"):
+                continue
+            key = (r.name, r.class_name)
+            self.hits[(label, key)] += 1
+            if self.hits[(label, key)] >= self.min_hits and self.presence.check_and_add(key, when):
+                self.writer.mark(r.name, r.class_name, when)
+
+    def _inserted(self, rows):
+        for name, class_name, date_str, time_str in rows:
+            self.presence.add((name, class_name), date_str)
+            self.marked += 1
+            self.log.mark(name, datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M:%S"), class_name)
+            print(f"[MARKED] {name} ({class_name}) {date_str} {time_str}")
+
+    def _failed(self, events):
+        for name, class_name, _ in events:
+            self.presence.release((name, class_name))
+
+    def close(self):
+        self.writer.close()
+        self.log.close()
+
+
+# ==================== DRIVER ====================
+def run(paths, recognizer_kwargs, sample_fps=1.0, workers=None, batch_size=8, class_name=None,
+        fallback=False, min_hits=1, start=None, db_path=None, csv_path='AttendanceLogs/Attendance_{date}.csv',
+        progress_every=2.0, shared_gallery=True):
+    sources = list(expand_sources(paths))
+    if not sources:
+        print("[WARN] Nothing to process")
+        return {}
+    totals = {label: source_length(kind, item, sample_fps) for label, kind, item in sources}
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    print(f"[BATCH] {len(sources)} source(s), ~{sum(totals.values())} frames, "
+          f"{workers or 'no'} worker process(es)")
+
+    marker = BatchMarker(db_path, csv_path, min_hits)
+    done = Counter()
+    frames = faces = 0
+    started = last_report = time.perf_counter()
+    current = None
+    source_started = {}
+    try:
+        chunks = batches(sources, sample_fps, batch_size, start)
+        for (label, whens), results in recognize_batches(chunks, recognizer_kwargs, workers,
+                                                         class_name, fallback, shared_gallery):
+            if label != current:
+                if current is not None:
+                    _report(current, done[current], totals[current], source_started[current])
+                current = label
+                source_started[label] = time.perf_counter()
+            for when, frame_results in zip(whens, results):
+                marker.observe(label, when, frame_results)
+                faces += len(frame_results)
+            done[label] += len(whens)
+            frames += len(whens)
+            now = time.perf_counter()
+            if now - last_report >= progress_every:
+                last_report = now
+                _report(label, done[label], totals[label], source_started[label])
+        if current is not None:
+            _report(current, done[current], totals[current], source_started[current])
+    finally:
+        marker.close()
+
+    elapsed = time.perf_counter() - started
+    summary = {'sources': len(sources), 'frames': frames, 'faces': faces, 'seconds': round(elapsed, 2),
+               'fps': round(frames / elapsed, 2) if elapsed else 0.0, 'marked': marker.marked,
+               'presence': marker.presence.stats()}
+    print(f"[BATCH] Done: {frames} frames, {faces} faces in {elapsed:.1f}s "
+          f"({summary['fps']:.2f} fps), {marker.marked} marked")
+    return summary
+
+
+def _report(label, done, total, started):
+    elapsed = time.perf_counter() - started
+    pct = f"{100.0 * done / total:5.1f}%" if total else "   ?  "
+    fps = done / elapsed if elapsed else 0.0
+    print(f"[BATCH] {os.path.basename(label.rstrip(os.sep)) or label}: {pct} "
+          f"{done}/{total or '?'} frames  {fps:.2f} fps  ({elapsed:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline attendance from videos and photo folders")
+    parser.add_argument('paths', nargs='+', help="video files, images or folders of either")
+    parser.add_argument('--sample-fps', type=float, default=1.0,
+                        help="video frames per second to recognise (0 = every frame)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="recognizer processes (default: one per core, 0 = in-process)")
+    parser.add_argument('--batch', type=int, default=8, help="frames per task")
+    parser.add_argument('--private-gallery', action='store_true',
+                        help="each worker loads its own gallery instead of mapping a shared one")
+    parser.add_argument('--class', dest='class_name', default=None, help="only search this class")
+    parser.add_argument('--fallback', action='store_true', help="fall back to every class")
+    parser.add_argument('--min-hits', type=int, default=1,
+                        help="sampled frames (or photos) of one source a student must be seen in "
+                             "before marking; 2-3 filters one-frame false matches in videos")
+    parser.add_argument('--start', default=None,
+                        help="'YYYY-MM-DD HH:MM' the recording started (default: from file times)")
+    parser.add_argument('--model', default='VGG-Face', help="a core_recognition.MODELS entry")
+    parser.add_argument('--detector', default='mtcnn')
+    parser.add_argument('--detect-scale', type=float, default=1.0)
+    parser.add_argument('--threshold', type=float, default=None,
+                        help="match similarity (default: the model's calibrated threshold)")
+    parser.add_argument('--known', default='ImagesAttendance', help="enrolled faces folder")
+    parser.add_argument('--db', default=None, help="SQLite database (default: database.db)")
+    parser.add_argument('--csv', default='AttendanceLogs/Attendance_{date}.csv')
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, "%Y-%m-%d %H:%M") if args.start else None
+    recognizer_kwargs = {'db_path': args.known, 'model': args.model, 'threshold': args.threshold,
+                         'detector': args.detector, 'detect_scale': args.detect_scale}
+    run(args.paths, recognizer_kwargs, args.sample_fps, args.workers, args.batch, args.class_name,
+        args.fallback, args.min_hits, start, args.db, args.csv,
+        shared_gallery=not args.private_gallery)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,794 @@
+# benchmark.py
+"""Offline benchmarks; ``suite`` runs the recognition and attendance paths end to end.
+
+    python benchmark.py --json bench/HEAD.json suite
+    python benchmark.py compare bench/before.json bench/HEAD.json
+
+The suite needs no model weights: faces come from ``setup_demo.py``'s
+synthetic generator, embeddings from a fixed random projection and boxes
+from a threshold detector, so the numbers isolate our own code.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import cv2
+import numpy as np
+
+from gallery import Gallery, IVFIndex, exact_search, l2_normalize
+
+
+# ==================== SYNTHETIC DATA ====================
+def synthetic_embeddings(n, dim, seed=0):
+    """Clustered unit vectors, roughly like face embeddings of a real school."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 50), dim)).astype(np.float32)
+    members = centers[rng.integers(0, len(centers), n)]
+    return l2_normalize(members + 0.5 * rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def noisy_queries(gallery_vectors, count, noise=0.35, seed=1):
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(0, len(gallery_vectors), count)
+    queries = gallery_vectors[ids] + noise * rng.standard_normal(
+        (count, gallery_vectors.shape[1])).astype(np.float32)
+    return l2_normalize(queries), ids
+
+
+def _timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - start) / repeat, out
+
+
+def _percentiles(ms):
+    p50, p95 = np.percentile(ms, [50, 95])
+    return {'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3),
+            'mean_ms': round(float(np.mean(ms)), 3)}
+
+
+# ==================== STUB MODELS ====================
+STUB_MODEL = 'stub'
+STUB_DETECTOR = 'blob'
+
+
+class StubNet:
+    """Embedding "model" with the Keras call signature: a fixed random projection of the
+    mean-centred grayscale crop.  Same face in, nearly the same vector out."""
+    input_shape = (None, 32, 32, 3)
+
+    def __init__(self, dim=128, seed=0):
+        h, w = self.input_shape[1:3]
+        self.projection = np.random.default_rng(seed).standard_normal((h * w, dim)).astype(np.float32)
+
+    def __call__(self, batch, training=False):
+        gray = np.asarray(batch, dtype=np.float32).mean(axis=-1).reshape(len(batch), -1)
+        gray -= gray.mean(axis=1, keepdims=True)
+        return l2_normalize(gray @ self.projection)
+
+
+def install_stubs(dim=128):
+    """Register the stub embedding net and the blob detector with core_recognition."""
+    from core_recognition import DETECTORS, FaceDetector, register_embedding_net, register_model
+
+    class BlobDetector(FaceDetector):
+        """Bright blobs on the synthetic frames' dark background."""
+        name = STUB_DETECTOR
+
+        def __init__(self, scale=1.0, min_confidence=0.0, min_size=24):
+            super().__init__(scale, min_confidence)
+            self.min_size = min_size
+
+        def _detect(self, bgr):
+            gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+            _, mask = cv2.threshold(gray, 60, 255, cv2.THRESH_BINARY)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            min_size = self.min_size * self.scale
+            return [(x, y, w, h, 1.0) for x, y, w, h in map(cv2.boundingRect, contours)
+                    if w >= min_size and h >= min_size]
+
+    register_model(STUB_MODEL, StubNet.input_shape[1:3], 'base', dim, threshold=0.45)
+    register_embedding_net(STUB_MODEL, StubNet(dim))
+    DETECTORS[STUB_DETECTOR] = BlobDetector
+
+
+def stub_recognizer(gallery_dir, cache_dir, **kwargs):
+    from core_recognition import FaceRecognizer
+    install_stubs()
+    kwargs.setdefault('auto_capture', False)
+    return FaceRecognizer(gallery_dir, model=STUB_MODEL, detector=STUB_DETECTOR, cache_dir=cache_dir,
+                          **kwargs)
+
+
+# ==================== ANN vs EXACT ====================
+def bench_ann(sizes, dim, queries, batch, nprobes):
+    results = []
+    for n in sizes:
+        vectors = synthetic_embeddings(n, dim)
+        gallery = Gallery(dim=dim, capacity=n, index=IVFIndex(min_size=0))
+        gallery.add_many([f"s{i}" for i in range(n)], vectors)
+        q, _ = noisy_queries(vectors, queries)
+
+        start = time.perf_counter()
+        gallery.build_index(force=True)
+        train_s = time.perf_counter() - start
+
+        matrix = gallery.matrix
+        batches = [q[i:i + batch] for i in range(0, len(q), batch)]
+        exact_s, exact = _timed(lambda: [exact_search(matrix, b, 1)[0] for b in batches], 1)
+        truth = np.concatenate(exact)[:, 0]
+        row = {'identities': n, 'dim': dim, 'train_s': round(train_s, 3),
+               'exact_ms_per_query': round(1000 * exact_s / len(q), 4), 'ivf': []}
+        for nprobe in nprobes:
+            ivf_s, found = _timed(lambda: [gallery.search(b, 1, nprobe)[0] for b in batches], 1)
+            recall = float(np.mean(np.concatenate(found)[:, 0] == truth))
+            row['ivf'].append({'nprobe': nprobe, 'recall_at_1': round(recall, 4),
+                               'ms_per_query': round(1000 * ivf_s / len(q), 4)})
+        results.append(row)
+
+        print(f"\n[ANN] {n} identities, dim {dim}: train {train_s:.2f}s, "
+              f"exact {row['exact_ms_per_query']:.3f} ms/query")
+        for r in row['ivf']:
+            print(f"   nprobe={r['nprobe']:<4} recall@1={r['recall_at_1']:.3f}  "
+                  f"{r['ms_per_query']:.3f} ms/query")
+    return results
+
+
+# ==================== DETECTORS ====================
+def list_images(folder):
+    paths = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        paths.extend(os.path.join(root, f) for f in sorted(files)
+                     if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+    return sorted(paths)
+
+
+def bench_detectors(folder, backends, scales, repeat):
+    """ms/frame and recall per backend; every image is expected to contain a face."""
+    from core_recognition import create_detector
+
+    images = [img for img in (cv2.imread(p) for p in list_images(folder)) if img is not None]
+    if not images:
+        print(f"[WARN] No images under {folder}")
+        return []
+    results = []
+    for name in backends:
+        for scale in scales:
+            try:
+                detector = create_detector(name, scale=scale)
+            except Exception as e:
+                print(f"[SKIP] {name}: {e}")
+                break
+            detector.detect(images[0])      # warm-up
+            found = 0
+            start = time.perf_counter()
+            for _ in range(repeat):
+                found = sum(1 for img in images if detector.detect(img))
+            ms = 1000 * (time.perf_counter() - start) / (repeat * len(images))
+            row = {'backend': name, 'scale': scale, 'images': len(images),
+                   'ms_per_frame': round(ms, 2), 'recall': round(found / len(images), 3)}
+            results.append(row)
+            print(f"[DETECT] {name:<11} scale={scale:<4} {ms:8.2f} ms/frame  "
+                  f"recall={row['recall']:.3f} ({found}/{len(images)})")
+    return results
+
+
+# ==================== ATTENDANCE CSV ====================
+def _prefill_history(path, rows):
+    """``rows`` past attendance rows, 500 students a day, oldest first."""
+    start = datetime(2020, 1, 1)
+    with open(path, 'w') as f:
+        f.write('Name,Date,Time\n')
+        for i in range(rows):
+            day = (start + timedelta(days=i // 500)).strftime('%Y-%m-%d')
+            f.write(f"s{i % 500},{day},09:00:00\n")
+
+
+def _legacy_mark(path, name, date_str, time_str):
+    """The old markAttendance: read the whole CSV, check, rewrite it."""
+    import pandas as pd
+    df = pd.read_csv(path)
+    if not ((df['Name'] == name) & (df['Date'] == date_str)).any():
+        df = pd.concat([df, pd.DataFrame([{'Name': name, 'Date': date_str, 'Time': time_str}])],
+                       ignore_index=True)
+        df.to_csv(path, index=False)
+
+
+def bench_csv(sizes, marks, legacy_max):
+    from attendance import AttendanceLog
+
+    results = []
+    today = datetime.now()
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"history_{n}.csv")
+            _prefill_history(path, n)
+
+            start = time.perf_counter()
+            log = AttendanceLog(path)
+            log.mark('warmup', today)
+            open_s = time.perf_counter() - start
+            start = time.perf_counter()
+            for i in range(marks):
+                log.mark(f"new{i}", today)
+            log.close()
+            per_mark_us = 1e6 * (time.perf_counter() - start) / marks
+            row = {'history_rows': n, 'open_ms': round(1000 * open_s, 2),
+                   'append_us_per_mark': round(per_mark_us, 2)}
+
+            if n <= legacy_max:
+                _prefill_history(path, n)
+                legacy_marks = min(marks, 20)
+                start = time.perf_counter()
+                for i in range(legacy_marks):
+                    _legacy_mark(path, f"new{i}", today.strftime('%Y-%m-%d'), '09:00:00')
+                row['legacy_us_per_mark'] = round(1e6 * (time.perf_counter() - start) / legacy_marks, 2)
+            results.append(row)
+            legacy = f", legacy {row['legacy_us_per_mark']:.0f} us/mark" if 'legacy_us_per_mark' in row else ""
+            print(f"[CSV] history {n:>9} rows: open {row['open_ms']:.1f} ms, "
+                  f"append {per_mark_us:.1f} us/mark{legacy}")
+    return results
+
+
+# ==================== MODELS ====================
+def identity_photos(folder):
+    """``{person: [paths]}`` for a test set of one folder of photos per person."""
+    people = {}
+    for path in list_images(folder):
+        people.setdefault(os.path.basename(os.path.dirname(path)), []).append(path)
+    return {name: paths for name, paths in people.items() if len(paths) >= 2}
+
+
+def bench_models(folder, models, detector, batch):
+    """Embedding latency and accuracy of each model on the same local photos.
+
+    The first photo of each person is enrolled and the others are queries:
+    ``accuracy`` counts queries matched to the right person above the model's
+    threshold, ``false_accept`` those matched to someone else above it.
+    """
+    from core_recognition import create_detector, embed_faces, model_spec
+
+    if STUB_MODEL in models or detector == STUB_DETECTOR:
+        install_stubs()
+    people = identity_photos(folder)
+    if not people:
+        print(f"[WARN] {folder} needs a folder per person with 2+ photos each")
+        return []
+    det = create_detector(detector)
+    faces = []          # (person, is_enrollment, full-resolution BGR crop)
+    for name, paths in sorted(people.items()):
+        for i, path in enumerate(paths):
+            img = cv2.imread(path)
+            found = det.detect(img, scale=1.0) if img is not None else []
+            if found:
+                x, y, w, h, _ = max(found, key=lambda d: d[4])
+                faces.append((name, i == 0, img[y:y+h, x:x+w]))
+    print(f"[MODELS] {len(people)} people, {len(faces)} faces from {folder}")
+
+    results = []
+    for model in models:
+        try:
+            spec = model_spec(model)
+            crops = [cv2.resize(face, spec.input_size[::-1]) for _, _, face in faces]
+            embed_faces(crops[:1], model, batch)        # build + warm-up
+        except Exception as e:
+            print(f"[SKIP] {model}: {e}")
+            continue
+        start = time.perf_counter()
+        embs = embed_faces(crops, model, batch)
+        ms_per_face = 1000 * (time.perf_counter() - start) / len(crops)
+
+        gallery = Gallery()
+        for (name, enroll, _), emb in zip(faces, embs):
+            if enroll and emb is not None:
+                gallery.add(name, emb)
+        queries = [(name, emb) for (name, enroll, _), emb in zip(faces, embs) if not enroll and emb is not None]
+        top = gallery.match([e for _, e in queries]) if queries and len(gallery) else []
+        correct = wrong = 0
+        for (name, _), best in zip(queries, top):
+            if best and best[0].score > spec.threshold:
+                correct += best[0].name == name
+                wrong += best[0].name != name
+        n = max(1, len(queries))
+        row = {'model': model, 'onnx': bool(spec.path), 'input': list(spec.input_size),
+               'dim': int(gallery.matrix.shape[1]) if len(gallery) else spec.dim,
+               'threshold': spec.threshold, 'queries': len(queries),
+               'ms_per_face': round(ms_per_face, 3), 'accuracy': round(correct / n, 4),
+               'false_accept': round(wrong / n, 4)}
+        results.append(row)
+        print(f"[MODELS] {model:<14} {row['ms_per_face']:8.2f} ms/face  accuracy {row['accuracy']:.3f}  "
+              f"false accept {row['false_accept']:.3f}  (dim {row['dim']}, threshold {spec.threshold})")
+    return results
+
+
+# ==================== RECOGNITION SUITE ====================
+def bench_load(work, classes, per_class, samples=1):
+    """Seconds to build a recognizer over a synthetic gallery, with a cold then a warm cache."""
+    from setup_demo import generate_gallery
+
+    gallery_dir = os.path.join(work, f"gallery_{classes}x{per_class}x{samples}")
+    cache_dir = os.path.join(work, 'cache_load')
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    generate_gallery(gallery_dir, classes, per_class, samples=samples)
+    row = {'classes': classes, 'students': classes * per_class, 'photos': classes * per_class * samples}
+    for label in ('cold', 'warm'):
+        start = time.perf_counter()
+        recognizer = stub_recognizer(gallery_dir, cache_dir, lazy=False)
+        row[f'{label}_s'] = round(time.perf_counter() - start, 3)
+        row['loaded'] = len(recognizer.gallery)
+    print(f"[LOAD] {row['photos']} photos, {row['students']} students: cold {row['cold_s']:.2f}s, "
+          f"warm {row['warm_s']:.2f}s")
+    return [row]
+
+
+def _frame_accuracy(results, truth):
+    """Fraction of the true faces recognised as the right person."""
+    names = [r.name for r in results]
+    return sum(1 for t in truth if t['name'] in names) / len(truth) if truth else 1.0
+
+
+def bench_recognize(work, gallery_sizes, face_counts, frames, frames_dir=None):
+    """Per-frame recognize() latency vs faces per frame and identities in the searched class.
+
+    A class of real synthetic students is padded with random identities up to each
+    gallery size, so only matching cost grows with the gallery.
+    """
+    from setup_demo import generate_gallery, synthetic_frame
+
+    students = max(face_counts)
+    gallery_dir = os.path.join(work, f"recognize_{students}")
+    generate_gallery(gallery_dir, 1, students)
+    recognizer = stub_recognizer(gallery_dir, os.path.join(work, 'cache_recognize'), lazy=False)
+    class_name = recognizer.gallery.known_classes[0]
+    names = list(recognizer.gallery.shard(class_name).names)
+    dim = recognizer.gallery.shard(class_name).matrix.shape[1]
+
+    results = []
+    padded = len(names)
+    for size in sorted(gallery_sizes):
+        extra = size - padded
+        if extra > 0:
+            fillers = [f"filler{i}" for i in range(padded, size)]
+            vectors = synthetic_embeddings(extra, dim, seed=size)
+            recognizer.gallery.update_shard(
+                class_name, lambda g: g.add_many(fillers, vectors, [class_name] * extra))
+            padded = size
+        for faces in face_counts:
+            rng = random.Random(faces)
+            samples = [synthetic_frame(rng.sample(names, faces), seed=i) for i in range(frames)]
+            samples = [(cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR), boxes) for img, boxes in samples]
+            recognizer.recognize(samples[0][0], class_name)       # warm-up
+            ms, accuracy = [], []
+            for frame, truth in samples:
+                start = time.perf_counter()
+                found = recognizer.recognize(frame, class_name)
+                ms.append(1000 * (time.perf_counter() - start))
+                accuracy.append(_frame_accuracy(found, truth))
+            row = {'gallery': len(recognizer.gallery.shard(class_name)), 'faces': faces, 'frames': frames,
+                   **_percentiles(ms), 'accuracy': round(float(np.mean(accuracy)), 4)}
+            results.append(row)
+            print(f"[RECOGNIZE] gallery {row['gallery']:>7} faces {faces:>3}: p50 {row['p50_ms']:8.2f} ms  "
+                  f"p95 {row['p95_ms']:8.2f} ms  accuracy {row['accuracy']:.3f}")
+    if frames_dir:
+        results.append(bench_recorded(recognizer, frames_dir))
+    return results
+
+
+def bench_recorded(recognizer, frames_dir):
+    """Latency (and accuracy, if ``frames.json`` gives the truth) over recorded frames."""
+    truth = {}
+    truth_path = os.path.join(frames_dir, 'frames.json')
+    if os.path.isfile(truth_path):
+        with open(truth_path) as f:
+            truth = json.load(f)
+    ms, accuracy = [], []
+    for path in list_images(frames_dir):
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        start = time.perf_counter()
+        found = recognizer.recognize(frame)
+        ms.append(1000 * (time.perf_counter() - start))
+        key = os.path.relpath(path, frames_dir)
+        if key in truth:
+            accuracy.append(_frame_accuracy(found, truth[key]))
+    if not ms:
+        print(f"[WARN] No frames under {frames_dir}")
+        return {'recorded': frames_dir, 'frames': 0}
+    row = {'recorded': frames_dir, 'frames': len(ms), **_percentiles(ms)}
+    if accuracy:
+        row['accuracy'] = round(float(np.mean(accuracy)), 4)
+    print(f"[RECOGNIZE] recorded {frames_dir}: {len(ms)} frames, p50 {row['p50_ms']:.2f} ms  "
+          f"p95 {row['p95_ms']:.2f} ms")
+    return row
+
+
+def bench_match(sizes, dim, queries, batch, samples_per_identity):
+    """Gallery.match() queries/second, with one or several samples per identity."""
+    results = []
+    for n in sizes:
+        vectors = synthetic_embeddings(n, dim)
+        q, _ = noisy_queries(vectors, queries)
+        batches = [q[i:i + batch] for i in range(0, len(q), batch)]
+        for per_id in samples_per_identity:
+            gallery = Gallery(dim=dim, capacity=n)
+            if per_id == 1:
+                gallery.add_many([f"s{i}" for i in range(n)], vectors)
+            else:
+                noise = np.random.default_rng(per_id)
+                for i, vec in enumerate(vectors):
+                    for k in range(per_id):
+                        jitter = vec + 0.1 * noise.standard_normal(dim).astype(np.float32)
+                        gallery.add_sample(f"s{i}", jitter, sample_id=k)
+            gallery.match(batches[0])       # warm-up
+            seconds, _ = _timed(lambda: [gallery.match(b) for b in batches], 3)
+            row = {'identities': n, 'samples': per_id, 'dim': dim, 'batch': batch,
+                   'queries_per_s': round(len(q) / seconds, 1),
+                   'us_per_query': round(1e6 * seconds / len(q), 3)}
+            results.append(row)
+            print(f"[MATCH] {n:>7} identities x{per_id}: {row['queries_per_s']:10.0f} queries/s "
+                  f"({row['us_per_query']:.1f} us/query)")
+    return results
+
+
+def _gallery_worker(path, mode, queries):
+    """In a fresh process: memory added by mapping the published gallery (or copying it) and searching it."""
+    from metrics import memory_usage
+    from shared_gallery import attach
+    before = memory_usage()
+    gallery = attach(path)
+    if mode == 'private':       # what every worker loading its own gallery costs
+        for class_name, shard in list(gallery.shards.items()):
+            names, classes, matrix, samples = shard.arrays()
+            gallery.shards[class_name] = Gallery.from_arrays(names, classes, np.array(matrix), samples)
+    start = time.perf_counter()
+    gallery.match(queries)
+    seconds = time.perf_counter() - start
+    after = memory_usage()
+    return {k: after[k] - before[k] for k in after}, seconds
+
+
+def bench_shared(sizes, dim, workers, classes=8):
+    """Per-worker memory with a shared (memory-mapped) gallery vs a private copy, and update latency."""
+    import multiprocessing
+    from gallery import ShardedGallery
+    from metrics import memory_usage
+    from shared_gallery import GalleryPublisher, attach
+
+    if 'private' not in memory_usage():
+        print("[SHARED] needs /proc/self/smaps_rollup (Linux) to measure private memory")
+        return []
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            vectors = synthetic_embeddings(n, dim)
+            queries, _ = noisy_queries(vectors, 16)
+            sharded = ShardedGallery(lambda c, g: None)
+            for c in range(classes):
+                rows = range(c, n, classes)
+                sharded.shard(f"Class_{c}").add_many([f"s{i}" for i in rows], vectors[c::classes],
+                                                     [f"Class_{c}"] * len(rows))
+            publisher = GalleryPublisher(sharded, name=f"bench{n}", folder=tmp)
+            row = {'identities': n, 'dim': dim, 'workers': workers,
+                   'gallery_mb': round(vectors.nbytes / (1 << 20), 1)}
+            for mode in ('shared', 'private'):
+                # one task per fresh process, so nothing carries over between measurements
+                with context.Pool(workers, maxtasksperchild=1) as pool:
+                    out = pool.starmap(_gallery_worker, [(publisher.path, mode, queries)] * workers)
+                row[f'{mode}_mb_per_worker'] = round(max(d['private'] for d, _ in out), 1)
+                row[f'{mode}_rss_mb_per_worker'] = round(max(d['rss'] for d, _ in out), 1)
+
+            # an enrollment: republish one shard, then a worker picks it up
+            reader = attach(publisher.path)
+            start = time.perf_counter()
+            sharded.add("new student", vectors[0], "Class_0")
+            reader.refresh()
+            row['update_ms'] = round(1000 * (time.perf_counter() - start), 2)
+            row['update_seen'] = ("Class_0", "new student") in reader.shard("Class_0")
+            publisher.close()
+            results.append(row)
+            print(f"[SHARED] {n:>7} x {dim} ({row['gallery_mb']:7.1f} MB): private memory per worker "
+                  f"{row['shared_mb_per_worker']:6.1f} MB shared vs {row['private_mb_per_worker']:7.1f} MB "
+                  f"copied; enroll -> worker {row['update_ms']:.1f} ms")
+    return results
+
+
+def bench_motion(frames, faces, arrivals=0.2):
+    """Detection cost per frame with and without the motion gate on a mostly static classroom.
+
+    ``arrivals`` of the frames show a student walking in; the rest only sensor noise.
+    """
+    from motion import MotionGate
+    from pipeline import gated_detect
+    from setup_demo import draw_face, face_params, synthetic_frame
+    from core_recognition import create_detector
+
+    install_stubs()
+    detector = create_detector(STUB_DETECTOR)
+    img, _ = synthetic_frame([f"seated{i}" for i in range(faces)], seed=0)
+    base = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+    walker = cv2.cvtColor(np.asarray(draw_face(face_params('walker'), 100)), cv2.COLOR_RGB2BGR)
+    rng = np.random.default_rng(0)
+    clip, walking = [], int(frames * arrivals)
+    start_walk = (frames - walking) // 2
+    for i in range(frames):
+        frame = np.clip(base.astype(np.int16) + rng.integers(-6, 7, base.shape), 0, 255).astype(np.uint8)
+        if start_walk <= i < start_walk + walking:
+            y = max(0, base.shape[0] - 100 - 4 * (i - start_walk))
+            frame[y:y + 100, -110:-10] = walker
+        clip.append(frame)
+
+    results = []
+    for gated in (False, True):
+        gate = MotionGate() if gated else None
+        boxes, ms, gate_ms, found, pixels = [], [], [], 0, 0
+
+        def detect(frame, rois):
+            nonlocal pixels
+            pixels += sum(w * h for _, _, w, h in rois) if rois else frame.shape[0] * frame.shape[1]
+            return detector.detect(frame, rois)
+
+        for frame in clip:
+            start = time.perf_counter()
+            motion = gate.check(frame) if gate else None
+            gate_ms.append(1000 * (time.perf_counter() - start))
+            boxes = gated_detect(detect, frame, motion, None, boxes)
+            ms.append(1000 * (time.perf_counter() - start))
+            found += len(boxes)
+        # the stub detector is nearly free: with a real one the cost follows the pixels searched
+        row = {'gate': gated, 'frames': frames, 'faces': faces, **_percentiles(ms),
+               'gate_ms': round(float(np.mean(gate_ms)), 3) if gated else 0.0,
+               'detect_area_ratio': round(pixels / (frames * base.shape[0] * base.shape[1]), 4),
+               'boxes_per_frame': round(found / frames, 2)}
+        if gate:
+            row.update(skip_ratio=gate.stats()['skip_ratio'], region_ratio=gate.stats()['region_ratio'])
+        results.append(row)
+        print(f"[MOTION] gate {'on ' if gated else 'off'}: {row['detect_area_ratio']:.1%} of the pixels "
+              f"searched, gate {row['gate_ms']:.3f} ms/frame, boxes/frame {row['boxes_per_frame']:.2f}"
+              + (f", skipped {row['skip_ratio']:.0%}, regions {row['region_ratio']:.0%}" if gated else ""))
+    return results
+
+
+def _prefill_db(path, rows, students=500):
+    """A database with ``students`` enrolled and ``rows`` past attendance rows."""
+    from database import init_db
+    init_db(path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("INSERT INTO classes (name) VALUES ('Bench')")
+        conn.executemany("INSERT INTO students (name, class_id) VALUES (?, 1)",
+                         [(f"s{i}",) for i in range(students)])
+        start = datetime(2020, 1, 1)
+        conn.executemany("INSERT INTO attendance (student_id, date, time) VALUES (?, ?, '09:00:00')",
+                         ((i % students + 1, (start + timedelta(days=i // students)).strftime('%Y-%m-%d'))
+                          for i in range(rows)))
+    conn.close()
+
+
+def bench_db(sizes, marks, students=500):
+    """AttendanceWriter cost per mark (enqueue to commit) vs rows already in the attendance table."""
+    from database import AttendanceWriter
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"history_{n}.db")
+            _prefill_db(path, n, students)
+            writer = AttendanceWriter(path, batch_interval=0.01)    # time the writes, not the wait
+            today = datetime.now()
+            start = time.perf_counter()
+            for i in range(marks):
+                # half new students, half repeats the unique index turns away
+                writer.mark(f"s{(i // 2) % students}", 'Bench', today)
+            writer.close(timeout=60)
+            per_mark_us = 1e6 * (time.perf_counter() - start) / marks
+            row = {'history_rows': n, 'marks': marks, 'us_per_mark': round(per_mark_us, 2),
+                   'inserted': writer.stats['inserted'], 'batches': writer.stats['batches']}
+            results.append(row)
+            print(f"[DB] history {n:>9} rows: {per_mark_us:8.1f} us/mark "
+                  f"({row['inserted']} inserted in {row['batches']} batches)")
+    return results
+
+
+def bench_reports(sizes, students=500, repeat=5):
+    """Per-student and per-class rates over the whole history: summary tables vs an ad-hoc scan."""
+    import reports
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"reports_{n}.db")
+            _prefill_db(path, n, students)
+            conn = sqlite3.connect(path)
+            first, last = conn.execute("SELECT MIN(date), MAX(date) FROM attendance").fetchone()
+            start = f"{first[:7]}-15"           # all of it, with partial months at both ends
+            raw_sql = '''SELECT s.id, COUNT(a.id) FROM students s
+                          LEFT JOIN attendance a ON a.student_id = s.id AND a.date BETWEEN ? AND ?
+                          GROUP BY s.id'''
+            raw_s, _ = _timed(lambda: conn.execute(raw_sql, (start, last)).fetchall(), repeat)
+            conn.close()
+            students_s, _ = _timed(lambda: reports.student_rates(start, last, path=path), repeat)
+            classes_s, _ = _timed(lambda: reports.class_rates(start, last, path=path), repeat)
+            row = {'history_rows': n, 'student_rates_ms': round(students_s * 1000, 2),
+                   'class_rates_ms': round(classes_s * 1000, 2), 'raw_scan_ms': round(raw_s * 1000, 2)}
+            results.append(row)
+            print(f"[REPORTS] history {n:>9} rows: students {row['student_rates_ms']:7.2f} ms, "
+                  f"classes {row['class_rates_ms']:7.2f} ms (raw scan {row['raw_scan_ms']:7.2f} ms)")
+    return results
+
+
+def run_suite(args):
+    work = args.work or tempfile.mkdtemp(prefix='attendance_bench_')
+    try:
+        return {
+            'load': bench_load(work, args.classes, args.per_class, args.samples),
+            'recognize': bench_recognize(work, args.gallery_sizes, args.faces, args.frames,
+                                         args.recorded),
+            'motion': bench_motion(args.motion_frames, 8),
+            'match': bench_match(args.match_sizes, 128, args.queries, 16, [1, 3]),
+            'db': bench_db(args.history, args.marks),
+            'reports': bench_reports(args.history),
+            'csv': bench_csv(args.history, args.marks, legacy_max=0),
+        }
+    finally:
+        if not args.work:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+# ==================== REPORTS ====================
+def run_meta():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit or None, 'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'argv': sys.argv[1:]}
+
+
+def write_json(path, bench, results):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'meta': run_meta(), 'bench': bench, 'results': results}, f, indent=1)
+    print(f"[BENCH] Results written to {path}")
+
+
+# fields where smaller is better; anything else numeric is "bigger is better" or a parameter
+_COST_FIELDS = ('_ms', '_s', '_us', 'us_per_', 'ms_per_')
+_RATE_FIELDS = ('per_s', 'accuracy', 'recall')
+
+
+def _rows(results, prefix=''):
+    """Flatten nested results into ``{row label: row}``; a row is labelled by its parameters."""
+    if isinstance(results, dict) and not any(isinstance(v, (list, dict)) for v in results.values()):
+        params = [f"{k}={v}" for k, v in results.items()
+                  if not any(k.endswith(t) or t in k for t in _COST_FIELDS + _RATE_FIELDS)]
+        return {f"{prefix} {' '.join(params)}".strip(): results}
+    rows = {}
+    items = results.items() if isinstance(results, dict) else enumerate(results)
+    for k, v in items:
+        if isinstance(v, (list, dict)):
+            rows.update(_rows(v, (f"{prefix}.{k}" if prefix else k) if isinstance(k, str) else prefix))
+    return rows
+
+
+def compare(old_path, new_path, tolerance=0.10):
+    """Print new/old ratios for every timing and rate; flags regressions past ``tolerance``."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"[COMPARE] {old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    old_rows, regressions = _rows(old['results']), 0
+    for label, row in _rows(new['results']).items():
+        before = old_rows.get(label)
+        if before is None:
+            continue
+        for field, value in row.items():
+            prev = before.get(field)
+            if not isinstance(value, (int, float)) or not isinstance(prev, (int, float)) or not prev:
+                continue
+            cost = any(t in field for t in _COST_FIELDS)
+            rate = any(t in field for t in _RATE_FIELDS)
+            if not (cost or rate):
+                continue
+            ratio = value / prev
+            worse = ratio > 1 + tolerance if cost else ratio < 1 - tolerance
+            regressions += worse
+            print(f"{'!' if worse else ' '} {label:<50} {field:<20} {prev:>12g} -> {value:<12g} x{ratio:.2f}")
+    print(f"[COMPARE] {regressions} regression(s) beyond {tolerance:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Attendance benchmarks")
+    parser.add_argument('--json', default=None, help="also write the results to this JSON file")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    ann = sub.add_parser('ann', help="IVF recall/latency vs exact search")
+    ann.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    ann.add_argument('--dim', type=int, default=512)
+    ann.add_argument('--queries', type=int, default=512)
+    ann.add_argument('--batch', type=int, default=32, help="faces per frame")
+    ann.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64])
+
+    det = sub.add_parser('detectors', help="face detector ms/frame and recall on local images")
+    det.add_argument('--images', default='ImagesAttendance')
+    det.add_argument('--backends', nargs='+', default=['mtcnn', 'yunet', 'opencv-dnn', 'haar'])
+    det.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.5])
+    det.add_argument('--repeat', type=int, default=3)
+
+    csvp = sub.add_parser('csv', help="attendance mark cost vs CSV history size")
+    csvp.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000, 3000000])
+    csvp.add_argument('--marks', type=int, default=2000)
+    csvp.add_argument('--legacy-max', type=int, default=100000,
+                      help="largest history to also time the old read/rewrite approach on")
+
+    mod = sub.add_parser('models', help="embedding latency vs accuracy per recognition model")
+    mod.add_argument('--images', default='bench_data/ImagesAttendance',
+                     help="a folder per person with 2+ photos (setup_demo.py --synthetic --samples 3)")
+    mod.add_argument('--models', nargs='+', default=['VGG-Face', 'Facenet', 'ArcFace', 'SFace',
+                                                     'Facenet-int8', 'ArcFace-int8'])
+    mod.add_argument('--detector', default='mtcnn')
+    mod.add_argument('--batch', type=int, default=32)
+
+    suite = sub.add_parser('suite', help="offline recognition + attendance suite on synthetic faces")
+    suite.add_argument('--classes', type=int, default=4, help="gallery load: class folders")
+    suite.add_argument('--per-class', type=int, default=50, help="gallery load: students per class")
+    suite.add_argument('--samples', type=int, default=1, help="gallery load: photos per student")
+    suite.add_argument('--gallery-sizes', type=int, nargs='+', default=[50, 1000, 10000])
+    suite.add_argument('--faces', type=int, nargs='+', default=[1, 4, 16])
+    suite.add_argument('--frames', type=int, default=20, help="frames per recognize measurement")
+    suite.add_argument('--recorded', default=None, help="folder of recorded frames (+ frames.json)")
+    suite.add_argument('--motion-frames', type=int, default=300)
+    suite.add_argument('--match-sizes', type=int, nargs='+', default=[1000, 10000])
+    suite.add_argument('--queries', type=int, default=1024)
+    suite.add_argument('--history', type=int, nargs='+', default=[10000, 1000000])
+    suite.add_argument('--marks', type=int, default=2000)
+    suite.add_argument('--work', default=None, help="keep generated data here (default: temp dir)")
+
+    shared = sub.add_parser('shared', help="per-worker memory: shared gallery vs a private copy")
+    shared.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    shared.add_argument('--dim', type=int, default=512)
+    shared.add_argument('--workers', type=int, default=2)
+
+    cmp = sub.add_parser('compare', help="compare two --json result files")
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+    cmp.add_argument('--tolerance', type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.bench == 'compare':
+        sys.exit(1 if compare(args.old, args.new, args.tolerance) else 0)
+    if args.bench == 'ann':
+        results = bench_ann(args.sizes, args.dim, args.queries, args.batch, args.nprobe)
+    elif args.bench == 'detectors':
+        results = bench_detectors(args.images, args.backends, args.scales, args.repeat)
+    elif args.bench == 'csv':
+        results = bench_csv(args.sizes, args.marks, args.legacy_max)
+    elif args.bench == 'models':
+        results = bench_models(args.images, args.models, args.detector, args.batch)
+    elif args.bench == 'shared':
+        results = bench_shared(args.sizes, args.dim, args.workers)
+    elif args.bench == 'suite':
+        results = run_suite(args)
+    if args.json:
+        write_json(args.json, args.bench, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,735 @@
 # core_recognition.py
 import cv2
 import os
-from deepface import DeepFace
-from mtcnn import MTCNN
-from scipy.spatial.distance import cosine
+import itertools
+import re
+import threading
+import time
+import numpy as np
+from collections import namedtuple
+from datetime import datetime
+
+from database import add_student
+from embedding_store import EmbeddingStore
+from gallery import ShardedGallery
+from metrics import metrics
+
+# ==================== MODEL REGISTRY ====================
+_models = {}    # key -> model, built once per process and shared by every recognizer
+_models_lock = threading.Lock()
+
+def shared_model(key, build):
+    """The process-wide model for ``key``, built by ``build()`` on first use."""
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                start = time.perf_counter()
+                model = _models[key] = build()
+                print(f"[INFO] Built {key} in {time.perf_counter() - start:.1f}s")
+    return model
+
+# ==================== RECOGNITION MODELS ====================
+# input_size is (height, width); threshold is the cosine similarity above which a
+# match is accepted.  Thresholds start from DeepFace's published cosine distances
+# (similarity = 1 - distance) and should be re-checked with ``benchmark.py models``
+# on the school's own photos.  Entries with a ``path`` run through ONNX Runtime
+# (see export_onnx.py); the others are built by DeepFace.
+ModelSpec = namedtuple('ModelSpec', ['input_size', 'normalization', 'dim', 'threshold', 'path'])
+
+MODELS = {
+    'VGG-Face':     ModelSpec((224, 224), 'base', 4096, 0.45, None),
+    'Facenet':      ModelSpec((160, 160), 'Facenet', 128, 0.60, None),
+    'Facenet512':   ModelSpec((160, 160), 'Facenet', 512, 0.70, None),
+    'ArcFace':      ModelSpec((112, 112), 'ArcFace', 512, 0.32, None),
+    'SFace':        ModelSpec((112, 112), 'base', 128, 0.41, None),
+    'GhostFaceNet': ModelSpec((112, 112), 'base', 512, 0.35, None),
+    'OpenFace':     ModelSpec((96, 96), 'base', 128, 0.90, None),
+    # int8 ONNX exports of the light backbones: python export_onnx.py Facenet --int8
+    'Facenet-int8': ModelSpec((160, 160), 'Facenet', 128, 0.60, 'models/Facenet-int8.onnx'),
+    'ArcFace-int8': ModelSpec((112, 112), 'ArcFace', 512, 0.32, 'models/ArcFace-int8.onnx'),
+}
+
+def register_model(model_name, input_size, normalization='base', dim=None, threshold=0.45, path=None):
+    MODELS[model_name] = ModelSpec(tuple(input_size), normalization, dim, threshold, path)
+
+def model_spec(model_name):
+    if model_name not in MODELS:
+        raise ValueError(f"Unknown model '{model_name}'; choose from {sorted(MODELS)}")
+    return MODELS[model_name]
+
+def register_embedding_net(model_name, net):
+    """Use ``net`` for ``model_name``: anything with ``input_shape`` and ``net(batch, training=False)``."""
+    _models[('embed', model_name)] = net
+
+def normalize_faces(batch, normalization='base'):
+    """RGB float batch in [0, 1] -> the input range a backbone was trained on (as DeepFace)."""
+    if normalization == 'base':
+        return batch
+    batch = batch * 255.0
+    if normalization == 'raw':
+        return batch
+    if normalization == 'Facenet':
+        mean = batch.mean(axis=(1, 2, 3), keepdims=True)
+        std = batch.std(axis=(1, 2, 3), keepdims=True)
+        return (batch - mean) / np.maximum(std, 1e-6)
+    if normalization == 'Facenet2018':
+        return batch / 127.5 - 1.0
+    if normalization == 'ArcFace':
+        return (batch - 127.5) / 128.0
+    raise ValueError(f"Unknown normalization '{normalization}'")
+
+
+class OnnxEmbeddingNet:
+    """An ONNX Runtime session behind the Keras call signature ``embed_faces`` uses."""
+
+    def __init__(self, path, threads=None):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"ONNX model not found: {path} (create it with export_onnx.py)")
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.channels_first = inp.shape[1] == 3
+        size = inp.shape[2:4] if self.channels_first else inp.shape[1:3]
+        self.input_shape = (None, *size, 3)
+
+    def __call__(self, batch, training=False):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        if self.channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+# ==================== EMBEDDING ====================
+def _build_embedding_net(model_name):
+    spec = MODELS.get(model_name)
+    if spec is not None and spec.path:
+        return OnnxEmbeddingNet(spec.path)
+    from deepface import DeepFace       # TensorFlow: imported on first use, not at startup
+    model = DeepFace.build_model(model_name)
+    return getattr(model, 'model', model)   # newer DeepFace wraps the Keras model
+
+def _embedding_net(model_name):
+    return shared_model(('embed', model_name), lambda: _build_embedding_net(model_name))
+
+def _embed_one(face, model_name):
+    try:
+        from deepface import DeepFace
+        spec = MODELS.get(model_name)
+        return DeepFace.represent(face, model_name=model_name, enforce_detection=False,
+                                  detector_backend='skip',
+                                  normalization=spec.normalization if spec else 'base')[0]['embedding']
+    except Exception:
+        return None
+
+def embed_faces(faces, model_name='VGG-Face', max_batch=32):
+    """Embed face crops with one forward pass per ``max_batch`` crops.
+
+    Crops follow DeepFace's array convention (BGR) and are resized to the
+    model's input size and normalised as in its registry entry.  Returns one
+    embedding per crop in input order; a crop that could not be embedded
+    gives None.
+    """
+    spec = MODELS.get(model_name)
+    out = []
+    for i in range(0, len(faces), max_batch):
+        chunk = faces[i:i + max_batch]
+        try:
+            net = _embedding_net(model_name)
+            h, w = spec.input_size if spec else net.input_shape[1:3]
+            with metrics.span('embed.preprocess'):
+                batch = np.stack([f if f.shape[:2] == (h, w) else cv2.resize(f, (w, h))
+                                  for f in chunk]).astype(np.float32)
+                batch = batch[..., ::-1] / 255.0    # as DeepFace.represent: BGR -> RGB, [0, 1]
+                batch = normalize_faces(batch, spec.normalization if spec else 'base')
+            with metrics.span('embed.model'):
+                out.extend(np.asarray(net(batch, training=False)))
+            metrics.incr('embed.faces', len(chunk))
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            # models without a batched Keras graph: fall back to one call per crop
+            print(f"[WARN] Batched embedding failed ({e}); embedding one by one.")
+            out.extend(_embed_one(f, model_name) for f in chunk)
+    return out
+
+# ==================== ENROLLMENT PHOTOS ====================
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg')
+
+def check_folder_name(value, what='name'):
+    """``value`` if it can name a folder or photo directly under the gallery, else ValueError.
+
+    Names reach the file system as ``db_path/<class>/<name>.jpg``: no path
+    separators, no ``..`` and no leading dot (hidden files).
+    """
+    if (not isinstance(value, str) or not value.strip() or value.startswith('.')
+            or '..' in value or any(c in value for c in '/\\\0')):
+        raise ValueError(f"Invalid {what}: {value!r}")
+    return value
+
+def class_photos(db_path, class_folder):
+    """``(key, path, name)`` for ``<class>/<name>.jpg`` and every photo in ``<class>/<name>/``."""
+    class_path = os.path.join(db_path, class_folder)
+    entries = sorted(os.listdir(class_path)) if os.path.isdir(class_path) else []
+    for entry in entries:
+        path = os.path.join(class_path, entry)
+        if entry.startswith('.'):
+            continue
+        if os.path.isdir(path):
+            for img_file in sorted(os.listdir(path)):
+                if img_file.lower().endswith(IMAGE_EXTS):
+                    yield f"{class_folder}/{entry}/{img_file}", os.path.join(path, img_file), entry
+        elif entry.lower().endswith(IMAGE_EXTS):
+            yield f"{class_folder}/{entry}", path, os.path.splitext(entry)[0]
+
+def enrollment_photos(db_path):
+    """``(key, path, name, class_name)`` of every enrollment photo under ``db_path``.
+
+    Folders are classes laid out as class_photos() reads them; photos lying
+    directly in ``db_path`` are students without a class (``class_name`` None).
+    """
+    entries = sorted(os.listdir(db_path)) if os.path.isdir(db_path) else []
+    for entry in entries:
+        path = os.path.join(db_path, entry)
+        if entry.startswith('.'):
+            continue
+        if os.path.isdir(path):
+            for key, photo, name in class_photos(db_path, entry):
+                yield key, photo, name, entry
+        elif entry.lower().endswith(IMAGE_EXTS):
+            yield entry, path, os.path.splitext(entry)[0], None
+
+
+# ==================== DETECTORS ====================
+def clip_box(box, shape):
+    x, y, w, h = box[:4]
+    H, W = shape[:2]
+    x2, y2 = min(x + w, W), min(y + h, H)
+    x, y = max(0, x), max(0, y)
+    return (x, y, x2 - x, y2 - y)
+
+def expand_box(box, shape, margin=0.5):
+    """Box grown by ``margin`` of its size on every side, clipped to the frame."""
+    x, y, w, h = box[:4]
+    dx, dy = int(w * margin), int(h * margin)
+    return clip_box((x - dx, y - dy, w + 2 * dx, h + 2 * dy), shape)
+
+def face_quality(face, confidence=1.0, min_size=80):
+    """0..1 quality of a BGR face crop: sharpness, frontal pose, size and detector confidence."""
+    h, w = face.shape[:2]
+    if h < 8 or w < 8:
+        return 0.0
+    gray = cv2.resize(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), (112, 112)).astype(np.float32)
+    sharpness = min(1.0, cv2.Laplacian(gray, cv2.CV_32F).var() / 200.0)
+    # a frontal face is close to its own mirror image
+    gray -= gray.mean()
+    mirror = gray[:, ::-1]
+    denom = float(np.sqrt((gray * gray).sum() * (mirror * mirror).sum()))
+    pose = max(0.0, float((gray * mirror).sum()) / denom) if denom else 0.0
+    size = min(1.0, min(h, w) / float(min_size))
+    conf = min(1.0, max(0.0, float(confidence)))
+    return float((sharpness * pose * size * conf) ** 0.25)
+
+def nms(detections, iou_threshold=0.4):
+    """Drop overlapping ``(x, y, w, h, conf)`` detections, keeping the most confident."""
+    from tracking import iou
+    kept = []
+    for d in sorted(detections, key=lambda d: -d[4]):
+        if all(iou(d[:4], k[:4]) < iou_threshold for k in kept):
+            kept.append(d)
+    return kept
+
+
+class FaceDetector:
+    """Base class: backends implement ``_detect(bgr) -> [(x, y, w, h, conf), ...]``.
+
+    ``scale`` < 1 runs the backend on a downscaled copy and maps boxes back to
+    full resolution; ``rois`` restricts detection to regions (e.g. around
+    existing tracks).
+    """
+    name = None
+
+    def __init__(self, scale=1.0, min_confidence=0.9):
+        self.scale = scale
+        self.min_confidence = min_confidence
+
+    def detect(self, frame, rois=None, scale=None):
+        """``(x, y, w, h, conf)`` boxes in full-resolution coordinates of a BGR frame."""
+        if rois is None:
+            return self._detect_region(frame, (0, 0), scale)
+        found = []
+        for roi in rois:
+            x, y, w, h = expand_box(roi, frame.shape)
+            if w > 0 and h > 0:
+                found.extend(self._detect_region(frame[y:y+h, x:x+w], (x, y), scale))
+        return nms(found)
+
+    def _detect_region(self, img, offset, scale):
+        scale = self.scale if scale is None else scale
+        small = img
+        if scale < 1.0:
+            with metrics.span('detect.resize'):
+                small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        with metrics.span(f'detect.{self.name}'):
+            raw = self._detect(small)
+        out = []
+        for (x, y, w, h, conf) in raw:
+            if conf < self.min_confidence:
+                continue
+            box = clip_box((int(x / scale), int(y / scale), int(w / scale), int(h / scale)), img.shape)
+            if box[2] > 0 and box[3] > 0:
+                out.append((box[0] + offset[0], box[1] + offset[1], box[2], box[3], conf))
+        return out
+
+    def _detect(self, bgr):
+        raise NotImplementedError
+
+
+def _build_mtcnn():
+    from mtcnn import MTCNN
+    return MTCNN()
+
+
+class MTCNNDetector(FaceDetector):
+    name = 'mtcnn'
+
+    def __init__(self, scale=1.0, min_confidence=0.9):
+        super().__init__(scale, min_confidence)
+        self.net = shared_model(('detect', 'mtcnn'), _build_mtcnn)
+
+    def _detect(self, bgr):
+        with metrics.span('color'):
+            rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        return [(*d['box'], d['confidence']) for d in self.net.detect_faces(rgb)]
+
+
+class YuNetDetector(FaceDetector):
+    name = 'yunet'
+
+    def __init__(self, scale=1.0, min_confidence=0.8,
+                 model_path='models/face_detection_yunet_2023mar.onnx'):
+        super().__init__(scale, min_confidence)
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"YuNet model not found: {model_path} (download it from the OpenCV Zoo)")
+        self.net = cv2.FaceDetectorYN.create(model_path, "", (320, 320), min_confidence)
+
+    def _detect(self, bgr):
+        h, w = bgr.shape[:2]
+        self.net.setInputSize((w, h))
+        _, faces = self.net.detect(bgr)
+        if faces is None:
+            return []
+        return [(int(f[0]), int(f[1]), int(f[2]), int(f[3]), float(f[14])) for f in faces]
+
+
+class OpenCVDNNDetector(FaceDetector):
+    """ResNet-10 SSD face detector from the OpenCV samples."""
+    name = 'opencv-dnn'
+
+    def __init__(self, scale=1.0, min_confidence=0.6, prototxt='models/deploy.prototxt',
+                 model_path='models/res10_300x300_ssd_iter_140000.caffemodel'):
+        super().__init__(scale, min_confidence)
+        for p in (prototxt, model_path):
+            if not os.path.isfile(p):
+                raise FileNotFoundError(f"OpenCV DNN model file not found: {p}")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model_path)
+
+    def _detect(self, bgr):
+        h, w = bgr.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(bgr, (300, 300)), 1.0, (300, 300), (104, 177, 123))
+        self.net.setInput(blob)
+        out = self.net.forward()[0, 0]
+        boxes = []
+        for d in out:
+            x1, y1, x2, y2 = d[3] * w, d[4] * h, d[5] * w, d[6] * h
+            boxes.append((int(x1), int(y1), int(x2 - x1), int(y2 - y1), float(d[2])))
+        return boxes
+
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade (what DeepFace calls the 'opencv' backend); no real scores."""
+    name = 'haar'
+
+    def __init__(self, scale=1.0, min_confidence=0.0, min_size=24):
+        super().__init__(scale, min_confidence)
+        self.min_size = min_size
+        self.net = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    def _detect(self, bgr):
+        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        faces = self.net.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                          minSize=(self.min_size, self.min_size))
+        return [(int(x), int(y), int(w), int(h), 1.0) for (x, y, w, h) in faces]
+
+
+DETECTORS = {
+    'mtcnn': MTCNNDetector,
+    'yunet': YuNetDetector,
+    'opencv-dnn': OpenCVDNNDetector,
+    'haar': HaarDetector,
+    'opencv': HaarDetector,
+}
+
+def create_detector(name='mtcnn', **kwargs):
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector '{name}'; choose from {sorted(DETECTORS)}")
+    return DETECTORS[name](**kwargs)
+
+
+Recognition = namedtuple('Recognition', ['x', 'y', 'w', 'h', 'name', 'score', 'class_name'])
 
 class FaceRecognizer:
-    def __init__(self, db_path="ImagesAttendance", model='VGG-Face'):
+    def __init__(self, db_path="ImagesAttendance", model='VGG-Face', cache_dir=None, threshold=None,
+                 index=None, lazy=True, max_batch=32, detector='mtcnn', detect_scale=1.0,
+                 auto_capture=True, capture_score=0.75, capture_margin=0.1, capture_quality=0.6,
+                 live_samples=3, capture_interval=60.0, gallery=None):
         self.model = model
+        self.spec = model_spec(model)
+        self.face_size = self.spec.input_size[::-1]    # (w, h) for cv2.resize
         self.db_path = db_path
-        self.detector = MTCNN()
-        self.known_encodings = {}
-        self.load_known_faces()
+        self.threshold = self.spec.threshold if threshold is None else threshold
+        self.max_batch = max_batch
+        # confident live sightings become extra (in-memory) samples of that student
+        self.auto_capture = auto_capture and gallery is None
+        self.capture_score = capture_score
+        self.capture_margin = capture_margin
+        self.capture_quality = capture_quality
+        self.live_samples = live_samples
+        self.capture_interval = capture_interval
+        self._live = {}             # (class_name, name) -> [(time, sample_id, quality)]
+        self._live_ids = itertools.count(1)
+        self._live_lock = threading.Lock()
+        self.detector = create_detector(detector, scale=detect_scale)
+        self._store_lock = threading.RLock()
+        if gallery is not None:
+            # search a gallery built elsewhere (shared_gallery.attach() in a worker
+            # process): enrollment and live samples belong to whoever built it
+            self.gallery, self.store = gallery, None
+            return
+        # one shard per class folder; index='ivf' for very large classes
+        self.gallery = ShardedGallery(self._load_class, index=index)
+        # the cache file is keyed by model and preprocessing, so galleries never mix models
+        self.store = EmbeddingStore(cache_dir or os.path.join(db_path, '.embeddings'), model,
+                                    {'detector': self.detector.name,
+                                     'min_confidence': self.detector.min_confidence,
+                                     'face_size': list(self.spec.input_size),
+                                     'normalization': self.spec.normalization, 'embed': 'batch'})
+        self.load_known_faces(lazy)
 
-    def load_known_faces(self):
+    def load_known_faces(self, lazy=False):
+        """Register class folders; shards are embedded now or on first search."""
         if not os.path.isdir(self.db_path):
             print(f"[WARN] No folder: {self.db_path}")
             return
-        loaded = 0
-        for class_folder in os.listdir(self.db_path):
+        for class_folder in sorted(os.listdir(self.db_path)):
             class_path = os.path.join(self.db_path, class_folder)
-            if not os.path.isdir(class_path):
+            if class_folder.startswith('.') or not os.path.isdir(class_path):
                 continue
-            for img_file in os.listdir(class_path):
-                if img_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    path = os.path.join(class_path, img_file)
-                    name = os.path.splitext(img_file)[0]
-                    img = cv2.imread(path)
-                    if img is None:
-                        continue
-                    h, w = img.shape[:2]
-                    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                    try:
-                        detections = self.detector.detect_faces(rgb)
-                        if not detections or detections[0]['confidence'] < 0.9:
-                            continue
-                        x, y, fw, fh = detections[0]['box']
-                        x, y = max(0, x), max(0, y)
-                        fw, fh = min(fw, w - x), min(fh, h - y)
-                        if fw <= 0 or fh <= 0:
-                            continue
-                        face = img[y:y+fh, x:x+fw]
-                        face = cv2.resize(face, (224, 224))
-                        emb = DeepFace.represent(face, model_name=self.model,
-                                                enforce_detection=False, detector_backend='skip')[0]['embedding']
-                        self.known_encodings[name] = emb
-                        loaded += 1
-                    except Exception as e:
-                        print(f"[ERROR] {name}: {e}")
-        print(f"[INFO] Loaded {loaded} known students.")
-
-    def recognize(self, frame):
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        detections = self.detector.detect_faces(rgb)
-        results = []
-        h, w = frame.shape[:2]
-        for d in detections:
-            if d['confidence'] < 0.9:
+            self.gallery.register(class_folder)
+        if not lazy:
+            self.gallery.load_all()
+        print(f"[INFO] Found {len(self.gallery.known_classes)} classes "
+              f"({len(self.gallery.shards)} loaded).")
+
+    def _load_class(self, class_folder, gallery):
+        if not os.path.isdir(os.path.join(self.db_path, class_folder)):
+            return False            # no such class: nothing to load or register
+        with self._store_lock:
+            self._load_class_locked(class_folder, gallery)
+
+    def _load_class_locked(self, class_folder, gallery):
+        class_path = os.path.join(self.db_path, class_folder)
+        loaded = 0
+        seen, misses = [], []
+        for key, path, name in self._class_photos(class_folder):
+            seen.append(key)
+            hit, emb = self.store.lookup(key, path)
+            if not hit:
+                misses.append((key, path, name))
+            elif emb is not None:
+                gallery.add_sample(name, emb, class_folder, self.store.quality(key), key)
+                loaded += 1
+
+        # new or changed photos: crop each, then embed them in batches
+        crops = []
+        for key, path, name in misses:
+            try:
+                found = self._enrollment_crop(path)
+            except Exception as e:
+                print(f"[ERROR] {name}: {e}")
                 continue
-            x, y, fw, fh = d['box']
-            x, y = max(0, x), max(0, y)
-            fw, fh = min(fw, w - x), min(fh, h - y)
-            if fw <= 0 or fh <= 0:
+            if found is None:
+                self.store.put(key, path, None)
+            else:
+                crops.append((key, path, name, *found))
+        embeddings = self.embed_batch([face for _, _, _, face, _ in crops])
+        for (key, path, name, _, quality), emb in zip(crops, embeddings):
+            if emb is None:
+                print(f"[ERROR] {name}: embedding failed")
                 continue
-            face = rgb[y:y+fh, x:x+fw]
-            face = cv2.resize(face, (224, 224))
-            try:
-                emb = DeepFace.represent(face, model_name=self.model,
-                                        enforce_detection=False, detector_backend='skip')[0]['embedding']
-                best_name, best_sim = "Unknown", 0.0
-                for name, known in self.known_encodings.items():
-                    sim = 1 - cosine(emb, known)
-                    if sim > best_sim:
-                        best_sim, best_name = sim, name
-                if best_sim > 0.45:
-                    results.append((x, y, fw, fh, best_name, best_sim))
-                else:
-                    results.append((x, y, fw, fh, "Unknown", best_sim))
-            except:
-                results.append((x, y, fw, fh, "Error", 0.0))
-        return results
\ No newline at end of file
+            self.store.put(key, path, emb, quality)
+            gallery.add_sample(name, emb, class_folder, quality, key)
+            loaded += 1
+        self.store.prune(seen, prefix=f"{class_folder}/")
+        self.store.save()
+        self._restore_index(class_folder, gallery)
+        print(f"[INFO] {class_folder}: loaded {loaded} photos of {len(gallery)} students "
+              f"({len(crops)} embedded).")
+
+    def _restore_index(self, class_folder, gallery):
+        """Load the shard's ANN index saved next to the embedding cache, or train and save one."""
+        index = gallery.index
+        if index is None or len(gallery) < index.min_size:
+            return
+        safe_class = re.sub(r'[^A-Za-z0-9_.-]', '_', class_folder)
+        path = f"{os.path.splitext(self.store.path)[0]}.{safe_class}.ivf.npz"
+        keys = gallery.keys()
+        if index.load(path, keys, gallery.matrix) and not index.needs_training(len(gallery)):
+            return
+        gallery.build_index(force=True)
+        index.save(path, keys)
+        print(f"[INFO] {class_folder}: trained ANN index with {len(index.centroids)} cells.")
+
+    def _class_photos(self, class_folder):
+        return class_photos(self.db_path, class_folder)
+
+    def _enrollment_crop(self, path):
+        """``(crop, quality)`` of the main face of an enrollment photo; None if there is no usable face."""
+        img = cv2.imread(path)
+        if img is None:
+            return None
+        return self._main_face(img)
+
+    def _main_face(self, img):
+        # enrollment photos are detected at full resolution
+        detections = self.detector.detect(img, scale=1.0)
+        if not detections:
+            return None
+        x, y, fw, fh, conf = max(detections, key=lambda d: d[4])
+        face = img[y:y+fh, x:x+fw]
+        return cv2.resize(face, self.face_size), face_quality(face, conf)
+
+    def embed_batch(self, faces, max_batch=None):
+        return embed_faces(faces, self.model, max_batch or self.max_batch)
+
+    @property
+    def known_classes(self):
+        return list(self.gallery.known_classes)
+
+    def preload(self, class_name=None):
+        """Load one class's shard now (or every shard), instead of on its first search."""
+        if class_name is None:
+            self.gallery.load_all()
+        else:
+            self.gallery.shard(class_name)
+
+    def warm_up(self, frame_size=(480, 640)):
+        """Build the models and run one dummy detection and embedding, so the first real frame is fast."""
+        start = time.perf_counter()
+        self.detector.detect(np.zeros((*frame_size, 3), np.uint8))
+        self.embed_batch([np.zeros((*self.spec.input_size, 3), np.uint8)])
+        return time.perf_counter() - start
+
+    # ==================== ENROLLMENT ====================
+    def _check_writable(self):
+        if self.store is None:
+            raise RuntimeError("This recognizer searches a gallery built elsewhere; enroll there")
+
+    def _photos(self, name, class_name):
+        """``(key, path)`` of every enrollment photo of one student."""
+        return [(key, path) for key, path, n in self._class_photos(class_name) if n == name]
+
+    def enroll(self, name, class_name, image, replace=False, record=True):
+        """Add one student from a BGR photo without reloading anything else.
+
+        Only this photo is embedded; the class shard is swapped for an updated
+        copy, so the very next frame can match the student.  The photo is
+        saved under ``db_path/class_name`` and, with ``record``, the student is
+        written to the ``students`` table.  Returns the photo path.
+        """
+        self._check_writable()
+        check_folder_name(name), check_folder_name(class_name, 'class')
+        if not replace and self._photos(name, class_name):
+            raise ValueError(f"{name} is already enrolled in {class_name}")
+        face, quality, emb = self._embed_photo(name, image)
+        with self._store_lock:
+            self._delete_photos(name, class_name)
+            os.makedirs(os.path.join(self.db_path, class_name), exist_ok=True)
+            path = os.path.join(self.db_path, class_name, f"{name}.jpg")
+            key = f"{class_name}/{name}.jpg"
+            self._save_photo(key, path, image, emb, quality)
+        # outside the store lock: a shard load takes the gallery lock, then the store lock
+        self.gallery.update_shard(class_name, lambda g: (g.remove(name, class_name),
+                                                         g.add_sample(name, emb, class_name, quality, key)))
+        if record:
+            add_student(name, class_name, path)
+        print(f"[INFO] Enrolled {name} in {class_name}.")
+        return path
+
+    def _delete_photos(self, name, class_name):
+        for key, path in self._photos(name, class_name):
+            os.remove(path)
+            self.store.forget(key)
+        folder = os.path.join(self.db_path, class_name, name)
+        if os.path.isdir(folder) and not os.listdir(folder):
+            os.rmdir(folder)
+
+    def _embed_photo(self, name, image):
+        found = self._main_face(image)
+        if found is None:
+            raise ValueError(f"No face found for {name}")
+        face, quality = found
+        emb = self.embed_batch([face])[0]
+        if emb is None:
+            raise ValueError(f"Could not embed the face of {name}")
+        return face, quality, emb
+
+    def _save_photo(self, key, path, image, emb, quality):
+        if not cv2.imwrite(path, image):
+            raise IOError(f"Could not write {path}")
+        self.store.put(key, path, emb, quality)
+        self.store.save()
+
+    def add_sample(self, name, class_name, image):
+        """Add another photo of an enrolled student as an extra sample (``<class>/<name>/``)."""
+        self._check_writable()
+        check_folder_name(name), check_folder_name(class_name, 'class')
+        _, quality, emb = self._embed_photo(name, image)
+        with self._store_lock:
+            folder = os.path.join(self.db_path, class_name, name)
+            os.makedirs(folder, exist_ok=True)
+            img_file = datetime.now().strftime("%Y%m%d_%H%M%S_%f") + ".jpg"
+            key = f"{class_name}/{name}/{img_file}"
+            self._save_photo(key, os.path.join(folder, img_file), image, emb, quality)
+        self.gallery.update_shard(class_name, lambda g: g.add_sample(name, emb, class_name, quality, key))
+        return quality
+
+    def _capture_live(self, name, class_name, emb, face):
+        """Keep a confident, good-quality live sighting as an in-memory sample (rate limited).
+
+        Returns ``(name, class_name, emb, sample_id, quality, dropped_id)`` for
+        _apply_live(), or None if the sighting is not kept.
+        """
+        key, now = (class_name, name), time.monotonic()
+        with self._live_lock:
+            taken = self._live.setdefault(key, [])
+            if taken and now - taken[-1][0] < self.capture_interval:
+                return None
+            quality = face_quality(face)
+            if quality < self.capture_quality:
+                return None
+            drop = None
+            if len(taken) >= self.live_samples:
+                drop = min(taken, key=lambda t: t[2])
+                if drop[2] >= quality:
+                    return None
+                taken.remove(drop)
+            sample_id = f"live:{next(self._live_ids)}"
+            taken.append((now, sample_id, quality))
+        return name, class_name, emb, sample_id, quality, drop and drop[1]
+
+    def _apply_live(self, captures):
+        """Add the live samples of one identify_many() call: one shard swap per class, not per face."""
+        by_class = {}
+        for capture in captures:
+            by_class.setdefault(capture[1], []).append(capture)
+
+        def apply(g, batch):
+            for name, class_name, emb, sample_id, quality, dropped in batch:
+                if dropped is not None:
+                    g.remove_sample(name, class_name, dropped)
+                if (class_name, name) in g:     # not unenrolled meanwhile
+                    g.add_sample(name, emb, class_name, quality, sample_id)
+        for class_name, batch in by_class.items():
+            self.gallery.update_shard(class_name, lambda g, batch=batch: apply(g, batch))
+
+    def update(self, name, class_name, image, record=True):
+        """Replace a student's photo and embedding."""
+        return self.enroll(name, class_name, image, replace=True, record=record)
+
+    def unenroll(self, name, class_name, delete_photo=True):
+        """Stop recognising a student; their DB row stays for the attendance history."""
+        self._check_writable()
+        removed = self.gallery.remove(name, class_name)
+        with self._store_lock:
+            if delete_photo:
+                self._delete_photos(name, class_name)
+            self.store.save()
+        if removed:
+            print(f"[INFO] Unenrolled {name} from {class_name}.")
+        return removed
+
+    # ==================== RECOGNITION ====================
+    def detect(self, frame, rois=None):
+        """Face boxes ``(x, y, w, h)`` in a BGR frame, optionally only around ``rois``."""
+        return [d[:4] for d in self.detector.detect(frame, rois)]
+
+    def recognize(self, frame, class_name=None, fallback=False):
+        """Identify faces in a BGR frame, searching only ``class_name``'s shard if given."""
+        return self.recognize_many([frame], class_name, fallback)[0]
+
+    def recognize_many(self, frames, class_name=None, fallback=False):
+        """Like recognize() for several frames, with all their faces embedded in one batch."""
+        return self.identify_many([(frame, self.detect(frame)) for frame in frames],
+                                  class_name, fallback)
+
+    def identify(self, frame, boxes, class_name=None, fallback=False):
+        return self.identify_many([(frame, boxes)], class_name, fallback)[0]
+
+    def identify_many(self, items, class_name=None, fallback=False, scopes=None):
+        """Embed and match already-detected faces; ``items`` are ``(frame, boxes)`` pairs.
+
+        ``scopes`` optionally gives a ``(class_name, fallback)`` per item, so
+        frames from different classrooms share one embedding batch.
+        """
+        boxes, crops = [], []
+        with metrics.span('crop'):
+            for f_idx, (frame, frame_boxes) in enumerate(items):
+                for (x, y, fw, fh) in frame_boxes:
+                    boxes.append((f_idx, (x, y, fw, fh)))
+                    # BGR, like the enrollment crops; embed_faces converts for the model
+                    crops.append(cv2.resize(frame[y:y+fh, x:x+fw], self.face_size))
+        with metrics.span('embed'):
+            embeddings = self.embed_batch(crops)
+
+        # one matrix product for every embedded face
+        ok = [i for i, emb in enumerate(embeddings) if emb is not None]
+        groups = {}
+        for i in ok:
+            scope = scopes[boxes[i][0]] if scopes else (class_name, fallback)
+            groups.setdefault(scope, []).append(i)
+        matches = {}
+        with metrics.span('match'):
+            for (scope_class, scope_fallback), idx in groups.items():
+                found = self.gallery.match([embeddings[i] for i in idx], class_name=scope_class,
+                                           fallback=scope_fallback, threshold=self.threshold)
+                matches.update(zip(idx, found))
+        metrics.incr('faces', len(boxes))
+
+        results = [[] for _ in items]
+        captures = []
+        for i, (f_idx, box) in enumerate(boxes):
+            if i not in matches:
+                results[f_idx].append(Recognition(*box, "Error", 0.0, None))
+                continue
+            top = matches[i]
+            best_sim = max(top[0].score, 0.0) if top else 0.0
+            if best_sim > self.threshold:
+                results[f_idx].append(Recognition(*box, top[0].name, best_sim, top[0].class_name))
+                if self.auto_capture and best_sim >= self.capture_score \
+                        and top[0].margin >= self.capture_margin:
+                    x, y, fw, fh = box
+                    captured = self._capture_live(top[0].name, top[0].class_name, embeddings[i],
+                                                  items[f_idx][0][y:y+fh, x:x+fw])
+                    if captured is not None:
+                        captures.append(captured)
+            else:
+                results[f_idx].append(Recognition(*box, "Unknown", best_sim, None))
+        if captures:
+            self._apply_live(captures)
+        return results
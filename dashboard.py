@@ -1,44 +1,106 @@
 # dashboard.py
+from metrics import metrics, FrameProfiler, startup    # first, so startup timings include the imports
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import ttk, messagebox
 import cv2
 import threading
 import os
-import pandas as pd
-from datetime import datetime, time
+from collections import deque
+from datetime import datetime
 from PIL import Image, ImageTk
 
-from database import init_db, get_conn
+# TensorFlow, DeepFace and MTCNN are imported by the recognizer thread on first use
+from database import init_db, get_conn, AttendanceWriter, present_students
+import reports
+from attendance import AttendanceLog, PresenceCache
 from core_recognition import FaceRecognizer
+from pipeline import RecognitionEngine
+from motion import MotionGate
+from tracking import FaceTracker
 
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 
+LIVE_PAGE_SIZE = 200        # rows held in the "Present Today" table at once
+DISPLAY_SIZE = (854, 480)
+DISPLAY_FPS = 20            # how often the video label is repainted
+PROCESS_FPS = None          # cap on frames sent to the models (None = as fast as they go)
+MOTION_GATE = True          # skip face detection while the classroom is still
+METRICS_FILE = "AttendanceLogs/metrics.json"   # rewritten every METRICS_INTERVAL seconds
+METRICS_INTERVAL = 30
+METRICS_PORT = int(os.environ.get("ATTENDANCE_METRICS_PORT", 0))       # e.g. 9108 -> /metrics
+PROFILE_FRAMES = int(os.environ.get("ATTENDANCE_PROFILE_FRAMES", 0))   # profile N displayed frames
+RECOG_MODEL = os.environ.get("ATTENDANCE_MODEL", "VGG-Face")         # any core_recognition.MODELS entry
+RECOGNITION_SERVICE = os.environ.get("ATTENDANCE_SERVICE")           # "host:port": models run there
+
 class TeacherDashboard:
     def __init__(self):
         print("[TEACHER] Starting Smart Attendance...")
-        init_db()
-        self.root = ctk.CTk()
-        self.root.title("Teacher Attendance Dashboard")
-        self.root.geometry("1400x900")
-        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        startup.mark('imports')
+        with startup.phase('window'):
+            init_db()
+            self.root = ctk.CTk()
+            self.root.title("Teacher Attendance Dashboard")
+            self.root.geometry("1400x900")
+            self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.recognizer = None
+        self.recognizer_ready = False
+        self.status_var = tk.StringVar(value="Loading face recognition...")
         self.cap = None
+        self.engine = None
+        self.attendance_log = AttendanceLog()
+        self.db_writer = AttendanceWriter(on_inserted=self.on_marked, on_failed=self.on_mark_failed)
+        self.presence = PresenceCache(seed=present_students)
+        metrics.add_stats('presence', self.presence.stats)
         self.is_running = False
         self.current_user = None
-        self.frame_queue = []  # GUI-safe frame buffer
+        self.active_class = None       # None = search every class
+        self.search_all_fallback = False
+        self._photo = None
+        self.show_metrics = False
+        self._export_job = None
+        self._export_lock = threading.Lock()
+        self.profiler = FrameProfiler(PROFILE_FRAMES, mode='sample', path="AttendanceLogs/profile.txt")
+        metrics.start_reporter(METRICS_INTERVAL, path=METRICS_FILE)
+        if METRICS_PORT:
+            metrics.serve(METRICS_PORT)
+        self.today_rows = []            # (name, class, time) for self._today, oldest first
+        self._today = None
+        self._live_page = 0
+        self._new_rows = deque()        # filled by the DB writer, drained on the Tk thread
 
-        threading.Thread(target=self.init_recognizer, daemon=True).start()
         self.login_screen()
+        startup.mark('login screen')
+        # models load and warm up while the teacher types their password
+        threading.Thread(target=self.init_recognizer, name='warm-up', daemon=True).start()
 
     def init_recognizer(self):
         try:
-            self.recognizer = FaceRecognizer()
-            print(f"[TEACHER] Loaded {len(self.recognizer.known_encodings)} students.")
+            with startup.phase('recognizer'):
+                if RECOGNITION_SERVICE:
+                    # thin client: frames go to recognition_service.py, no models in this process
+                    from recognition_service import RemoteRecognizer
+                    recognizer = RemoteRecognizer(RECOGNITION_SERVICE)
+                else:
+                    recognizer = FaceRecognizer(model=RECOG_MODEL)
+            with startup.phase('warm-up'):
+                recognizer.warm_up(DISPLAY_SIZE[::-1])
+            with startup.phase('gallery'):
+                recognizer.preload()
         except Exception as e:
-            messagebox.showerror("Error", f"Recognizer failed: {e}")
+            print(f"[ERROR] Recognizer failed: {e}")
+            self.root.after(0, lambda e=e: self.status_var.set(f"Face recognition failed: {e}"))
+            self.root.after(0, lambda e=e: messagebox.showerror("Error", f"Recognizer failed: {e}"))
+            return
+        self.recognizer = recognizer
+        if self.engine:
+            self.engine.recognizer = recognizer
+        self.recognizer_ready = True
+        startup.mark('recognition ready')
+        print(f"[TEACHER] Recognizer ready ({len(recognizer.known_classes)} classes).")
+        self.root.after(0, lambda: self.status_var.set("Face recognition ready"))
 
     # ==================== LOGIN ====================
     def login_screen(self):
@@ -53,10 +115,13 @@ class TeacherDashboard:
         self.pass_entry = ctk.CTkEntry(frame, placeholder_text="Password", show="*", width=300)
         self.pass_entry.pack(pady=12)
         ctk.CTkButton(frame, text="Login", width=200, command=self.login).pack(pady=20)
+        ctk.CTkLabel(frame, textvariable=self.status_var, font=("Arial", 12)).pack(pady=5)
 
     def login(self):
         if self.user_entry.get() == "admin" and self.pass_entry.get() == "admin123":
             self.current_user = "admin"
+            if not any(e[0] == 'logged in' for e in startup.events):
+                startup.mark('logged in')
             self.main_dashboard()
         else:
             messagebox.showerror("Error", "Invalid login")
@@ -90,6 +155,22 @@ class TeacherDashboard:
         self.clear_content()
         ctk.CTkLabel(self.content, text="Live Classroom Camera", font=("Arial", 26, "bold")).pack(pady=10)
 
+        class_bar = ctk.CTkFrame(self.content, fg_color="transparent")
+        class_bar.pack(pady=5)
+        ctk.CTkLabel(class_bar, text="Class:").pack(side="left", padx=5)
+        classes = sorted(d for d in os.listdir("ImagesAttendance")
+                         if not d.startswith('.') and os.path.isdir(os.path.join("ImagesAttendance", d))) \
+            if os.path.isdir("ImagesAttendance") else []
+        class_menu = ctk.CTkOptionMenu(class_bar, values=["All classes"] + classes, command=self.set_active_class)
+        class_menu.set(self.active_class or "All classes")
+        class_menu.pack(side="left", padx=5)
+        self.fallback_var = tk.BooleanVar(value=self.search_all_fallback)
+        ctk.CTkCheckBox(class_bar, text="Fall back to all classes", variable=self.fallback_var,
+                        command=self.set_fallback).pack(side="left", padx=10)
+        self.metrics_var = tk.BooleanVar(value=self.show_metrics)
+        ctk.CTkCheckBox(class_bar, text="Show timings", variable=self.metrics_var,
+                        command=lambda: setattr(self, 'show_metrics', self.metrics_var.get())).pack(side="left", padx=10)
+
         self.cam_label = tk.Label(self.content, bg="#1e1e1e")
         self.cam_label.pack(pady=10, expand=True)
 
@@ -109,11 +190,38 @@ class TeacherDashboard:
         sb.pack(side="right", fill="y")
         self.live_tree.config(yscrollcommand=sb.set)
 
+        page_bar = ctk.CTkFrame(self.content, fg_color="transparent")
+        page_bar.pack(pady=(0, 10))
+        ctk.CTkButton(page_bar, text="< Prev", width=80,
+                      command=lambda: self.show_live_page(self._live_page - 1)).pack(side="left", padx=5)
+        self.page_label = ctk.CTkLabel(page_bar, text="")
+        self.page_label.pack(side="left", padx=10)
+        ctk.CTkButton(page_bar, text="Next >", width=80,
+                      command=lambda: self.show_live_page(self._live_page + 1)).pack(side="left", padx=5)
+        ctk.CTkButton(page_bar, text="Refresh", width=80,
+                      command=self.load_today_attendance).pack(side="left", padx=15)
+
         self.load_today_attendance()
         self.schedule_daily_export()
+        threading.Thread(target=self.export_missed, daemon=True).start()
 
         # Start GUI update loop
-        self.root.after(50, self.update_gui_from_queue)
+        self.root.after(1000 // DISPLAY_FPS, self.update_gui_from_queue)
+
+    def set_active_class(self, choice):
+        self.active_class = None if choice == "All classes" else choice
+        self.presence.start_session(self.active_class)
+        if self.engine:
+            self.engine.class_name = self.active_class
+        if self.active_class and self.recognizer:
+            # warm the shard off the UI thread
+            threading.Thread(target=self.recognizer.preload, args=(self.active_class,),
+                             daemon=True).start()
+
+    def set_fallback(self):
+        self.search_all_fallback = self.fallback_var.get()
+        if self.engine:
+            self.engine.fallback = self.search_all_fallback
 
     def start_camera(self):
         if self.cap is not None:
@@ -123,96 +231,87 @@ class TeacherDashboard:
             if not self.cap.isOpened():
                 messagebox.showerror("Camera Error", "Webcam not found.")
                 return
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 854)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, DISPLAY_SIZE[0])
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, DISPLAY_SIZE[1])
             self.is_running = True
-            threading.Thread(target=self.process_frames, daemon=True).start()
+            tracker = FaceTracker(min_score=self.recognizer.threshold)   # the model's calibrated threshold
+            self.engine = RecognitionEngine(self.cap, self.recognizer, on_results=self.process_results,
+                                            tracker=tracker, full_detect_every=5,
+                                            display_size=DISPLAY_SIZE, process_fps=PROCESS_FPS,
+                                            motion_gate=MotionGate() if MOTION_GATE else None)
+            self.engine.class_name = self.active_class
+            self.engine.fallback = self.search_all_fallback
+            self.presence.start_session(self.active_class)
+            self.engine.start()
+            metrics.add_stats('engine', self.engine.stats)
             print("[CAMERA] Started successfully.")
         except Exception as e:
             messagebox.showerror("Error", f"Camera failed: {e}")
 
     # ==================== BACKGROUND PROCESSING ====================
-    def process_frames(self):
-        while self.is_running and self.cap and self.cap.isOpened():
-            ret, frame = self.cap.read()
-            if not ret:
-                continue
-
-            if self.recognizer:
-                results = self.recognizer.recognize(frame)
-                for (x, y, w, h, name, score) in results:
-                    if name not in ["Unknown", "Error"]:
-                        self.mark_attendance(name)  # DB + CSV + UI
-
-                    # Draw on frame
-                    color = (0, 255, 0) if name not in ["Unknown", "Error"] else (0, 0, 255)
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), color, 3)
-                    label = f"{name} ({score:.2f})" if name not in ["Unknown", "Error"] else name
-                    cv2.putText(frame, label, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-
-            # Convert and queue for GUI
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame = cv2.resize(frame, (854, 480))
-            img = Image.fromarray(frame)
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.frame_queue.append(imgtk)
-
-            # Limit queue size
-            if len(self.frame_queue) > 5:
-                self.frame_queue.pop(0)
+    def process_results(self, results):
+        """Runs on the engine's sink thread with identities confirmed by the tracker."""
+        for (x, y, w, h, name, score, class_name) in results:
+            if name not in ["Unknown", "Error"]:
+                self.mark_attendance(name, class_name)  # DB + CSV + UI
 
     # ==================== GUI UPDATE (SAFE) ====================
     def update_gui_from_queue(self):
-        if self.frame_queue:
-            imgtk = self.frame_queue.pop(0)
-            try:
-                self.cam_label.imgtk = imgtk
-                self.cam_label.configure(image=imgtk)
-            except:
-                pass  # Widget destroyed
-        if self.is_running:
-            self.root.after(50, self.update_gui_from_queue)
+        self.apply_new_rows()
+        # only the newest frame is converted, into the engine's reused display buffer
+        frame, _ = self.engine.render() if self.engine else (None, 0)
+        if frame is not None:
+            self.profiler.frame()
+            if self.show_metrics:
+                metrics.overlay(frame)
+            # PhotoImage must be built on the Tk thread; repaint it in place when possible
+            with metrics.span('gui.photo'):
+                image = Image.fromarray(frame)
+                try:
+                    if self._photo is None or (self._photo.width(), self._photo.height()) != image.size:
+                        self._photo = ImageTk.PhotoImage(image=image)
+                    else:
+                        self._photo.paste(image)
+                    self.cam_label.imgtk = self._photo
+                    self.cam_label.configure(image=self._photo)
+                except:
+                    self._photo = None  # Widget destroyed
+        if self.is_running or not self.engine:
+            self.root.after(1000 // DISPLAY_FPS, self.update_gui_from_queue)
 
     # ==================== INSTANT MARK + CSV ====================
-    def mark_attendance(self, name):
-        conn = get_conn()
-        c = conn.cursor()
-        c.execute("SELECT id FROM students WHERE name=?", (name,))
-        student = c.fetchone()
-        if not student:
-            conn.close()
+    def mark_attendance(self, name, class_name=None):
+        # repeat sightings stop here, before any I/O
+        if not self.presence.check_and_add((name, class_name)):
             return
-        today = datetime.now().strftime("%Y-%m-%d")
-        c.execute("SELECT 1 FROM attendance WHERE student_id=? AND date=?", (student[0], today))
-        if not c.fetchone():
-            now = datetime.now().strftime("%H:%M:%S")
-            c.execute("INSERT INTO attendance (student_id, date, time) VALUES (?, ?, ?)",
-                      (student[0], today, now))
-            conn.commit()
+        metrics.incr('marks.queued')
+        # queued: the writer thread batches inserts and ignores repeats
+        self.db_writer.mark(name, class_name)
+
+    def on_marked(self, rows):
+        """Runs on the DB writer thread with rows that were really inserted."""
+        for name, class_name, today, now in rows:
+            self.presence.add((name, class_name), today)
             print(f"[MARKED] {name} @ {now}")
 
             # INSTANT CSV UPDATE
-            self.update_csv_immediately(name, today, now)
-
-            # INSTANT TABLE UPDATE
-            self.root.after(0, self.load_today_attendance)
-        conn.close()
-
-    def update_csv_immediately(self, name, date_str, time_str):
-        filename = 'Attendance.csv'
-        if not os.path.exists(filename):
-            pd.DataFrame(columns=['Name', 'Date', 'Time']).to_csv(filename, index=False)
-
-        df = pd.read_csv(filename)
-        if not ((df['Name'] == name) & (df['Date'] == date_str)).any():
-            new_row = pd.DataFrame({'Name': [name], 'Date': [date_str], 'Time': [time_str]})
-            df = pd.concat([df, new_row], ignore_index=True)
-            df.to_csv(filename, index=False)
+            self.update_csv_immediately(name, today, now, class_name)
+
+            # table is updated on the next GUI tick, one batch per tick
+            self._new_rows.append((today, (name, class_name, now)))
+
+    def on_mark_failed(self, events):
+        """Runs on the DB writer thread with marks that recorded nothing: retry on the next sighting."""
+        for name, class_name, _ in events:
+            self.presence.release((name, class_name))
+
+    def update_csv_immediately(self, name, date_str, time_str, class_name=None):
+        when = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M:%S")
+        if self.attendance_log.mark(name, when, class_name):
             print(f"[CSV] {name} added")
 
     def load_today_attendance(self):
-        for i in self.live_tree.get_children():
-            self.live_tree.delete(i)
+        """Full reload from the database; only on screen open or Refresh."""
         try:
             conn = get_conn()
             c = conn.cursor()
@@ -221,44 +320,88 @@ class TeacherDashboard:
                          JOIN students s ON a.student_id = s.id
                          JOIN classes c ON s.class_id = c.id
                          WHERE a.date = ? ORDER BY a.time''', (today,))
-            for row in c.fetchall():
-                self.live_tree.insert("", "end", values=row)
+            self.today_rows = c.fetchall()
+            self._today = today
             conn.close()
         except Exception as e:
             print(f"[DB ERROR] {e}")
+            return
+        self._new_rows.clear()      # already part of the reload
+        self.show_live_page(self._last_page())
+
+    def _last_page(self):
+        return max(0, (len(self.today_rows) - 1) // LIVE_PAGE_SIZE)
+
+    def show_live_page(self, page):
+        """Render one page; the tree never holds more than LIVE_PAGE_SIZE rows."""
+        self._live_page = min(max(0, page), self._last_page())
+        start = self._live_page * LIVE_PAGE_SIZE
+        try:
+            self.live_tree.delete(*self.live_tree.get_children())
+            for row in self.today_rows[start:start + LIVE_PAGE_SIZE]:
+                self.live_tree.insert("", "end", values=row)
+        except tk.TclError:
+            return      # live screen not shown
+        self._update_page_label()
+
+    def _update_page_label(self):
+        try:
+            self.page_label.configure(text=f"Page {self._live_page + 1}/{self._last_page() + 1}"
+                                           f"  ({len(self.today_rows)} present)")
+        except (AttributeError, tk.TclError):
+            pass
+
+    def apply_new_rows(self):
+        """Apply every mark since the last tick as one incremental table update."""
+        if not self._new_rows:
+            return
+        following = self._live_page == self._last_page()
+        added, rolled_over = [], False
+        while self._new_rows:
+            date_str, row = self._new_rows.popleft()
+            if date_str != self._today:         # first mark after midnight
+                self._today, self.today_rows, added = date_str, [], []
+                rolled_over = True
+            self.today_rows.append(row)
+            added.append(row)
+        if rolled_over or (following and self._last_page() != self._live_page):
+            self.show_live_page(self._last_page())      # new day, or page filled up
+            return
+        if not following:
+            self._update_page_label()
+            return
+        try:
+            for row in added:
+                self.live_tree.insert("", "end", values=row)
+            self.live_tree.yview_moveto(1.0)
+        except tk.TclError:
+            return
+        self._update_page_label()
 
     # ==================== 5 PM EXPORT (Mon–Fri) ====================
     def schedule_daily_export(self):
+        if self._export_job is not None:     # screen reopened: keep a single timer
+            self.root.after_cancel(self._export_job)
         now = datetime.now()
-        target_time = time(17, 0)
-        target = datetime.combine(now.date(), target_time)
-        if now.weekday() >= 5:
-            days_ahead = 7 - now.weekday()
-            target = target.replace(day=now.day + days_ahead)
-        elif now > target:
-            target = target.replace(day=now.day + 1)
-        delay_ms = int((target - now).total_seconds() * 1000)
-        self.root.after(delay_ms, self.export_and_reschedule)
+        delay_ms = int((reports.next_export(now) - now).total_seconds() * 1000)
+        self._export_job = self.root.after(delay_ms, self.export_and_reschedule)
 
     def export_and_reschedule(self):
-        self.export_today()
+        self._export_job = None
+        # also catches up on days the app was closed (or the machine asleep) at 5 PM
+        threading.Thread(target=self.export_missed, daemon=True).start()
         self.schedule_daily_export()
 
+    def export_missed(self):
+        try:
+            with self._export_lock:
+                reports.export_missed()
+        except Exception as e:
+            print(f"[EXPORT ERROR] {e}")
+
     def export_today(self):
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            conn = get_conn()
-            df = pd.read_sql_query("""
-                SELECT s.name AS Student, c.name AS Class, a.time AS Time
-                FROM attendance a
-                JOIN students s ON a.student_id = s.id
-                JOIN classes c ON s.class_id = c.id
-                WHERE a.date = ?
-            """, conn, params=(today,))
-            conn.close()
-            if not df.empty:
-                df.to_csv(f"Attendance_{today}.csv", index=False)
-                print(f"[EXPORTED] Attendance_{today}.csv")
+            reports.export_day(datetime.now())
         except Exception as e:
             print(f"[EXPORT ERROR] {e}")
 
@@ -283,19 +426,29 @@ class TeacherDashboard:
             if not name or not cls:
                 messagebox.showerror("Error", "Fill all fields")
                 return
+            if self.recognizer is None:
+                messagebox.showwarning("Please wait", "Recognizer is still loading")
+                return
             ret, frame = self.cap.read()
             if not ret:
                 messagebox.showerror("Error", "Camera failed")
                 return
-            os.makedirs(f"ImagesAttendance/{cls}", exist_ok=True)
-            path = f"ImagesAttendance/{cls}/{name}.jpg"
-            cv2.imwrite(path, frame)
-            messagebox.showinfo("Success", f"Added {name}")
             dialog.destroy()
-            threading.Thread(target=self.init_recognizer, daemon=True).start()
+            # embeds only this photo; the rest of the gallery stays loaded
+            threading.Thread(target=self.enroll_student, args=(name, cls, frame), daemon=True).start()
 
         ctk.CTkButton(dialog, text="Capture & Save", command=save).pack(pady=20)
 
+    def enroll_student(self, name, cls, frame):
+        try:
+            self.recognizer.enroll(name, cls, frame, replace=True)
+        except Exception as e:
+            self.root.after(0, lambda e=e: messagebox.showerror("Error", f"Enrollment failed: {e}"))
+            return
+        self.db_writer.invalidate()             # pick up the new students row
+        self.presence.discard((name, cls))
+        self.root.after(0, lambda: messagebox.showinfo("Success", f"Added {name}"))
+
     def show_today(self):
         self.clear_content()
         ctk.CTkLabel(self.content, text="Today's Attendance", font=("Arial", 26)).pack(pady=20)
@@ -307,6 +460,10 @@ class TeacherDashboard:
 
     def on_close(self):
         self.is_running = False
+        if self.engine:
+            self.engine.stop()
+        self.db_writer.close()
+        self.attendance_log.close()
         if self.cap:
             self.cap.release()
         self.root.destroy()
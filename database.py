@@ -1,13 +1,19 @@
 # database.py
+import queue
 import sqlite3
+import threading
+import time
 from datetime import datetime
 import os
 
+from metrics import metrics
+
 DB_NAME = "database.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
+def init_db(path=None):
+    conn = sqlite3.connect(path or DB_NAME)
     c = conn.cursor()
+    c.execute("PRAGMA journal_mode=WAL")
     
     c.execute('''CREATE TABLE IF NOT EXISTS classes (
                  id INTEGER PRIMARY KEY,
@@ -32,11 +38,246 @@ def init_db():
                  username TEXT UNIQUE,
                  password TEXT)''')
     
+    # once-per-day uniqueness; databases from older versions get their
+    # duplicates dropped once, the first time the index is created
+    has_unique = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' "
+                           "AND name = 'idx_attendance_student_date'").fetchone()
+    if not has_unique:
+        c.execute('''DELETE FROM attendance WHERE id NOT IN
+                     (SELECT MIN(id) FROM attendance GROUP BY student_id, date)''')
+        c.execute('''CREATE UNIQUE INDEX idx_attendance_student_date
+                     ON attendance(student_id, date)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_students_name_class ON students(name, class_id)")
+    
     c.execute("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)", 
               ("admin", "admin123"))
     
+    _init_summaries(c)
+    
     conn.commit()
     conn.close()
 
+# ==================== SUMMARIES ====================
+# Reports read these instead of scanning attendance.  Triggers keep them in
+# step with every insert/delete, so they cost one upsert per new mark:
+#   daily_class_summary   students present per class per day (class at the time of the mark)
+#   student_month_summary days present per student per month ('YYYY-MM')
+#   exports               days already exported by the scheduler (reports.export_missed)
+_SUMMARY_TRIGGERS = {
+    'insert': ('AFTER INSERT', [('NEW', 1)]),
+    'delete': ('AFTER DELETE', [('OLD', -1)]),
+    'update': ('AFTER UPDATE OF student_id, date', [('OLD', -1), ('NEW', 1)]),
+}
+
+def _summary_upsert(ref, sign):
+    sql = f'''
+        INSERT INTO daily_class_summary (date, class_id, present)
+            SELECT {ref}.date, COALESCE(class_id, 0), {sign} FROM students WHERE id = {ref}.student_id
+            ON CONFLICT (date, class_id) DO UPDATE SET present = present + ({sign});
+        INSERT INTO student_month_summary (student_id, month, days)
+            VALUES ({ref}.student_id, substr({ref}.date, 1, 7), {sign})
+            ON CONFLICT (student_id, month) DO UPDATE SET days = days + ({sign});'''
+    if sign < 0:        # a day nobody is left marked on is not a school day for that class
+        sql += f'''
+        DELETE FROM daily_class_summary WHERE date = {ref}.date AND present <= 0;
+        DELETE FROM student_month_summary
+            WHERE student_id = {ref}.student_id AND month = substr({ref}.date, 1, 7) AND days <= 0;'''
+    return sql
+
+def _init_summaries(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS daily_class_summary (
+                 date TEXT NOT NULL,
+                 class_id INTEGER NOT NULL,
+                 present INTEGER NOT NULL,
+                 PRIMARY KEY (date, class_id)) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS student_month_summary (
+                 student_id INTEGER NOT NULL,
+                 month TEXT NOT NULL,
+                 days INTEGER NOT NULL,
+                 PRIMARY KEY (student_id, month)) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_student_month_month ON student_month_summary(month)")
+    c.execute('''CREATE TABLE IF NOT EXISTS exports (
+                 date TEXT PRIMARY KEY,
+                 rows INTEGER,
+                 path TEXT,
+                 exported_at TEXT)''')
+
+    for name, (when, refs) in _SUMMARY_TRIGGERS.items():
+        body = "".join(_summary_upsert(ref, sign) for ref, sign in refs)
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_{name} {when} ON attendance
+                     BEGIN{body}
+                     END''')
+
+    # databases from before the summaries existed: build them once from the raw rows
+    has_rows = c.execute("SELECT EXISTS (SELECT 1 FROM attendance)").fetchone()[0]
+    has_summary = c.execute("SELECT EXISTS (SELECT 1 FROM student_month_summary)").fetchone()[0]
+    if has_rows and not has_summary:
+        print("[DB] Building attendance summaries...")
+        rebuild_summaries(c)
+
+def rebuild_summaries(c):
+    """Recompute both summary tables from ``attendance`` (``c``: connection or cursor).
+
+    Only needed after bulk edits made with triggers off, or to re-file old
+    marks under the students' current classes.
+    """
+    c.execute("DELETE FROM daily_class_summary")
+    c.execute("DELETE FROM student_month_summary")
+    c.execute('''INSERT INTO daily_class_summary (date, class_id, present)
+                 SELECT a.date, COALESCE(s.class_id, 0), COUNT(*) FROM attendance a
+                 JOIN students s ON a.student_id = s.id GROUP BY a.date, COALESCE(s.class_id, 0)''')
+    c.execute('''INSERT INTO student_month_summary (student_id, month, days)
+                 SELECT student_id, substr(date, 1, 7), COUNT(*) FROM attendance
+                 GROUP BY student_id, substr(date, 1, 7)''')
+
 def get_conn():
-    return sqlite3.connect(DB_NAME)
\ No newline at end of file
+    return sqlite3.connect(DB_NAME)
+
+def add_student(name, class_name, image_path=None, path=None):
+    """Insert (or update the photo of) a student, creating the class if needed; returns the id."""
+    conn = sqlite3.connect(path or DB_NAME)
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO classes (name) VALUES (?)", (class_name,))
+        class_id = conn.execute("SELECT id FROM classes WHERE name = ?", (class_name,)).fetchone()[0]
+        row = conn.execute("SELECT id FROM students WHERE name = ? AND class_id = ?",
+                           (name, class_id)).fetchone()
+        if row:
+            student_id = row[0]
+            conn.execute("UPDATE students SET image_path = ? WHERE id = ?", (image_path, student_id))
+        else:
+            student_id = conn.execute("INSERT INTO students (name, class_id, image_path) VALUES (?, ?, ?)",
+                                      (name, class_id, image_path)).lastrowid
+    conn.close()
+    return student_id
+
+def present_students(date_str, path=None):
+    """``(name, class_name)`` of every student marked on ``date_str``."""
+    conn = sqlite3.connect(path or DB_NAME)
+    rows = conn.execute('''SELECT s.name, c.name FROM attendance a
+                           JOIN students s ON a.student_id = s.id
+                           LEFT JOIN classes c ON s.class_id = c.id
+                           WHERE a.date = ?''', (date_str,)).fetchall()
+    conn.close()
+    return rows
+
+
+class AttendanceWriter:
+    """Single long-lived connection that records attendance in batched transactions.
+
+    ``mark()`` only enqueues; a background thread resolves names through an
+    in-memory map, inserts with ``INSERT OR IGNORE`` (the unique index makes
+    repeats free) and commits up to ``batch_size`` events at a time.
+    ``on_inserted`` receives ``(name, class_name, date, time)`` tuples for the
+    rows that were actually new; ``on_failed`` receives the ``(name,
+    class_name, when)`` events that recorded nothing (unknown student, or
+    a batch sqlite rejected), so callers can try them again.
+    """
+
+    def __init__(self, path=None, batch_size=100, batch_interval=0.2, on_inserted=None, on_failed=None):
+        self.path = path or DB_NAME
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.on_inserted = on_inserted
+        self.on_failed = on_failed
+        self.stats = {'events': 0, 'inserted': 0, 'duplicates': 0, 'unknown': 0, 'failed': 0, 'batches': 0}
+        self._queue = queue.Queue()
+        self._by_class = {}     # (name, class_name) -> student id
+        self._by_name = {}      # name -> student id (first one), for marks without a class
+        self._last_reload = 0.0
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._thread.start()
+
+    def mark(self, name, class_name=None, when=None):
+        self._queue.put((name, class_name, when or datetime.now()))
+
+    def invalidate(self):
+        """Re-read the students table on the next unknown name (call after enrolling)."""
+        self._last_reload = float('-inf')
+
+    def close(self, timeout=5):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ---------- writer thread ----------
+    def _load_students(self, conn):
+        self._by_class, self._by_name = {}, {}
+        for sid, name, class_name in conn.execute(
+                '''SELECT s.id, s.name, c.name FROM students s
+                   LEFT JOIN classes c ON s.class_id = c.id ORDER BY s.id'''):
+            self._by_class[(name, class_name)] = sid
+            self._by_name.setdefault(name, sid)
+        self._last_reload = time.monotonic()
+
+    def _lookup(self, name, class_name):
+        # a class pins the student: another class's namesake is not a match
+        if class_name is not None:
+            return self._by_class.get((name, class_name))
+        return self._by_class.get((name, None)) or self._by_name.get(name)
+
+    def _resolve(self, conn, name, class_name):
+        sid = self._lookup(name, class_name)
+        if sid is None and time.monotonic() - self._last_reload > 5:
+            self._load_students(conn)       # maybe enrolled since we last looked
+            sid = self._lookup(name, class_name)
+        return sid
+
+    def _run(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._load_students(conn)
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [e for e in batch if e is not None]
+            if batch:
+                self._write(conn, batch)
+        conn.close()
+
+    def _write(self, conn, batch):
+        with metrics.span('db.batch'):
+            self._write_batch(conn, batch)
+
+    def _write_batch(self, conn, batch):
+        inserted, unknown = [], []
+        try:
+            with conn:      # one transaction per batch
+                for name, class_name, when in batch:
+                    self.stats['events'] += 1
+                    sid = self._resolve(conn, name, class_name)
+                    if sid is None:
+                        self.stats['unknown'] += 1
+                        unknown.append((name, class_name, when))
+                        continue
+                    date_str, time_str = when.strftime("%Y-%m-%d"), when.strftime("%H:%M:%S")
+                    cur = conn.execute("INSERT OR IGNORE INTO attendance (student_id, date, time) "
+                                       "VALUES (?, ?, ?)", (sid, date_str, time_str))
+                    if cur.rowcount == 1:
+                        inserted.append((name, class_name, date_str, time_str))
+                    else:
+                        self.stats['duplicates'] += 1
+        except sqlite3.Error as e:
+            print(f"[DB ERROR] {e}")
+            self.stats['failed'] += len(batch)
+            if self.on_failed is not None:
+                self.on_failed(batch)       # the whole transaction was rolled back
+            return
+        self.stats['batches'] += 1
+        self.stats['inserted'] += len(inserted)
+        metrics.incr('db.inserted', len(inserted))
+        if inserted and self.on_inserted is not None:
+            self.on_inserted(inserted)
+        if unknown and self.on_failed is not None:
+            self.on_failed(unknown)
@@ -0,0 +1,131 @@
+# embedding_store.py
+import hashlib
+import json
+import os
+import re
+import tempfile
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class EmbeddingStore:
+    """On-disk cache of enrollment embeddings.
+
+    One ``.npz`` file per (model, detector settings) signature holds every
+    embedding as a single float32 matrix plus a JSON index of the source
+    files (mtime, size, sha1).  Only new or changed images need re-embedding.
+    """
+
+    def __init__(self, root, model, settings=None):
+        self.root = root
+        self.model = model
+        self.settings = dict(settings or {})
+        sig = json.dumps({'version': FORMAT_VERSION, 'model': model,
+                          'settings': self.settings}, sort_keys=True)
+        self.signature = hashlib.sha1(sig.encode()).hexdigest()[:12]
+        safe_model = re.sub(r'[^A-Za-z0-9_.-]', '_', model)
+        self.path = os.path.join(root, f"{safe_model}_{self.signature}.npz")
+        self.entries = {}       # key -> {mtime, size, sha1, embedding}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                vectors = data['vectors']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] Ignoring embedding cache {self.path}: {e}")
+            return
+        if meta.get('version') != FORMAT_VERSION or meta.get('signature') != self.signature:
+            return
+        for key, entry in meta['entries'].items():
+            row = entry.pop('row')
+            entry['embedding'] = vectors[row] if row >= 0 else None
+            self.entries[key] = entry
+
+    def lookup(self, key, path):
+        """Return ``(hit, embedding)``; a cached ``None`` means no usable face."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            st = os.stat(path)
+            if entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+                self.hits += 1
+                return True, entry['embedding']
+            # touched but maybe not modified: fall back to the content hash
+            if entry['size'] == st.st_size and entry['sha1'] == file_digest(path):
+                entry['mtime'] = st.st_mtime_ns
+                self._dirty = True
+                self.hits += 1
+                return True, entry['embedding']
+        self.misses += 1
+        return False, None
+
+    def put(self, key, path, embedding, quality=None):
+        st = os.stat(path)
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+        self.entries[key] = {'mtime': st.st_mtime_ns, 'size': st.st_size,
+                             'sha1': file_digest(path), 'embedding': embedding}
+        if quality is not None:
+            self.entries[key]['quality'] = round(float(quality), 4)
+        self._dirty = True
+
+    def quality(self, key, default=1.0):
+        """Face-quality score stored with ``key`` (entries cached before scoring get ``default``)."""
+        return self.entries.get(key, {}).get('quality', default)
+
+    def forget(self, key):
+        if self.entries.pop(key, None) is not None:
+            self._dirty = True
+
+    def prune(self, keep, prefix=''):
+        """Forget entries under ``prefix`` whose files are no longer present."""
+        keep = set(keep)
+        for key in [k for k in self.entries if k.startswith(prefix) and k not in keep]:
+            del self.entries[key]
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        meta_entries, vectors = {}, []
+        for key in sorted(self.entries):
+            entry = dict(self.entries[key])
+            emb = entry.pop('embedding')
+            if emb is None:
+                entry['row'] = -1
+            else:
+                entry['row'] = len(vectors)
+                vectors.append(emb)
+            meta_entries[key] = entry
+        dim = len(vectors[0]) if vectors else 0
+        matrix = np.stack(vectors) if vectors else np.zeros((0, dim), dtype=np.float32)
+        meta = json.dumps({'version': FORMAT_VERSION, 'signature': self.signature,
+                           'model': self.model, 'settings': self.settings,
+                           'entries': meta_entries})
+        # a temp file of our own: worker processes may save the same cache at once
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, meta=np.array(meta), vectors=matrix.astype(np.float32))
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._dirty = False
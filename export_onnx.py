@@ -0,0 +1,76 @@
+# export_onnx.py
+"""Export a DeepFace backbone to ONNX, optionally int8-quantized, for CPU-only classroom boxes.
+
+    python export_onnx.py Facenet --int8        # -> models/Facenet-int8.onnx ('Facenet-int8')
+    python export_onnx.py ArcFace               # -> models/ArcFace.onnx
+
+Needs TensorFlow + tf2onnx to export and onnxruntime to quantize and run;
+none of them are needed by the rest of the app unless an ONNX model is chosen.
+"""
+import argparse
+import os
+
+import numpy as np
+
+from core_recognition import MODELS, OnnxEmbeddingNet, _build_embedding_net, model_spec, register_model
+
+
+def export(model_name, out_path, opset=13):
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = model_spec(model_name)
+    net = _build_embedding_net(model_name)
+    h, w = spec.input_size
+    signature = [tf.TensorSpec((None, h, w, 3), tf.float32, name='input')]
+    tf2onnx.convert.from_keras(net, input_signature=signature, opset=opset, output_path=out_path)
+    print(f"[EXPORT] {model_name} -> {out_path}")
+
+
+def quantize(src, dst):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    print(f"[EXPORT] int8 weights -> {dst} ({os.path.getsize(src) >> 20} MB -> {os.path.getsize(dst) >> 20} MB)")
+
+
+def agreement(reference, candidate, size, count=32, seed=0):
+    """Mean cosine similarity of two nets' embeddings of the same random faces."""
+    batch = np.random.default_rng(seed).random((count, *size, 3), dtype=np.float32)
+    a, b = np.asarray(reference(batch, training=False)), np.asarray(candidate(batch, training=False))
+    a /= np.linalg.norm(a, axis=1, keepdims=True)
+    b /= np.linalg.norm(b, axis=1, keepdims=True)
+    return float((a * b).sum(axis=1).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a recognition model to ONNX")
+    parser.add_argument('model', help="a DeepFace model in core_recognition.MODELS, e.g. Facenet")
+    parser.add_argument('--int8', action='store_true', help="also quantize the weights to int8")
+    parser.add_argument('--out', default=None, help="default: models/<model>[-int8].onnx")
+    parser.add_argument('--opset', type=int, default=13)
+    args = parser.parse_args()
+
+    spec = model_spec(args.model)
+    if spec.path:
+        parser.error(f"{args.model} is already an ONNX model")
+    name = f"{args.model}-int8" if args.int8 else f"{args.model}-onnx"
+    out = args.out or os.path.join('models', f"{name.replace('-onnx', '')}.onnx")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+
+    fp32 = out if not args.int8 else os.path.splitext(out)[0] + '.fp32.onnx'
+    export(args.model, fp32, args.opset)
+    if args.int8:
+        quantize(fp32, out)
+
+    print(f"[EXPORT] agreement with the Keras model: "
+          f"{agreement(_build_embedding_net(args.model), OnnxEmbeddingNet(out), spec.input_size):.4f} "
+          f"(mean cosine, 1.0 = identical)")
+    if name not in MODELS or MODELS[name].path != out:
+        register_model(name, spec.input_size, spec.normalization, spec.dim, spec.threshold, out)
+        print(f"[EXPORT] Add to core_recognition.MODELS:\n"
+              f"    '{name}': {MODELS[name]!r},")
+    print(f"[EXPORT] Use it with model='{name}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,546 @@
+# gallery.py
+import copy
+import json
+import threading
+from collections import namedtuple
+import numpy as np
+
+Match = namedtuple('Match', ['name', 'class_name', 'score', 'margin'])
+
+
+def l2_normalize(vectors):
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def exact_search(matrix, queries, k):
+    """Brute-force top-k over normalised rows: one matrix product."""
+    sims = queries @ matrix.T
+    if k < len(matrix):
+        rows = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        rows = np.broadcast_to(np.arange(len(matrix)), sims.shape)
+    top = np.take_along_axis(sims, rows, axis=1)
+    order = np.argsort(-top, axis=1)
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+class IVFIndex:
+    """Inverted-file ANN index in pure NumPy.
+
+    Rows are bucketed by spherical k-means; a query scans only its ``nprobe``
+    closest cells, so ``nprobe`` trades recall for latency.  Galleries smaller
+    than ``min_size`` keep using exact search.
+    """
+
+    def __init__(self, nlist=None, nprobe=8, min_size=2048, iterations=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.assign = np.zeros(0, np.int32)
+        self.trained_size = 0
+        self._lists = None
+
+    def ready(self, size):
+        return self.centroids is not None and size >= self.min_size
+
+    def needs_training(self, size):
+        if size < self.min_size:
+            return False
+        return self.centroids is None or size > 4 * self.trained_size
+
+    def train(self, matrix):
+        n = len(matrix)
+        nlist = min(n, self.nlist or max(1, int(4 * np.sqrt(n))))
+        rng = np.random.default_rng(self.seed)
+        sample = matrix[rng.choice(n, min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = self._nearest(sample, centroids)
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            filled = counts > 0
+            sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+            centroids[filled] = l2_normalize(sums)
+            # re-seed empty cells from random points
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(len(sample), len(empty))]
+        self.centroids = centroids
+        self.assign = self._nearest(matrix, centroids)
+        self.trained_size = n
+        self._build_lists(matrix)
+
+    @staticmethod
+    def _nearest(vectors, centroids, chunk=8192):
+        out = np.empty(len(vectors), np.int32)
+        for i in range(0, len(vectors), chunk):
+            out[i:i + chunk] = np.argmax(vectors[i:i + chunk] @ centroids.T, axis=1)
+        return out
+
+    # --- kept in sync by Gallery mutations ---
+    def add(self, row, vec):
+        if self.centroids is None:
+            return
+        if row >= len(self.assign):
+            self.assign = np.resize(self.assign, max(row + 1, 2 * len(self.assign)))
+        self.assign[row] = np.argmax(self.centroids @ vec)
+        self._lists = None
+
+    def move(self, src, dst):
+        if self.centroids is not None:
+            self.assign[dst] = self.assign[src]
+            self._lists = None
+
+    def pop(self):
+        self._lists = None
+
+    def cell_order(self, size):
+        """``(order, offsets)``: rows sorted by cell; cell ``c`` is ``order[offsets[c]:offsets[c + 1]]``."""
+        labels = self.assign[:size]
+        order = np.argsort(labels, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=len(self.centroids)))))
+        return order, offsets
+
+    def _build_lists(self, matrix):
+        order, offsets = self.cell_order(len(matrix))
+        # cell-major copy so every probed cell is one contiguous slice
+        self._lists = (order, offsets, matrix[order])
+
+    def attach(self, centroids, offsets, matrix):
+        """Search ``matrix`` whose rows are already cell-major (see cell_order), without copying it."""
+        offsets = np.asarray(offsets, np.int64)
+        self.centroids = centroids
+        self.assign = np.repeat(np.arange(len(centroids), dtype=np.int32), np.diff(offsets))
+        self.trained_size = len(matrix)
+        self._lists = (np.arange(len(matrix)), offsets, matrix)
+
+    def search(self, matrix, queries, k, nprobe=None):
+        if self._lists is None or len(self._lists[0]) != len(matrix):
+            self._build_lists(matrix)
+        order, offsets, packed = self._lists
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        cells = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        rows = np.full((len(queries), k), -1, np.int64)
+        scores = np.full((len(queries), k), -np.inf, np.float32)
+        for qi, q in enumerate(queries):
+            spans = [(offsets[c], offsets[c + 1]) for c in cells[qi] if offsets[c + 1] > offsets[c]]
+            if not spans:
+                continue
+            cand = np.concatenate([order[a:b] for a, b in spans])
+            sims = np.concatenate([packed[a:b] @ q for a, b in spans])
+            kk = min(k, len(cand))
+            top = np.argpartition(-sims, kk - 1)[:kk] if kk < len(cand) else np.arange(len(cand))
+            top = top[np.argsort(-sims[top])]
+            rows[qi, :kk] = cand[top]
+            scores[qi, :kk] = sims[top]
+        return rows, scores
+
+    def save(self, path, keys):
+        with open(path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, assign=self.assign[:len(keys)],
+                     keys=np.array(json.dumps(keys)), trained_size=self.trained_size)
+
+    def load(self, path, keys, matrix):
+        """Restore a saved index; rows are re-assigned if the gallery changed since."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                centroids = data['centroids']
+                assign = data['assign']
+                saved_keys = json.loads(str(data['keys']))
+                trained_size = int(data['trained_size'])
+        except (OSError, ValueError, KeyError):
+            return False
+        if centroids.ndim != 2 or centroids.shape[1] != matrix.shape[1]:
+            return False
+        self.centroids = centroids
+        self.trained_size = trained_size
+        if saved_keys == keys:
+            self.assign = assign.astype(np.int32)
+        else:
+            self.assign = self._nearest(matrix, centroids)
+        self._build_lists(matrix)
+        return True
+
+
+class Gallery:
+    """Known faces as one contiguous, L2-normalised float32 matrix.
+
+    Row ``i`` of ``matrix`` belongs to ``names[i]`` / ``classes[i]``, so cosine
+    similarity against the whole gallery is a single matrix product.
+
+    An identity may hold up to ``max_samples`` sample embeddings; its row is
+    their quality-weighted centroid.  ``match`` ranks centroids first and
+    re-scores only the ``rerank`` best identities by their closest sample,
+    so extra samples do not make the search itself any larger.
+    """
+
+    def __init__(self, dim=None, capacity=64, index=None, max_samples=8, rerank=8):
+        self.dim = dim
+        self.index = IVFIndex() if index == 'ivf' else index
+        self.max_samples = max_samples
+        self.rerank = rerank
+        self.names = []
+        self.classes = []
+        self._rows = {}     # (class_name, name) -> row
+        self._samples = {}  # (class_name, name) -> (sample ids, qualities, vectors or None if single)
+        self._multi = set() # identities with 2+ samples, the only ones re-ranked
+        self._size = 0
+        self._matrix = np.zeros((capacity, dim), np.float32) if dim else None
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            return np.zeros((0, 0), np.float32)
+        return self._matrix[:self._size]
+
+    def _reserve(self, extra):
+        need = self._size + extra
+        if need <= len(self._matrix):
+            return
+        grown = np.zeros((max(need, 2 * len(self._matrix)), self.dim), np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def add(self, name, embedding, class_name=None):
+        """Insert or replace one identity with a single sample; returns its row."""
+        self._samples.pop((class_name, name), None)
+        self._multi.discard((class_name, name))
+        return self._set_row(name, class_name, l2_normalize(embedding)[0])
+
+    def _set_row(self, name, class_name, vec):
+        if self._matrix is None:
+            self.dim = len(vec)
+            self._matrix = np.zeros((64, self.dim), np.float32)
+        if len(vec) != self.dim:
+            raise ValueError(f"Embedding has {len(vec)} dims, gallery expects {self.dim}")
+        key = (class_name, name)
+        row = self._rows.get(key)
+        if row is None:
+            self._reserve(1)
+            row = self._size
+            self._size += 1
+            self._rows[key] = row
+            self.names.append(name)
+            self.classes.append(class_name)
+        self._matrix[row] = vec
+        if self.index is not None:
+            self.index.add(row, vec)
+        return row
+
+    def copy(self):
+        """A copy to change while searches carry on over this one.
+
+        Only the row matrix and the bookkeeping containers are duplicated.
+        Sample vectors (always replaced, never written in place) and a
+        trained index's centroids and cell lists are shared until the copy
+        changes them.
+        """
+        other = copy.copy(self)
+        other.names, other.classes = list(self.names), list(self.classes)
+        other._rows, other._samples, other._multi = dict(self._rows), dict(self._samples), set(self._multi)
+        if self._matrix is not None:
+            other._matrix = np.array(self._matrix)
+        if self.index is not None:
+            other.index = copy.copy(self.index)
+            other.index.assign = self.index.assign.copy()
+        return other
+
+    def arrays(self):
+        """``(names, classes, matrix, samples)`` for from_arrays(); ``matrix`` is a view, not a copy."""
+        samples = {self._rows[key]: (list(qualities), vectors)
+                   for key, (_, qualities, vectors) in self._samples.items() if vectors is not None}
+        return list(self.names), list(self.classes), self.matrix, samples
+
+    @classmethod
+    def from_arrays(cls, names, classes, matrix, samples=None, rerank=8, index=None):
+        """A Gallery over existing normalised rows (e.g. a read-only memory map), without copying them.
+
+        ``samples`` maps a row to ``(qualities, vectors)`` for identities with
+        several samples; ``index`` is an IVFIndex already attached to
+        ``matrix``.  Adding to a gallery over a read-only map fails.
+        """
+        gallery = cls(index=index, rerank=rerank)
+        gallery.names, gallery.classes = list(names), list(classes)
+        gallery._size = len(gallery.names)
+        if gallery._size:
+            gallery.dim = matrix.shape[1]
+            gallery._matrix = matrix
+        gallery._rows = {(c, n): row for row, (c, n) in enumerate(zip(gallery.classes, gallery.names))}
+        for row, (qualities, vectors) in (samples or {}).items():
+            key = (gallery.classes[row], gallery.names[row])
+            gallery._samples[key] = ([None] * len(qualities), list(qualities), vectors)
+            gallery._multi.add(key)
+        return gallery
+
+    def samples(self, name, class_name=None):
+        """``[(sample_id, quality)]`` of one identity."""
+        key = (class_name, name)
+        if key in self._samples:
+            ids, quality, _ = self._samples[key]
+            return list(zip(ids, quality))
+        return [(None, 1.0)] if key in self._rows else []
+
+    def _sample_lists(self, key):
+        if key in self._samples:
+            ids, qualities, vectors = self._samples[key]
+            if vectors is None:
+                vectors = [self._matrix[self._rows[key]].copy()]
+            return list(ids), list(qualities), list(vectors)
+        if key in self._rows:
+            return [None], [1.0], [self._matrix[self._rows[key]].copy()]
+        return [], [], []
+
+    def add_sample(self, name, embedding, class_name=None, quality=1.0, sample_id=None):
+        """Add (or replace, by ``sample_id``) one sample of an identity and refresh its centroid.
+
+        Beyond ``max_samples`` the lowest-quality sample is dropped.  Returns
+        False if the new sample was itself the one dropped.
+        """
+        key = (class_name, name)
+        vec = l2_normalize(embedding)[0]
+        ids, qualities, vectors = self._sample_lists(key)
+        if sample_id is not None and sample_id in ids:
+            i = ids.index(sample_id)
+            del ids[i], qualities[i], vectors[i]
+        ids.append(sample_id)
+        qualities.append(float(quality))
+        vectors.append(vec)
+        kept = True
+        while len(ids) > max(1, self.max_samples):
+            worst = int(np.argmin(qualities))
+            kept = kept and worst != len(ids) - 1
+            del ids[worst], qualities[worst], vectors[worst]
+        self._store_samples(name, class_name, ids, qualities, vectors)
+        return kept
+
+    def remove_sample(self, name, class_name=None, sample_id=None):
+        """Drop one sample; the identity goes when its last sample does."""
+        ids, qualities, vectors = self._sample_lists((class_name, name))
+        if sample_id not in ids:
+            return False
+        i = ids.index(sample_id)
+        del ids[i], qualities[i], vectors[i]
+        self._store_samples(name, class_name, ids, qualities, vectors)
+        return True
+
+    def _store_samples(self, name, class_name, ids, qualities, vectors):
+        key = (class_name, name)
+        if not ids:
+            self.remove(name, class_name)
+            return
+        vectors = np.asarray(vectors, np.float32)
+        if len(ids) == 1:
+            self._samples[key] = (ids, qualities, None)
+            self._multi.discard(key)
+        else:
+            self._samples[key] = (ids, qualities, vectors)
+            self._multi.add(key)
+        weights = np.maximum(np.asarray(qualities, np.float32), 1e-3)
+        self._set_row(name, class_name, l2_normalize(weights @ vectors)[0])
+
+    def add_many(self, names, embeddings, classes=None):
+        classes = classes or [None] * len(names)
+        for name, emb, cls in zip(names, embeddings, classes):
+            self.add(name, emb, cls)
+
+    def remove(self, name, class_name=None):
+        """Drop one identity in O(1) by moving the last row into its slot."""
+        row = self._rows.pop((class_name, name), None)
+        if row is None:
+            return False
+        self._samples.pop((class_name, name), None)
+        self._multi.discard((class_name, name))
+        last = self._size - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self.names[row] = self.names[last]
+            self.classes[row] = self.classes[last]
+            self._rows[(self.classes[row], self.names[row])] = row
+            if self.index is not None:
+                self.index.move(last, row)
+        if self.index is not None:
+            self.index.pop()
+        self.names.pop()
+        self.classes.pop()
+        self._size = last
+        return True
+
+    def keys(self):
+        return [[c, n] for c, n in zip(self.classes, self.names)]
+
+    def build_index(self, force=False):
+        """(Re)train the ANN index once the gallery is big enough."""
+        if self.index is not None and (force or self.index.needs_training(self._size)):
+            self.index.train(self.matrix)
+            return True
+        return False
+
+    def search(self, queries, k=1, nprobe=None):
+        """Top-k rows and cosine similarities for each query, best first.
+
+        With an ANN index, rows the index could not fill are ``-1``.
+        """
+        queries = l2_normalize(queries)
+        k = min(k, self._size)
+        if k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if self.index is not None and self.index.ready(self._size):
+            return self.index.search(self.matrix, queries, k, nprobe)
+        return exact_search(self.matrix, queries, k)
+
+    def _rerank(self, queries, rows, scores):
+        """Re-score multi-sample identities by their closest sample and re-sort."""
+        scores = scores.copy()
+        for q, (q_rows, q_scores) in enumerate(zip(rows, scores)):
+            for j, r in enumerate(q_rows):
+                if r < 0:
+                    continue
+                entry = self._samples.get((self.classes[r], self.names[r]))
+                if entry is not None and entry[2] is not None:
+                    q_scores[j] = max(q_scores[j], float(np.max(entry[2] @ queries[q])))
+        order = np.argsort(-scores, axis=1, kind='stable')
+        return np.take_along_axis(rows, order, 1), np.take_along_axis(scores, order, 1)
+
+    def match(self, queries, k=1, nprobe=None):
+        """Per query, up to ``k`` Matches; ``margin`` is the lead over the next candidate."""
+        if self._multi:
+            queries = l2_normalize(queries)
+            rows, scores = self.search(queries, max(k + 1, self.rerank), nprobe)
+            rows, scores = self._rerank(queries, rows, scores)
+        else:
+            rows, scores = self.search(queries, k + 1, nprobe)
+        results = []
+        for q_rows, q_scores in zip(rows, scores):
+            matches = []
+            for i in range(min(k, len(q_rows))):
+                r = q_rows[i]
+                if r < 0:
+                    break
+                nxt = q_scores[i + 1] if i + 1 < len(q_scores) and q_rows[i + 1] >= 0 else 0.0
+                matches.append(Match(self.names[r], self.classes[r],
+                                     float(q_scores[i]), float(q_scores[i] - nxt)))
+            results.append(matches)
+        return results
+
+
+def merge_matches(per_shard, k):
+    """Merge per-shard Match lists for one query into a single top-k list."""
+    pool = sorted((m for matches in per_shard for m in matches), key=lambda m: -m.score)
+    merged = []
+    for i, m in enumerate(pool[:k]):
+        nxt = pool[i + 1].score if i + 1 < len(pool) else 0.0
+        merged.append(m._replace(margin=m.score - nxt))
+    return merged
+
+
+class ShardedGallery:
+    """One Gallery per class folder, each loaded on first use.
+
+    ``loader(class_name, gallery)`` fills a fresh Gallery for that class and
+    returns False when there is no such class; a missing class that loaded
+    nothing is searched as empty but not remembered, so a mistyped name
+    never becomes a known class.  A live session searches only its class; the full gallery is the merge of
+    every shard.  ``listeners`` are called with the class name whenever a
+    shard is loaded or replaced (see shared_gallery.GalleryPublisher).
+    """
+
+    def __init__(self, loader, index=None):
+        self._loader = loader
+        self._index = index
+        self.known_classes = []
+        self.shards = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(g) for g in self.shards.values())
+
+    def register(self, class_name):
+        if class_name not in self.known_classes:
+            self.known_classes.append(class_name)
+
+    def shard(self, class_name):
+        gallery = self.shards.get(class_name)
+        if gallery is not None:
+            return gallery
+        with self._lock:
+            loaded = class_name not in self.shards
+            if loaded:
+                gallery = Gallery(index=self._index)
+                if self._loader(class_name, gallery) is False and not len(gallery):
+                    return gallery
+                self.register(class_name)
+                self.shards[class_name] = gallery
+            gallery = self.shards[class_name]
+        if loaded:
+            self._notify(class_name)
+        return gallery
+
+    def _notify(self, class_name):
+        for listener in list(self.listeners):
+            listener(class_name)
+
+    def load_all(self):
+        for class_name in list(self.known_classes):
+            self.shard(class_name)
+
+    def update_shard(self, class_name, fn):
+        """Apply ``fn(gallery)`` to a copy of the shard and swap the copy in.
+
+        Searches hold on to the shard they started with, so they never see a
+        half-applied change.
+        """
+        self.shard(class_name)
+        with self._lock:
+            current = self.shards.get(class_name)
+            gallery = Gallery(index=self._index) if current is None else current.copy()
+            out = fn(gallery)
+            self.register(class_name)       # enrolling can create a class
+            self.shards[class_name] = gallery
+        self._notify(class_name)
+        return out
+
+    def add(self, name, embedding, class_name):
+        return self.update_shard(class_name, lambda g: g.add(name, embedding, class_name))
+
+    def remove(self, name, class_name):
+        return self.update_shard(class_name, lambda g: g.remove(name, class_name))
+
+    def match(self, queries, k=1, class_name=None, fallback=False, threshold=0.0):
+        """Search one class's shard, or every shard when ``class_name`` is None.
+
+        With ``fallback``, queries whose best score in the class is not above
+        ``threshold`` are retried against the other shards.
+        """
+        queries = l2_normalize(queries)
+        if class_name is None:
+            names = list(self.known_classes)
+        else:
+            names = [class_name]
+        per_shard = [self.shard(c).match(queries, k + 1) for c in names]
+        results = [merge_matches([s[i] for s in per_shard], k) for i in range(len(queries))]
+        if class_name is None or not fallback:
+            return results
+
+        retry = [i for i, top in enumerate(results) if not top or top[0].score <= threshold]
+        others = [c for c in self.known_classes if c != class_name]
+        if retry and others:
+            sub = queries[retry]
+            per_shard = [self.shard(c).match(sub, k + 1) for c in others]
+            for j, i in enumerate(retry):
+                results[i] = merge_matches([results[i]] + [s[j] for s in per_shard], k)
+        return results
@@ -0,0 +1,340 @@
+# metrics.py
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+
+# ==================== SPANS & COUNTERS ====================
+class Histogram:
+    """Rolling window of durations (ms) plus lifetime count/total."""
+
+    def __init__(self, window=1024):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.values.append(ms)
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self):
+        if not self.values:
+            return {'count': self.count}
+        p50, p95, p99 = np.percentile(np.fromiter(self.values, float), [50, 95, 99])
+        return {'count': self.count, 'p50': round(p50, 2), 'p95': round(p95, 2), 'p99': round(p99, 2),
+                'avg': round(self.total_ms / self.count, 2), 'max': round(self.max_ms, 2)}
+
+
+class Metrics:
+    """Process-wide timing spans and counters for the recognition hot path.
+
+    ``with metrics.span('embed'):`` records one duration; ``snapshot()``
+    gives rolling p50/p95/p99 per span.  The same numbers are available as
+    a frame overlay, a periodic log line, a JSON file and a local HTTP
+    endpoint.  ``add_stats('engine', engine.stats)`` adds a component's own
+    stats dict to every snapshot.
+    """
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.enabled = True
+        self._spans = {}
+        self._counters = Counter()
+        self._stats = {}        # name -> callable returning a dict
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._server = None
+        self._reporter = None
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            hist = self._spans.get(name)
+            if hist is None:
+                hist = self._spans[name] = Histogram(self.window)
+            hist.add(seconds * 1000)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def add_stats(self, name, fn):
+        """Include ``fn()`` under ``stats[name]`` in every snapshot (replaces an earlier ``name``)."""
+        with self._lock:
+            self._stats[name] = fn
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._started = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            snap = {'uptime_s': round(time.time() - self._started, 1),
+                    'spans': {k: h.snapshot() for k, h in sorted(self._spans.items())},
+                    'counters': dict(sorted(self._counters.items()))}
+            providers = sorted(self._stats.items())
+        if providers:
+            # called outside the lock: a provider may record metrics itself
+            snap['stats'] = {}
+            for name, fn in providers:
+                try:
+                    snap['stats'][name] = fn()
+                except Exception as e:
+                    snap['stats'][name] = {'error': str(e)}
+        return snap
+
+    # ---------- outputs ----------
+    def log_line(self):
+        snap = self.snapshot()
+        parts = [f"{k} p50 {v['p50']:.1f}/p95 {v['p95']:.1f}/p99 {v['p99']:.1f} ms"
+                 for k, v in snap['spans'].items() if 'p50' in v]
+        parts += [f"{k}={v}" for k, v in snap['counters'].items()]
+        return " | ".join(parts)
+
+    def overlay(self, frame, names=None, origin=(10, 20)):
+        """Draw p50/p95 of the given spans (default: all) onto a frame in place."""
+        snap = self.snapshot()['spans']
+        x, y = origin
+        for name in names or list(snap):
+            v = snap.get(name)
+            if not v or 'p50' not in v:
+                continue
+            text = f"{name}: {v['p50']:.1f} / {v['p95']:.1f} ms"
+            cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3)
+            cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 0), 1)
+            y += 16
+        return frame
+
+    def write(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp, path)
+
+    def start_reporter(self, interval=10.0, path=None, log=True):
+        """Every ``interval`` seconds print a log line and/or rewrite ``path`` as JSON."""
+        if self._reporter is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if log:
+                        print(f"[METRICS] {self.log_line()}")
+                    if path:
+                        self.write(path)
+                except Exception as e:
+                    print(f"[METRICS] report failed: {e}")
+        self._reporter = threading.Thread(target=run, name='metrics-reporter', daemon=True)
+        self._reporter.start()
+
+    def serve(self, port=9108, host='127.0.0.1'):
+        """Serve ``GET /metrics`` (JSON) on localhost; returns the bound port."""
+        if self._server is not None:
+            return self._server.server_address[1]
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        print(f"[METRICS] Serving http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server.server_address[1]
+
+
+metrics = Metrics()
+span = metrics.span
+
+
+# ==================== STARTUP ====================
+class StartupTimer:
+    """Phases of a cold start, timed from when this module was first imported.
+
+    ``with startup.phase('gallery'):`` times one phase; ``mark('ready')``
+    notes a milestone.  Both print a ``[STARTUP]`` line and land in the
+    metrics snapshot as ``startup.<name>`` spans.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []        # (name, seconds taken or None, seconds since origin)
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, time.perf_counter() - start)
+
+    def mark(self, name):
+        self._add(name, None)
+
+    def _add(self, name, seconds):
+        at = self.elapsed()
+        with self._lock:
+            self.events.append((name, seconds, at))
+        metrics.record(f"startup.{name}", at if seconds is None else seconds)
+        took = f"{seconds:.2f}s, " if seconds is not None else ""
+        print(f"[STARTUP] {name}: {took}t+{at:.2f}s")
+
+    def summary(self):
+        with self._lock:
+            return [{'phase': n, 'seconds': None if s is None else round(s, 3), 'at': round(a, 3)}
+                    for n, s, a in self.events]
+
+
+startup = StartupTimer()
+
+
+# ==================== MEMORY ====================
+def memory_usage():
+    """This process's memory in MB.
+
+    ``rss`` is everything resident; ``private`` (Linux only) is the anonymous
+    memory no other process can share: the real cost of one more worker.
+    Shared and file-backed mappings (models loaded before fork, a shared
+    gallery) count in ``rss`` but not in ``private``.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            kb = {k: int(v.split()[0]) for k, v in (line.split(':', 1) for line in f if ':' in line
+                                                    and line.split(':', 1)[1].strip().endswith('kB'))}
+        return {'rss': round(kb['Rss'] / 1024, 1), 'pss': round(kb['Pss'] / 1024, 1),
+                'private': round(kb['Anonymous'] / 1024, 1)}
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import resource     # peak, not current: KB on Linux, bytes on macOS
+    except ImportError:
+        return {}
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'rss': round(peak / (1 << 20 if sys.platform == 'darwin' else 1024), 1)}
+
+
+# ==================== PROFILING ====================
+_IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py', 'socketserver.py')
+
+class FrameProfiler:
+    """Opt-in profiling of a fixed number of frames; call ``frame()`` once per frame.
+
+    ``mode='cprofile'`` profiles the calling thread; ``mode='sample'``
+    samples the stacks of every thread (capture, model and GUI threads
+    alike) every ``interval`` seconds.  The report is printed and written
+    to ``path`` when the frames are done.
+    """
+
+    def __init__(self, frames=0, mode='cprofile', path='profile.txt', interval=0.005, top=25):
+        self.frames = frames
+        self.mode = mode
+        self.path = path
+        self.interval = interval
+        self.top = top
+        self.done = frames <= 0
+        self._seen = 0
+        self._profile = None
+        self._samples = Counter()
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def frame(self):
+        if self.done:
+            return
+        if self._seen == 0:
+            self._start()
+        self._seen += 1
+        if self._seen > self.frames:
+            self._finish()
+
+    def _start(self):
+        print(f"[PROFILE] {self.mode} over {self.frames} frames...")
+        if self.mode == 'sample':
+            self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+            self._thread.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                code = frame.f_code
+                if tid == me or os.path.basename(code.co_filename) in _IDLE_FILES:
+                    continue        # this thread, or one parked on a lock/queue/socket
+                self._samples[f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}"] += 1
+                stack = []
+                while frame is not None and len(stack) < 8:
+                    stack.append(frame.f_code.co_name)
+                    frame = frame.f_back
+                self._stacks[" < ".join(stack)] += 1
+
+    def _finish(self):
+        self.done = True
+        out = io.StringIO()
+        if self.mode == 'sample':
+            self._stop.set()
+            self._thread.join()
+            total = sum(self._samples.values()) or 1
+            out.write(f"{total} samples\n\nhottest lines:\n")
+            for where, n in self._samples.most_common(self.top):
+                out.write(f"{100.0 * n / total:6.1f}%  {where}\n")
+            out.write("\nhottest stacks (innermost first):\n")
+            for stack, n in self._stacks.most_common(self.top):
+                out.write(f"{100.0 * n / total:6.1f}%  {stack}\n")
+        else:
+            self._profile.disable()
+            pstats.Stats(self._profile, stream=out).sort_stats('cumulative').print_stats(self.top)
+        report = out.getvalue()
+        with open(self.path, 'w') as f:
+            f.write(report)
+        print(report)
+        print(f"[PROFILE] Report written to {self.path}")
@@ -0,0 +1,120 @@
+# motion.py
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+# skip: nothing changed, reuse the last detections; rois: changed regions only
+# (full-resolution boxes), or None for a full-frame detection
+Motion = namedtuple('Motion', ['skip', 'rois', 'changed'])
+
+FULL = Motion(False, None, 1.0)
+
+
+class MotionGate:
+    """Cheap scene-change gate in front of face detection.
+
+    Frames are shrunk to ``width`` px grayscale, blurred, and compared
+    with a slowly adapting background.  The change is scored per cell of a
+    ``grid`` (fraction of pixels that moved); if no cell passes
+    ``cell_threshold`` detection is skipped, if a few do only their regions
+    are searched, and if more than ``full_fraction`` of the frame changed
+    (people standing up, lights switched on) the whole frame is.  A full
+    detection is forced at least every ``refresh_interval`` seconds so
+    nothing that slipped into the background is missed for long.
+
+    ``check()`` keeps state and must be called with frames in order (the
+    capture thread).
+    """
+
+    def __init__(self, width=160, grid=(8, 6), pixel_threshold=20, cell_threshold=0.03,
+                 full_fraction=0.4, refresh_interval=2.0, learning_rate=0.05, margin=1):
+        self.width = width
+        self.grid = grid
+        self.pixel_threshold = pixel_threshold
+        self.cell_threshold = cell_threshold
+        self.full_fraction = full_fraction
+        self.refresh_interval = refresh_interval
+        self.learning_rate = learning_rate
+        self.margin = margin
+        self.counts = {'frames': 0, 'skipped': 0, 'regions': 0, 'full': 0, 'refresh': 0}
+        self._background = None
+        self._last_full = float('-inf')
+
+    def reset(self):
+        """Forget the background (camera moved, class changed); the next frame is a full detection."""
+        self._background = None
+
+    def check(self, frame):
+        with metrics.span('motion'):
+            decision = self._check(frame)
+        self.counts['frames'] += 1
+        kind = 'skipped' if decision.skip else ('full' if decision.rois is None else 'regions')
+        self.counts[kind] += 1
+        metrics.incr(f'motion.{kind}')
+        return decision
+
+    def _check(self, frame):
+        H, W = frame.shape[:2]
+        h = max(1, round(H * self.width / W))
+        small = cv2.resize(frame, (self.width, h), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+
+        now = time.monotonic()
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray
+            self._last_full = now
+            return FULL
+        moved = (cv2.absdiff(gray, self._background) > self.pixel_threshold).astype(np.float32)
+        cv2.accumulateWeighted(gray, self._background, self.learning_rate)
+
+        # mean of the mask over each grid cell = fraction of that cell that changed
+        scores = cv2.resize(moved, self.grid, interpolation=cv2.INTER_AREA)
+        hot = scores > self.cell_threshold
+        changed = float(hot.mean())
+        if now - self._last_full >= self.refresh_interval:
+            self._last_full = now
+            self.counts['refresh'] += 1
+            return Motion(False, None, changed)
+        if not hot.any():
+            return Motion(True, [], changed)
+        if changed > self.full_fraction:
+            self._last_full = now
+            return Motion(False, None, changed)
+        return Motion(False, self._regions(hot, W, H), changed)
+
+    def _regions(self, hot, W, H):
+        """Bounding boxes (full resolution) of connected groups of changed cells, grown by ``margin`` cells."""
+        cols, rows = self.grid
+        cw, ch = W / cols, H / rows
+        n, _, stats, _ = cv2.connectedComponentsWithStats(hot.astype(np.uint8), connectivity=8)
+        rois = []
+        for x, y, w, h, _ in stats[1:n]:
+            x0, y0 = max(0, x - self.margin), max(0, y - self.margin)
+            x1, y1 = min(cols, x + w + self.margin), min(rows, y + h + self.margin)
+            rois.append((int(x0 * cw), int(y0 * ch), int((x1 - x0) * cw), int((y1 - y0) * ch)))
+        return rois
+
+    def stats(self):
+        frames = self.counts['frames'] or 1
+        return dict(self.counts, skip_ratio=round(self.counts['skipped'] / frames, 3),
+                    region_ratio=round(self.counts['regions'] / frames, 3))
+
+
+def _inside(box, roi):
+    x, y, w, h = box[:4]
+    cx, cy = x + w / 2, y + h / 2
+    rx, ry, rw, rh = roi[:4]
+    return rx <= cx < rx + rw and ry <= cy < ry + rh
+
+
+def merge_boxes(previous, found, rois, iou_threshold=0.3):
+    """Detections after searching only ``rois``: the new ones, plus earlier boxes
+    outside every roi that none of the new ones replaces."""
+    from tracking import iou
+    kept = [b for b in previous if not any(_inside(b, r) for r in rois)
+            and all(iou(b[:4], f[:4]) < iou_threshold for f in found)]
+    return kept + list(found)
@@ -0,0 +1,159 @@
+# multi_camera.py
+"""Serve several classrooms from one machine: one detector and model, many streams.
+
+    python multi_camera.py 0=Class_10A 1=Class_10B lectures/monday.mp4=Class_11A --loop
+
+While running, type ``add <device>=<class>``, ``remove <id>``, ``stats`` or ``quit``.
+"""
+import argparse
+import sys
+import threading
+import time
+
+from attendance import AttendanceLog, PresenceCache
+from database import init_db, AttendanceWriter, present_students
+from motion import MotionGate
+from pipeline import MultiSourceEngine, Source
+from tracking import FaceTracker
+
+
+class AttendanceRouter:
+    """Routes each stream's confirmed identities to the attendance session of its class."""
+
+    def __init__(self, db_path=None, csv_path='AttendanceLogs/Attendance_{date}.csv'):
+        init_db(db_path)
+        self.db_path = db_path
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self.log = AttendanceLog(csv_path)
+        self.writer = AttendanceWriter(db_path, on_inserted=self._inserted, on_failed=self._failed)
+
+    def session(self, class_name):
+        with self._lock:
+            session = self.sessions.get(class_name)
+            if session is None:
+                session = PresenceCache(seed=lambda date_str: present_students(date_str, self.db_path))
+                session.start_session(class_name)
+                self.sessions[class_name] = session
+            return session
+
+    def __call__(self, source, marks):
+        session = self.session(source.class_name)
+        for (x, y, w, h, name, score, class_name) in marks:
+            if name not in ["Unknown", "Error"] and session.check_and_add((name, class_name)):
+                self.writer.mark(name, class_name)
+
+    def _sessions(self):
+        with self._lock:
+            return list(self.sessions.values())
+
+    def _inserted(self, rows):
+        sessions = self._sessions()
+        for name, class_name, date_str, time_str in rows:
+            for session in sessions:
+                session.add((name, class_name), date_str)
+            print(f"[MARKED] {name} ({class_name}) @ {time_str}")
+            self.log.mark(name, class_name=class_name)
+
+    def _failed(self, events):
+        sessions = self._sessions()
+        for name, class_name, _ in events:
+            for session in sessions:
+                session.release((name, class_name))
+
+    def stats(self):
+        with self._lock:
+            return {c: s.stats() for c, s in self.sessions.items()}
+
+    def close(self):
+        self.writer.close()
+        self.log.close()
+
+
+def parse_source(spec, loop=False, motion=True, threshold=0.55):
+    """``device=class`` -> Source; numeric devices are camera indexes.
+
+    ``threshold`` is the recognizer's match threshold: the tracker re-checks
+    confirmed faces scoring below it.
+    """
+    device, _, class_name = spec.rpartition('=')
+    if not device:
+        device, class_name = class_name, None
+    device = int(device) if device.isdigit() else device
+    return Source(f"{class_name or 'all'}:{device}", device, class_name,
+                  tracker=FaceTracker(min_score=threshold), full_detect_every=5, loop=loop,
+                  motion_gate=MotionGate() if motion else None)
+
+
+def print_stats(engine, router):
+    stats = engine.stats()
+    for sid, s in stats.pop('sources').items():
+        print(f"[STREAM] {sid:<28} capture {s['capture']['fps']:5.1f} fps  "
+              f"latency avg {s['latency']['avg_ms']:7.1f} ms  max {s['latency']['max_ms']:7.1f} ms  "
+              f"processed {s['latency']['count']}"
+              + (f"  motion skip {s['motion']['skip_ratio']:.0%}" if 'motion' in s else ""))
+    print(f"[ENGINE] {stats}")
+    print(f"[SESSIONS] {router.stats()}")
+
+
+def command_loop(engine, loop, motion, stop, want_stats):
+    for line in sys.stdin:
+        cmd, _, arg = line.strip().partition(' ')
+        try:
+            if cmd == 'add':
+                source = parse_source(arg, loop, motion, engine.recognizer.threshold)
+                print(f"[STREAM] Added {engine.add_source(source).id}")
+            elif cmd == 'remove':
+                print(f"[STREAM] Removed {arg}" if engine.remove_source(arg) else f"[STREAM] No source {arg}")
+            elif cmd == 'stats':
+                want_stats.set()
+            elif cmd == 'quit':
+                break
+        except Exception as e:
+            print(f"[ERROR] {e}")
+    stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-classroom attendance on one engine")
+    parser.add_argument('sources', nargs='+', help="device=class (camera index, URL or video file)")
+    parser.add_argument('--loop', action='store_true', help="restart video files when they end")
+    parser.add_argument('--model', default='VGG-Face', help="a core_recognition.MODELS entry")
+    parser.add_argument('--detector', default='mtcnn')
+    parser.add_argument('--detect-scale', type=float, default=0.5)
+    parser.add_argument('--detect-workers', type=int, default=2)
+    parser.add_argument('--max-batch', type=int, default=8, help="frames embedded together")
+    parser.add_argument('--no-motion', action='store_true', help="detect on every frame, moving or not")
+    parser.add_argument('--stats-every', type=float, default=10.0)
+    parser.add_argument('--db', default=None)
+    parser.add_argument('--csv', default='AttendanceLogs/Attendance_{date}.csv')
+    args = parser.parse_args()
+
+    from core_recognition import FaceRecognizer
+    recognizer = FaceRecognizer(model=args.model, detector=args.detector, detect_scale=args.detect_scale)
+    router = AttendanceRouter(args.db, args.csv)
+    engine = MultiSourceEngine(recognizer, on_results=router, queue_size=2 * len(args.sources) + 2,
+                               detect_workers=args.detect_workers, max_batch=args.max_batch)
+    for spec in args.sources:
+        engine.add_source(parse_source(spec, args.loop, not args.no_motion, recognizer.threshold))
+    engine.start()
+    print(f"[ENGINE] Serving {len(engine.sources)} stream(s)")
+
+    stop, want_stats = threading.Event(), threading.Event()
+    threading.Thread(target=command_loop, args=(engine, args.loop, not args.no_motion, stop, want_stats), daemon=True).start()
+    last = time.monotonic()
+    try:
+        while not stop.wait(0.5):
+            if want_stats.is_set() or time.monotonic() - last >= args.stats_every:
+                want_stats.clear()
+                last = time.monotonic()
+                print_stats(engine, router)
+    except KeyboardInterrupt:
+        pass
+    engine.stop()
+    router.close()
+    print_stats(engine, router)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,657 @@
+# pipeline.py
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+from motion import merge_boxes
+
+
+# ==================== QUEUES ====================
+class DropOldestQueue:
+    """Bounded, thread-safe queue; a put on a full queue discards the oldest item."""
+
+    def __init__(self, maxsize=2):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Oldest item, or None once closed (or on timeout)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            return self._items.popleft() if self._items else None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class LatestSlot:
+    """Holds only the newest value; readers never see stale backlog."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self.seq = 0
+
+    def put(self, value):
+        with self._lock:
+            self._value = value
+            self.seq += 1
+
+    def get(self):
+        with self._lock:
+            return self._value, self.seq
+
+
+class FrameSlot(LatestSlot):
+    """LatestSlot for BGR frames that renders into a preallocated RGB display array.
+
+    Producers only swap a reference; ``render()`` runs on the display thread
+    at display rate and converts just the newest frame, writing into buffers
+    that are reused as long as the frame size does not change.  Frames that
+    were replaced before being shown are counted in ``skipped``.
+    """
+
+    def __init__(self, size=None):
+        super().__init__()
+        self.size = size            # (width, height) of the display, None = frame size
+        self.shown_seq = 0
+        self.shown = 0
+        self.skipped = 0
+        self._resized = None
+        self._display = None
+
+    def render(self):
+        """``(rgb_array, seq)`` if a new frame arrived since the last call, else ``(None, seq)``.
+
+        The array is reused by the next call; copy it to keep it.
+        """
+        frame, seq = self.get()
+        if frame is None or seq == self.shown_seq:
+            return None, seq
+        self.skipped += seq - self.shown_seq - 1
+        self.shown_seq = seq
+        self.shown += 1
+
+        w, h = self.size or (frame.shape[1], frame.shape[0])
+        if self._display is None or self._display.shape[:2] != (h, w):
+            self._resized = np.empty((h, w, 3), np.uint8)
+            self._display = np.empty((h, w, 3), np.uint8)
+        with metrics.span('gui.convert'):
+            src = frame
+            if frame.shape[:2] != (h, w):
+                src = cv2.resize(frame, (w, h), dst=self._resized)
+            cv2.cvtColor(src, cv2.COLOR_BGR2RGB, dst=self._display)
+        return self._display, seq
+
+    def snapshot(self):
+        return {'published': self.seq, 'shown': self.shown, 'skipped': self.skipped}
+
+
+# ==================== STAGES ====================
+class StageStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.last_ms = 0.0
+        self.avg_ms = 0.0       # exponential moving average
+        self.max_ms = 0.0
+        self._started = time.perf_counter()
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            self.count += 1
+            self.last_ms = ms
+            self.avg_ms = ms if self.count == 1 else 0.9 * self.avg_ms + 0.1 * ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._started
+            return {'count': self.count, 'fps': self.count / elapsed if elapsed else 0.0,
+                    'last_ms': round(self.last_ms, 2), 'avg_ms': round(self.avg_ms, 2),
+                    'max_ms': round(self.max_ms, 2)}
+
+
+class Stage:
+    """``workers`` threads taking packets from ``inbox``, applying ``fn`` and forwarding the result.
+
+    ``fn`` returns the packet to pass on, or None to drop it.
+    """
+
+    def __init__(self, name, fn, inbox, outbox=None, workers=1):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stats = StageStats()
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+                         for i in range(workers)]
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+
+    def join(self, timeout=None):
+        for t in self._threads:
+            t.join(timeout)
+
+    def _run(self):
+        while True:
+            packet = self.inbox.get()
+            if packet is None:
+                break
+            start = time.perf_counter()
+            try:
+                out = self.fn(packet)
+            except Exception as e:
+                print(f"[PIPELINE] {self.name} failed: {e}")
+                continue
+            self.stats.record(time.perf_counter() - start)
+            metrics.record(f"stage.{self.name}", time.perf_counter() - start)
+            if out is not None and self.outbox is not None:
+                self.outbox.put(out)
+
+
+class BatchStage(Stage):
+    """Stage whose ``fn`` takes a list: whatever is queued (up to ``max_batch``) is processed together.
+
+    ``fn`` returns the packets to pass on.
+    """
+
+    def __init__(self, name, fn, inbox, outbox=None, workers=1, max_batch=8):
+        super().__init__(name, fn, inbox, outbox, workers)
+        self.max_batch = max_batch
+
+    def _run(self):
+        while True:
+            packet = self.inbox.get()
+            if packet is None:
+                break
+            batch = [packet]
+            while len(batch) < self.max_batch and len(self.inbox):
+                packet = self.inbox.get(timeout=0)
+                if packet is None:
+                    break
+                batch.append(packet)
+            start = time.perf_counter()
+            try:
+                out = self.fn(batch)
+            except Exception as e:
+                print(f"[PIPELINE] {self.name} failed: {e}")
+                continue
+            self.stats.record(time.perf_counter() - start)
+            metrics.record(f"stage.{self.name}", time.perf_counter() - start)
+            if self.outbox is not None:
+                for item in out:
+                    self.outbox.put(item)
+
+
+# ==================== PROCESS-POOL WORKERS ====================
+_worker_recognizer = None
+
+def _init_worker(recognizer_kwargs):
+    global _worker_recognizer
+    from core_recognition import FaceRecognizer
+    _worker_recognizer = FaceRecognizer(**recognizer_kwargs)
+
+def _worker_detect(frame, rois=None):
+    return _worker_recognizer.detect(frame, rois)
+
+def _worker_identify(frame, boxes, class_name, fallback):
+    return _worker_recognizer.identify(frame, boxes, class_name, fallback)
+
+
+# ==================== ENGINE ====================
+def gated_detect(detect, frame, motion, rois, last_boxes):
+    """``detect(frame, rois)`` as far as the motion gate's verdict needs it.
+
+    Nothing changed: the last boxes stand.  Some regions changed: only
+    they (and ``rois``, e.g. around tracks) are searched, and earlier boxes
+    elsewhere are kept.
+    """
+    if motion is None or motion.rois is None:
+        return detect(frame, rois)
+    if motion.skip:
+        return last_boxes
+    rois = (rois or []) + motion.rois
+    return merge_boxes(last_boxes, detect(frame, rois), rois)
+
+
+def annotate(frame, results):
+    for (x, y, w, h, name, score, _) in results:
+        known = name not in ["Unknown", "Error"]
+        color = (0, 255, 0) if known else (0, 0, 255)
+        cv2.rectangle(frame, (x, y), (x+w, y+h), color, 3)
+        label = f"{name} ({score:.2f})" if known else name
+        cv2.putText(frame, label, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+    return frame
+
+
+class RecognitionEngine:
+    """capture -> detect -> recognize -> sink, each on its own worker(s).
+
+    Stages are joined by small drop-oldest queues, so a slow model stage
+    discards stale frames instead of letting them pile up.  ``on_results``
+    runs on the sink thread with the results to mark for each frame (with a
+    tracker, only identities confirmed in that frame); the GUI reads only
+    the newest annotated frame via ``latest()``, or ``render()`` for an RGB
+    copy at ``display_size`` converted into a reused buffer.
+
+    ``process_fps`` caps how many captured frames enter the model stages;
+    the rest are read (keeping the camera buffer fresh) and discarded.
+
+    With a tracker and ``full_detect_every`` > 1, frames in between full
+    detections are only searched around the current tracks.  A
+    ``motion_gate`` (motion.MotionGate) skips detection on frames where
+    nothing changed and narrows it to the regions that did.
+
+    With ``processes`` the model stages run in a process pool whose workers
+    each build a FaceRecognizer from ``recognizer_kwargs``.
+    """
+
+    def __init__(self, cap, recognizer=None, on_results=None, queue_size=2,
+                 detect_workers=1, recognize_workers=1, processes=0, recognizer_kwargs=None,
+                 tracker=None, full_detect_every=1, display_size=None, process_fps=None,
+                 motion_gate=None):
+        self.cap = cap
+        self.recognizer = recognizer
+        self.on_results = on_results
+        self.tracker = tracker
+        self.full_detect_every = full_detect_every
+        self.process_fps = process_fps
+        self.throttled = 0
+        self.motion_gate = motion_gate
+        self._last_boxes = []
+        self._last_results = []
+        if tracker is not None:
+            recognize_workers = 1       # tracks must see frames in order
+        self.class_name = None
+        self.fallback = False
+        self.is_running = False
+        self._seq = 0
+        self._published = -1
+        self._publish_lock = threading.Lock()
+        self._output = FrameSlot(display_size)
+        self._pool = None
+        if processes:
+            self._pool = ProcessPoolExecutor(processes, initializer=_init_worker,
+                                             initargs=(recognizer_kwargs or {},))
+
+        self.detect_q = DropOldestQueue(queue_size)
+        self.recognize_q = DropOldestQueue(queue_size)
+        self.sink_q = DropOldestQueue(queue_size)
+        self.capture_stats = StageStats()
+        self.stages = [
+            Stage('detect', self._detect, self.detect_q, self.recognize_q, detect_workers),
+            Stage('recognize', self._recognize, self.recognize_q, self.sink_q, recognize_workers),
+            Stage('sink', self._sink, self.sink_q),
+        ]
+        self._capture_thread = threading.Thread(target=self._capture, name='capture', daemon=True)
+
+    def start(self):
+        self.is_running = True
+        for stage in self.stages:
+            stage.start()
+        self._capture_thread.start()
+
+    def stop(self):
+        self.is_running = False
+        for q in (self.detect_q, self.recognize_q, self.sink_q):
+            q.close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def latest(self):
+        """``(annotated_frame, seq)`` of the newest processed frame."""
+        return self._output.get()
+
+    def render(self):
+        """Newest frame as RGB at the display size (call from the display thread only)."""
+        return self._output.render()
+
+    def stats(self):
+        out = {'capture': dict(self.capture_stats.snapshot(), throttled=self.throttled),
+               'display': self._output.snapshot()}
+        if self.tracker is not None:
+            out['tracker'] = {'tracks': len(self.tracker.tracks),
+                              'embeddings_saved': self.tracker.embeddings_saved}
+        if self.motion_gate is not None:
+            out['motion'] = self.motion_gate.stats()
+        for stage in self.stages:
+            out[stage.name] = dict(stage.stats.snapshot(), queue=len(stage.inbox),
+                                   dropped=stage.inbox.dropped)
+        return out
+
+    # ---------- stage bodies ----------
+    def _capture(self):
+        interval = 1.0 / self.process_fps if self.process_fps else 0.0
+        next_due = 0.0
+        while self.is_running and self.cap.isOpened():
+            start = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                continue
+            self.capture_stats.record(time.perf_counter() - start)
+            if interval:
+                if start < next_due:
+                    self.throttled += 1
+                    continue
+                next_due = max(next_due + interval, start)
+            self._seq += 1
+            motion = self.motion_gate.check(frame) if self.motion_gate is not None else None
+            self.detect_q.put({'seq': self._seq, 'frame': frame, 'motion': motion})
+
+    def _detection_rois(self, seq):
+        if self.tracker is None or seq % self.full_detect_every == 0:
+            return None
+        tracks = list(self.tracker.tracks)
+        return [t.kalman.box() for t in tracks] or None
+
+    def _detect_frame(self, frame, rois):
+        if self._pool is not None:
+            return self._pool.submit(_worker_detect, frame, rois).result()
+        if self.recognizer is not None:
+            return self.recognizer.detect(frame, rois)
+        return []
+
+    def _detect(self, packet):
+        packet['results'] = []
+        rois = self._detection_rois(packet['seq'])
+        packet['boxes'] = gated_detect(self._detect_frame, packet['frame'], packet.get('motion'),
+                                       rois, self._last_boxes)
+        self._last_boxes = packet['boxes']
+        return packet
+
+    def _identify(self, frame, boxes):
+        args = (frame, boxes, self.class_name, self.fallback)
+        if self._pool is not None:
+            return self._pool.submit(_worker_identify, *args).result()
+        return self.recognizer.identify(*args)
+
+    def _recognize(self, packet):
+        if self.tracker is not None:
+            return self._recognize_tracked(packet)
+        motion = packet.get('motion')
+        if motion is not None and motion.skip:
+            # static scene: same faces in the same places as last time
+            packet['results'], packet['marks'] = self._last_results, []
+            return packet
+        if packet['boxes']:
+            packet['results'] = self._identify(packet['frame'], packet['boxes'])
+        packet['marks'] = self._last_results = packet['results']
+        return packet
+
+    def _recognize_tracked(self, packet):
+        tracks = self.tracker.update(packet['boxes'])
+        todo, _ = self.tracker.split(tracks)
+        found = self._identify(packet['frame'], [t.box for t in todo]) if todo else []
+        confirmed = [t for t, r in zip(todo, found)
+                     if self.tracker.assign(t, r[4], r[5], r[6])]
+        packet['results'] = [(*t.box, t.name or "Unknown", t.score, t.class_name) for t in tracks]
+        packet['marks'] = [(*t.box, t.name, t.score, t.class_name) for t in confirmed]
+        return packet
+
+    def _sink(self, packet):
+        if self.on_results is not None and packet.get('marks'):
+            self.on_results(packet['marks'])
+        with self._publish_lock:
+            # parallel workers may finish out of order: never show an older frame
+            if packet['seq'] < self._published:
+                return
+            self._published = packet['seq']
+        self._output.put(annotate(packet['frame'], packet['results']))
+
+
+# ==================== MULTI-SOURCE ====================
+class Source:
+    """One classroom stream: a camera index/URL, or a video file standing in for one.
+
+    Files are played at their recorded frame rate (``loop`` restarts them).
+    Each source keeps its own tracker, output frame and stats.
+    """
+
+    def __init__(self, source_id, device, class_name=None, fallback=False, tracker=None,
+                 full_detect_every=1, loop=False, display_size=None, motion_gate=None):
+        self.id = source_id
+        self.device = device
+        self.class_name = class_name
+        self.fallback = fallback
+        self.tracker = tracker
+        self.full_detect_every = full_detect_every
+        self.motion_gate = motion_gate
+        self.last_boxes = []
+        self.last_results = []
+        self.loop = loop
+        self.is_file = isinstance(device, str) and os.path.isfile(device)
+        self.is_running = False
+        self.seq = 0
+        self.detected = 0                   # seq of the newest frame detected
+        self.tracked = 0                    # seq of the newest frame given to the tracker
+        self.published = -1
+        self._detect_lock = threading.Lock()
+        self.output = FrameSlot(display_size)
+        self.capture_stats = StageStats()
+        self.latency = StageStats()         # capture -> results delivered
+        self._thread = None
+
+    def snapshot(self):
+        out = {'class': self.class_name, 'running': self.is_running,
+               'capture': self.capture_stats.snapshot(), 'latency': self.latency.snapshot(),
+               'display': self.output.snapshot()}
+        if self.tracker is not None:
+            out['tracker'] = {'tracks': len(self.tracker.tracks),
+                              'embeddings_saved': self.tracker.embeddings_saved}
+        if self.motion_gate is not None:
+            out['motion'] = self.motion_gate.stats()
+        return out
+
+
+class MultiSourceEngine:
+    """Many classroom streams sharing one detector and one embedding model.
+
+    Every source has its own capture thread; their frames meet in shared
+    drop-oldest queues, detection runs on ``detect_workers`` threads (one
+    frame of each stream at a time, in order) and the recognize stage
+    embeds the faces of up to ``max_batch`` frames from any mix of streams
+    in one forward pass, each matched against its own class.
+    ``on_results(source, marks)`` runs on the sink thread.  Sources can be
+    added and removed while running.
+    """
+
+    def __init__(self, recognizer, on_results=None, queue_size=16, detect_workers=1, max_batch=8):
+        self.recognizer = recognizer
+        self.on_results = on_results
+        self.sources = {}
+        self.is_running = False
+        self._lock = threading.Lock()
+        self.detect_q = DropOldestQueue(queue_size)
+        self.recognize_q = DropOldestQueue(queue_size)
+        self.sink_q = DropOldestQueue(queue_size)
+        self.stages = [
+            Stage('detect', self._detect, self.detect_q, self.recognize_q, detect_workers),
+            BatchStage('recognize', self._recognize, self.recognize_q, self.sink_q, max_batch=max_batch),
+            Stage('sink', self._sink, self.sink_q),
+        ]
+
+    def start(self):
+        self.is_running = True
+        for stage in self.stages:
+            stage.start()
+        with self._lock:
+            for source in self.sources.values():
+                self._start_source(source)
+
+    def stop(self):
+        self.is_running = False
+        with self._lock:
+            for source in self.sources.values():
+                source.is_running = False
+        for q in (self.detect_q, self.recognize_q, self.sink_q):
+            q.close()
+
+    def add_source(self, source):
+        with self._lock:
+            if source.id in self.sources:
+                raise ValueError(f"Source already exists: {source.id}")
+            self.sources[source.id] = source
+            if self.is_running:
+                self._start_source(source)
+        return source
+
+    def remove_source(self, source_id):
+        """Stop one stream; frames already in flight are still delivered."""
+        with self._lock:
+            source = self.sources.pop(source_id, None)
+        if source is not None:
+            source.is_running = False
+        return source
+
+    def latest(self, source_id):
+        return self.sources[source_id].output.get()
+
+    def render(self, source_id):
+        return self.sources[source_id].output.render()
+
+    def stats(self):
+        with self._lock:
+            out = {'sources': {sid: s.snapshot() for sid, s in self.sources.items()}}
+        for stage in self.stages:
+            out[stage.name] = dict(stage.stats.snapshot(), queue=len(stage.inbox),
+                                   dropped=stage.inbox.dropped)
+        return out
+
+    # ---------- capture ----------
+    def _start_source(self, source):
+        source.is_running = True
+        source._thread = threading.Thread(target=self._capture, args=(source,),
+                                          name=f"capture-{source.id}", daemon=True)
+        source._thread.start()
+
+    def _capture(self, source):
+        cap = cv2.VideoCapture(source.device)
+        if not cap.isOpened():
+            print(f"[PIPELINE] Cannot open source {source.id}: {source.device}")
+            source.is_running = False
+            return
+        fps = cap.get(cv2.CAP_PROP_FPS) if source.is_file else 0
+        interval = 1.0 / fps if fps else 0.0
+        next_due = time.perf_counter()
+        while source.is_running and self.is_running:
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                if source.is_file and source.loop:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                if source.is_file:
+                    break
+                continue
+            source.capture_stats.record(time.perf_counter() - start)
+            source.seq += 1
+            motion = source.motion_gate.check(frame) if source.motion_gate is not None else None
+            self.detect_q.put({'source': source, 'seq': source.seq, 'frame': frame, 't0': start,
+                               'motion': motion})
+            if interval:
+                # play files at their recorded rate, like a live camera
+                next_due = max(next_due + interval, start)
+                time.sleep(max(0.0, next_due - time.perf_counter()))
+        cap.release()
+        source.is_running = False
+
+    # ---------- stage bodies ----------
+    def _detect(self, packet):
+        source = packet['source']
+        # one frame of a stream at a time, in order: last_boxes and the
+        # tracker's ROIs belong to the previous frame.  A frame that another
+        # detect worker overtook is dropped, like a frame the queue drops.
+        with source._detect_lock:
+            if packet['seq'] <= source.detected:
+                return None
+            rois = None
+            if source.tracker is not None and packet['seq'] % source.full_detect_every:
+                rois = [t.kalman.box() for t in list(source.tracker.tracks)] or None
+            detect = self.recognizer.detect if self.recognizer else (lambda frame, rois: [])
+            packet['boxes'] = source.last_boxes = gated_detect(detect, packet['frame'], packet.get('motion'),
+                                                               rois, source.last_boxes)
+            source.detected = packet['seq']
+        return packet
+
+    def _recognize(self, packets):
+        # detect workers can still hand frames over out of order; trackers
+        # only take them in capture order
+        packets.sort(key=lambda p: p['seq'])
+        in_order = []
+        for packet in packets:
+            source = packet['source']
+            if source.tracker is not None:
+                if packet['seq'] <= source.tracked:
+                    continue
+                source.tracked = packet['seq']
+            in_order.append(packet)
+        packets = in_order
+        items, scopes, todos = [], [], []
+        for packet in packets:
+            source = packet['source']
+            if source.tracker is not None:
+                packet['tracks'] = source.tracker.update(packet['boxes'])
+                todo, _ = source.tracker.split(packet['tracks'])
+                boxes = [t.box for t in todo]
+            elif packet.get('motion') is not None and packet['motion'].skip:
+                todo, boxes = None, []      # static scene: reuse the stream's last results
+            else:
+                todo, boxes = None, packet['boxes']
+            todos.append(todo)
+            items.append((packet['frame'], boxes))
+            scopes.append((source.class_name, source.fallback))
+
+        # one embedding batch for every stream in this round
+        found = [[] for _ in items]
+        if self.recognizer is not None and any(boxes for _, boxes in items):
+            found = self.recognizer.identify_many(items, scopes=scopes)
+
+        for packet, todo, results in zip(packets, todos, found):
+            source = packet['source']
+            tracker = source.tracker
+            if tracker is None:
+                if packet.get('motion') is not None and packet['motion'].skip:
+                    packet['results'], packet['marks'] = source.last_results, []
+                else:
+                    packet['results'] = packet['marks'] = source.last_results = results
+                continue
+            confirmed = [t for t, r in zip(todo, results) if tracker.assign(t, r[4], r[5], r[6])]
+            packet['results'] = [(*t.box, t.name or "Unknown", t.score, t.class_name)
+                                 for t in packet['tracks']]
+            packet['marks'] = [(*t.box, t.name, t.score, t.class_name) for t in confirmed]
+        return packets
+
+    def _sink(self, packet):
+        source = packet['source']
+        source.latency.record(time.perf_counter() - packet['t0'])
+        if self.on_results is not None and packet.get('marks'):
+            self.on_results(source, packet['marks'])
+        if packet['seq'] < source.published:
+            return
+        source.published = packet['seq']
+        source.output.put(annotate(packet['frame'], packet['results']))
@@ -0,0 +1,505 @@
+# recognition_service.py
+"""Headless face recognition for thin classroom clients.
+
+One process holds the detector, the embedding model and the galleries;
+dashboards send JPEG frames (or face crops) over TCP and get identities
+back.  Requests from every client that arrive within ``window_ms`` of each
+other are embedded in one batch.
+
+    python recognition_service.py --port 8765              # on the server
+    ATTENDANCE_SERVICE=server:8765 python dashboard.py     # on each classroom PC
+    python recognition_service.py --load-test 16           # localhost throughput/latency
+
+Wire format, both directions: 4-byte header length, 4-byte payload length
+(big-endian), a JSON header, then the payload: the request's JPEGs back
+to back, their byte sizes listed in ``header['sizes']``.
+"""
+import argparse
+import asyncio
+import ipaddress
+import itertools
+import json
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from core_recognition import check_folder_name
+from metrics import metrics
+
+DEFAULT_PORT = 8765
+_PREFIX = struct.Struct('>II')
+MAX_HEADER = 64 * 1024              # bytes; larger messages close the connection
+MAX_PAYLOAD = 64 * 1024 * 1024
+BATCHED_OPS = ('detect', 'identify', 'recognize')
+WRITE_OPS = ('enroll',)             # change the gallery and the photo folder
+
+
+# ==================== WIRE FORMAT ====================
+def encode_images(images, quality=85):
+    return [cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes() for img in images]
+
+
+def decode_images(payload, sizes):
+    images, offset = [], 0
+    for size in sizes:
+        img = cv2.imdecode(np.frombuffer(payload, np.uint8, size, offset), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Undecodable image")
+        images.append(img)
+        offset += size
+    return images
+
+
+def pack_message(header, parts=()):
+    header = dict(header, sizes=[len(p) for p in parts])
+    body = json.dumps(header).encode()
+    payload = b''.join(parts)
+    return _PREFIX.pack(len(body), len(payload)) + body + payload
+
+
+def _check_sizes(n_header, n_payload):
+    if n_header > MAX_HEADER or n_payload > MAX_PAYLOAD:
+        raise ValueError(f"Message too large ({n_header} + {n_payload} bytes)")
+
+
+async def read_message(reader):
+    n_header, n_payload = _PREFIX.unpack(await reader.readexactly(_PREFIX.size))
+    _check_sizes(n_header, n_payload)
+    header = json.loads(await reader.readexactly(n_header))
+    return header, await reader.readexactly(n_payload)
+
+
+def _recv_exactly(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Service closed the connection")
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_message(sock):
+    n_header, n_payload = _PREFIX.unpack(_recv_exactly(sock, _PREFIX.size))
+    _check_sizes(n_header, n_payload)
+    header = json.loads(_recv_exactly(sock, n_header))
+    return header, _recv_exactly(sock, n_payload)
+
+
+def _is_loopback(host):
+    try:
+        return host is not None and ipaddress.ip_address(host.split('%')[0]).is_loopback
+    except ValueError:
+        return False
+
+
+def _result(r):
+    x, y, w, h, name, score, class_name = r
+    return [int(x), int(y), int(w), int(h), name, round(float(score), 4), class_name]
+
+
+# ==================== SERVER ====================
+class RecognitionService:
+    """asyncio TCP front end to one FaceRecognizer, with micro-batching.
+
+    Detection, identification and recognition requests queue up; a batcher
+    waits at most ``window_ms`` after the first one (or until ``max_batch``
+    requests) and runs the lot on the single model thread, with every face
+    of every request embedded in one ``identify_many`` call.  While that
+    runs the next batch gathers by itself.  Control requests (hello, stats,
+    preload, enroll) bypass the batcher.
+
+    The protocol has no authentication, so ``enroll`` (which writes photos
+    on the server) is only accepted from loopback clients unless
+    ``allow_remote_enroll`` is set.
+    """
+
+    def __init__(self, recognizer, host='127.0.0.1', port=DEFAULT_PORT, window_ms=5.0, max_batch=32,
+                 allow_remote_enroll=False):
+        self.recognizer = recognizer
+        self.host = host
+        self.allow_remote_enroll = allow_remote_enroll
+        self.port = port
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.counts = {'connections': 0, 'requests': 0, 'batches': 0, 'batched_requests': 0, 'faces': 0,
+                       'errors': 0}
+        self._model = ThreadPoolExecutor(1, thread_name_prefix='service-model')
+        self._control = ThreadPoolExecutor(2, thread_name_prefix='service-control')
+        self._queue = None
+        self._server = None
+        self._loop = None
+        self.ready = threading.Event()
+
+    # ---------- lifecycle ----------
+    def run(self):
+        """Serve until ``stop()`` (blocks)."""
+        asyncio.run(self._main())
+
+    def start(self):
+        """Serve on a background thread; returns once the port is bound."""
+        threading.Thread(target=self.run, name='recognition-service', daemon=True).start()
+        self.ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        batcher = asyncio.create_task(self._batcher())
+        print(f"[SERVICE] Listening on {self.host}:{self.port} "
+              f"(window {1000 * self.window:.0f} ms, batch <= {self.max_batch})")
+        self.ready.set()
+        try:
+            async with self._server:
+                await self._server.wait_closed()
+        finally:
+            batcher.cancel()
+
+    def stats(self):
+        c = self.counts
+        return dict(c, avg_batch=round(c['batched_requests'] / c['batches'], 2) if c['batches'] else 0.0)
+
+    # ---------- connections ----------
+    async def _handle(self, reader, writer):
+        self.counts['connections'] += 1
+        peer = writer.get_extra_info('peername')
+        local = _is_loopback(peer[0] if peer else None)
+        try:
+            while True:
+                header, payload = await read_message(reader)
+                self.counts['requests'] += 1
+                if header.get('op') in BATCHED_OPS:
+                    reply = self._loop.create_future()
+                    await self._queue.put((header, payload, reply, time.perf_counter()))
+                    reply = await reply
+                elif header.get('op') in WRITE_OPS and not (local or self.allow_remote_enroll):
+                    reply = {'error': f"'{header.get('op')}' is only accepted from this machine"}
+                else:
+                    reply = await self._loop.run_in_executor(self._control, self._control_op, header, payload)
+                writer.write(pack_message(dict(reply, id=header.get('id'))))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:     # oversized or malformed message: drop the client
+            self.counts['errors'] += 1
+            print(f"[SERVICE] Closing {peer}: {e}")
+        finally:
+            writer.close()
+
+    async def _batcher(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.window
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            now = time.perf_counter()
+            for _, _, _, queued in batch:
+                metrics.record('service.wait', now - queued)
+            try:
+                replies = await self._loop.run_in_executor(
+                    self._model, self._run_batch, [(h, p) for h, p, _, _ in batch])
+            except Exception as e:
+                replies = [{'error': str(e)}] * len(batch)
+            for (_, _, future, _), reply in zip(batch, replies):
+                if not future.done():
+                    future.set_result(reply)
+
+    # ---------- model thread ----------
+    def _run_batch(self, requests):
+        """Replies for one batch; every face of every request is embedded together."""
+        with metrics.span('service.batch'):
+            self.counts['batches'] += 1
+            self.counts['batched_requests'] += len(requests)
+            replies = [None] * len(requests)
+            items, scopes, owners = [], [], []
+            for i, (header, payload) in enumerate(requests):
+                try:
+                    images = decode_images(payload, header.get('sizes', []))
+                    scope = (header.get('class'), bool(header.get('fallback')))
+                    op = header['op']
+                    if op == 'detect':
+                        rois = header.get('rois')
+                        replies[i] = {'boxes': [[int(v) for v in b]
+                                                for b in self.recognizer.detect(images[0], rois)]}
+                    elif op == 'recognize':
+                        items.append((images[0], self.recognizer.detect(images[0])))
+                        scopes.append(scope)
+                        owners.append((i, False))
+                    else:   # identify: one already-cropped face per image
+                        replies[i] = {'results': []}
+                        for crop in images:
+                            items.append((crop, [(0, 0, crop.shape[1], crop.shape[0])]))
+                            scopes.append(scope)
+                            owners.append((i, True))
+                except Exception as e:
+                    self.counts['errors'] += 1
+                    replies[i] = {'error': str(e)}
+
+            if items:
+                found = self.recognizer.identify_many(items, scopes=scopes)
+                self.counts['faces'] += sum(len(boxes) for _, boxes in items)
+                for (i, is_crop), results in zip(owners, found):
+                    if replies[i] is not None and 'error' in replies[i]:
+                        continue
+                    if is_crop:
+                        replies[i]['results'].append(_result(results[0])[4:])
+                    else:
+                        replies[i] = {'results': [_result(r) for r in results]}
+            return replies
+
+    def _control_op(self, header, payload):
+        op = header.get('op')
+        try:
+            if op == 'hello':
+                rec = self.recognizer
+                return {'model': rec.model, 'face_size': list(rec.face_size), 'threshold': rec.threshold,
+                        'classes': rec.known_classes}
+            if op == 'preload':
+                self.recognizer.preload(header.get('class'))
+                return {'classes': self.recognizer.known_classes}
+            if op == 'enroll':
+                name = check_folder_name(header.get('name'))
+                class_name = check_folder_name(header.get('class'), 'class')
+                image = decode_images(payload, header['sizes'])[0]
+                path = self.recognizer.enroll(name, class_name, image,
+                                              replace=bool(header.get('replace')), record=False)
+                return {'path': path}
+            if op == 'stats':
+                return {'service': self.stats(), 'metrics': metrics.snapshot()}
+            return {'error': f"Unknown op '{op}'"}
+        except Exception as e:
+            self.counts['errors'] += 1
+            return {'error': str(e)}
+
+
+# ==================== CLIENT ====================
+class RemoteRecognizer:
+    """FaceRecognizer stand-in for thin clients: the models run in a RecognitionService.
+
+    Offers the methods the engines and the dashboard use (``detect``,
+    ``identify``, ``identify_many``, ``recognize``, ``enroll``, ``preload``,
+    ``warm_up``).  Each thread gets its own connection, so the detect and
+    recognize stages do not wait on each other.  Identification ships
+    face crops at the model's input size, not whole frames.
+    """
+
+    def __init__(self, address=f"127.0.0.1:{DEFAULT_PORT}", timeout=10.0, jpeg_quality=85):
+        host, _, port = address.rpartition(':')
+        self.address = (host or '127.0.0.1', int(port))
+        self.timeout = timeout
+        self.jpeg_quality = jpeg_quality
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        info = self._call({'op': 'hello'})
+        self.model = info['model']
+        self.face_size = tuple(info['face_size'])
+        self.threshold = info['threshold']
+        self._classes = info['classes']
+        print(f"[CLIENT] Connected to {host}:{port} ({self.model}, {len(self._classes)} classes)")
+
+    def _socket(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.create_connection(self.address, self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.sock = sock
+        return sock
+
+    def _call(self, header, images=()):
+        message = pack_message(dict(header, id=next(self._ids)), encode_images(images, self.jpeg_quality))
+        for attempt in (1, 2):
+            try:
+                sock = self._socket()
+                sock.sendall(message)
+                reply, _ = recv_message(sock)
+                break
+            except OSError:
+                self.close()
+                if attempt == 2:
+                    raise
+        if 'error' in reply:
+            raise RuntimeError(f"Recognition service: {reply['error']}")
+        return reply
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    @property
+    def known_classes(self):
+        return list(self._classes)
+
+    def preload(self, class_name=None):
+        self._classes = self._call({'op': 'preload', 'class': class_name})['classes']
+
+    def warm_up(self, frame_size=(480, 640)):
+        """Round-trip one blank frame (the service warms its own models)."""
+        start = time.perf_counter()
+        self.recognize(np.zeros((*frame_size, 3), np.uint8))
+        return time.perf_counter() - start
+
+    def detect(self, frame, rois=None):
+        rois = [[int(v) for v in r[:4]] for r in rois] if rois else None
+        return [tuple(b[:4]) for b in self._call({'op': 'detect', 'rois': rois}, [frame])['boxes']]
+
+    def recognize(self, frame, class_name=None, fallback=False):
+        from core_recognition import Recognition
+        reply = self._call({'op': 'recognize', 'class': class_name, 'fallback': fallback}, [frame])
+        return [Recognition(*r) for r in reply['results']]
+
+    def recognize_many(self, frames, class_name=None, fallback=False):
+        return [self.recognize(f, class_name, fallback) for f in frames]
+
+    def identify(self, frame, boxes, class_name=None, fallback=False):
+        from core_recognition import Recognition
+        if not boxes:
+            return []
+        H, W = frame.shape[:2]
+        crops = []
+        for (x, y, w, h) in boxes:
+            face = frame[max(0, y):min(H, y + h), max(0, x):min(W, x + w)]
+            crops.append(cv2.resize(face, self.face_size) if face.size else
+                         np.zeros((self.face_size[1], self.face_size[0], 3), np.uint8))
+        reply = self._call({'op': 'identify', 'class': class_name, 'fallback': fallback}, crops)
+        return [Recognition(*box, *r) for box, r in zip(boxes, reply['results'])]
+
+    def identify_many(self, items, class_name=None, fallback=False, scopes=None):
+        return [self.identify(frame, boxes, *(scopes[i] if scopes else (class_name, fallback)))
+                for i, (frame, boxes) in enumerate(items)]
+
+    def enroll(self, name, class_name, image, replace=False, record=True):
+        """Enroll on the service; the ``students`` row goes into this machine's database."""
+        from database import add_student
+        path = self._call({'op': 'enroll', 'name': name, 'class': class_name, 'replace': replace},
+                          [image])['path']
+        if class_name not in self._classes:
+            self._classes.append(class_name)
+        if record:
+            add_student(name, class_name, path)
+        return path
+
+    def stats(self):
+        return self._call({'op': 'stats'})
+
+
+# ==================== LOAD TEST ====================
+def load_test(address, clients, seconds, faces, mode='recognize', class_name='Class_01'):
+    """``clients`` threads sending synthetic classroom frames as fast as replies come back."""
+    from setup_demo import synthetic_frame
+
+    img, truth = synthetic_frame([f"Class_01_s{i:05d}" for i in range(faces)], seed=0)
+    frame = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+    boxes = [tuple(t['box']) for t in truth]
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    stop_at = time.perf_counter() + seconds
+
+    def client(i):
+        remote = RemoteRecognizer(address)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                if mode == 'identify':
+                    remote.identify(frame, boxes, class_name)
+                else:
+                    remote.recognize(frame, class_name)
+            except Exception:
+                errors[i] += 1
+                continue
+            latencies[i].append(1000 * (time.perf_counter() - start))
+        remote.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    ms = np.array([v for per in latencies for v in per]) if any(latencies) else np.zeros(1)
+    row = {'clients': clients, 'mode': mode, 'faces': faces, 'requests': int(sum(map(len, latencies))),
+           'errors': sum(errors), 'requests_per_s': round(sum(map(len, latencies)) / elapsed, 1),
+           'p50_ms': round(float(np.percentile(ms, 50)), 2), 'p95_ms': round(float(np.percentile(ms, 95)), 2)}
+    print(f"[LOAD] {clients:>3} clients ({mode}, {faces} faces): {row['requests_per_s']:8.1f} req/s  "
+          f"p50 {row['p50_ms']:7.2f} ms  p95 {row['p95_ms']:7.2f} ms  errors {row['errors']}")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless face recognition service")
+    parser.add_argument('--host', default='127.0.0.1', help="0.0.0.0 to serve the classroom network")
+    parser.add_argument('--allow-remote-enroll', action='store_true',
+                        help="accept enrollments from other machines (the protocol is unauthenticated)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--window-ms', type=float, default=5.0, help="how long a batch waits for more requests")
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--known', default='ImagesAttendance')
+    parser.add_argument('--model', default='VGG-Face')
+    parser.add_argument('--detector', default='mtcnn')
+    parser.add_argument('--detect-scale', type=float, default=0.5)
+    parser.add_argument('--load-test', type=int, nargs='*', metavar='CLIENTS',
+                        help="benchmark on localhost with these client counts (stub models unless --real)")
+    parser.add_argument('--real', action='store_true', help="load-test the real models")
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--faces', type=int, default=4)
+    parser.add_argument('--mode', choices=['recognize', 'identify'], default='recognize')
+    args = parser.parse_args()
+
+    if args.load_test is not None:
+        import tempfile
+        import benchmark
+        from setup_demo import generate_gallery
+        work = tempfile.mkdtemp(prefix='service_load_')
+        if args.real:
+            from core_recognition import FaceRecognizer
+            recognizer = FaceRecognizer(args.known, model=args.model, detector=args.detector,
+                                        detect_scale=args.detect_scale, lazy=False)
+        else:
+            generate_gallery(f"{work}/gallery", 1, max(args.faces, 8))
+            recognizer = benchmark.stub_recognizer(f"{work}/gallery", f"{work}/cache", lazy=False)
+        recognizer.warm_up()
+        service = RecognitionService(recognizer, '127.0.0.1', 0, args.window_ms, args.max_batch).start()
+        for clients in args.load_test or [1, 4, 16]:
+            load_test(f"127.0.0.1:{service.port}", clients, args.seconds, args.faces, args.mode,
+                      None if args.real else 'Class_01')
+            print(f"[SERVICE] {service.stats()}")
+        service.stop()
+        return
+
+    from core_recognition import FaceRecognizer
+    recognizer = FaceRecognizer(args.known, model=args.model, detector=args.detector,
+                                detect_scale=args.detect_scale)
+    recognizer.warm_up()
+    recognizer.preload()
+    service = RecognitionService(recognizer, args.host, args.port, args.window_ms, args.max_batch,
+                                 allow_remote_enroll=args.allow_remote_enroll)
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
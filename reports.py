@@ -0,0 +1,344 @@
+# reports.py
+"""Attendance percentages and bulk exports, read from the summary tables.
+
+    python reports.py classes  --from 2025-09-01 --to 2026-06-30
+    python reports.py students --from 2026-01-01 --to 2026-03-31 --class Class_10 --out q1.csv
+    python reports.py months   --from 2024-09 --to 2026-06 --out months.parquet
+    python reports.py export   --from 2025-09-01 --to 2026-06-30 --out attendance_2025.parquet
+    python reports.py backfill                 # daily CSVs the scheduler missed
+
+A school day for a class is a day at least one of its students was marked;
+"enrolled" is the class's current size.  Files ending in ``.csv`` are
+plain CSV, ``.csv.gz`` gzip-compressed CSV, and ``.parquet`` columnar
+(zstd) through pyarrow, which is only needed for that format.
+"""
+import argparse
+import csv
+import gzip
+import os
+import sqlite3
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+
+import database
+
+ClassRate = namedtuple('ClassRate', ['class_name', 'days', 'enrolled', 'present', 'rate'])
+MonthRate = namedtuple('MonthRate', ['month', 'class_name', 'days', 'enrolled', 'present', 'rate'])
+StudentRate = namedtuple('StudentRate', ['name', 'class_name', 'present', 'days', 'rate'])
+StudentMonth = namedtuple('StudentMonth', ['name', 'class_name', 'month', 'present', 'days', 'rate'])
+
+EXPORT_TIME = time(17, 0)
+EXPORT_DAYS = range(5)          # Mon-Fri
+EXPORT_PATTERN = "Attendance_{date}.csv"
+
+_RAW_SQL = '''SELECT a.date, a.time, s.name, c.name FROM attendance a
+              JOIN students s ON a.student_id = s.id
+              LEFT JOIN classes c ON s.class_id = c.id
+              WHERE a.date BETWEEN ? AND ? AND (? IS NULL OR c.name = ?)
+              ORDER BY a.date, a.time'''
+
+
+def _connect(path=None):
+    return sqlite3.connect(path or database.DB_NAME)
+
+
+def _day(value):
+    return value.strftime("%Y-%m-%d") if isinstance(value, (date, datetime)) else str(value)
+
+
+def _month_span(start, end):
+    """First and last day (as strings) of the months of ``start`` and ``end``."""
+    return _day(start)[:7] + '-01', _day(end)[:7] + '-31'
+
+
+def _rate(present, possible):
+    return round(present / possible, 4) if possible else None
+
+
+def _whole_months(start, end):
+    """Split ``start..end`` into a head, the whole months in between and a tail.
+
+    Returns ``((head_from, head_to), (first_month, last_month), (tail_from, tail_to))``;
+    empty parts come back as ranges with from > to, which match nothing.
+    """
+    first = datetime.strptime(start, "%Y-%m-%d").date()
+    last = datetime.strptime(end, "%Y-%m-%d").date()
+    month_from = first if first.day == 1 else (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    after_last = last + timedelta(days=1)
+    month_to = last if after_last.day == 1 else last.replace(day=1) - timedelta(days=1)
+    if month_from > month_to:
+        return (start, end), ('9', '0'), ('9', '0')
+    return ((start, _day(month_from - timedelta(days=1))),
+            (_day(month_from)[:7], _day(month_to)[:7]),
+            (_day(month_to + timedelta(days=1)), end))
+
+
+# ==================== REPORTS ====================
+def class_rates(start, end, class_name=None, path=None):
+    """One ``ClassRate`` per class over ``start..end``: present = student-days marked."""
+    conn = _connect(path)
+    rows = conn.execute('''
+        WITH enrolled (class_id, n) AS (
+            SELECT COALESCE(class_id, 0), COUNT(*) FROM students GROUP BY COALESCE(class_id, 0))
+        SELECT c.name, COUNT(d.date), e.n, COALESCE(SUM(d.present), 0)
+        FROM classes c JOIN enrolled e ON e.class_id = c.id
+        LEFT JOIN daily_class_summary d ON d.class_id = c.id AND d.date BETWEEN ? AND ?
+        WHERE (? IS NULL OR c.name = ?)
+        GROUP BY c.id ORDER BY c.name''', (_day(start), _day(end), class_name, class_name)).fetchall()
+    conn.close()
+    return [ClassRate(name, days, n, present, _rate(present, days * n)) for name, days, n, present in rows]
+
+
+def monthly_rates(start, end, class_name=None, path=None):
+    """One ``MonthRate`` per class per month with any attendance; ``start``/``end`` are days or months."""
+    conn = _connect(path)
+    rows = conn.execute('''
+        WITH enrolled (class_id, n) AS (
+            SELECT COALESCE(class_id, 0), COUNT(*) FROM students GROUP BY COALESCE(class_id, 0))
+        SELECT substr(d.date, 1, 7) AS month, c.name, COUNT(*), e.n, SUM(d.present)
+        FROM daily_class_summary d JOIN classes c ON c.id = d.class_id
+        JOIN enrolled e ON e.class_id = c.id
+        WHERE d.date BETWEEN ? AND ? AND (? IS NULL OR c.name = ?)
+        GROUP BY month, c.id ORDER BY month, c.name''',
+        (*_month_span(start, end), class_name, class_name)).fetchall()
+    conn.close()
+    return [MonthRate(month, name, days, n, present, _rate(present, days * n))
+            for month, name, days, n, present in rows]
+
+
+def student_rates(start, end, class_name=None, path=None):
+    """One ``StudentRate`` per student over ``start..end``.
+
+    Whole months come from ``student_month_summary``; only the partial
+    months at either end touch ``attendance`` (through its date index).
+    """
+    start, end = _day(start), _day(end)
+    head, months, tail = _whole_months(start, end)
+    conn = _connect(path)
+    rows = conn.execute('''
+        WITH marks (student_id, n) AS (
+            SELECT student_id, days FROM student_month_summary WHERE month BETWEEN ? AND ?
+            UNION ALL SELECT student_id, 1 FROM attendance WHERE date BETWEEN ? AND ?
+            UNION ALL SELECT student_id, 1 FROM attendance WHERE date BETWEEN ? AND ?),
+        present (student_id, n) AS (SELECT student_id, SUM(n) FROM marks GROUP BY student_id),
+        class_days (class_id, n) AS (
+            SELECT class_id, COUNT(*) FROM daily_class_summary WHERE date BETWEEN ? AND ?
+            GROUP BY class_id)
+        SELECT s.name, c.name, COALESCE(p.n, 0), COALESCE(cd.n, 0)
+        FROM students s LEFT JOIN classes c ON c.id = s.class_id
+        LEFT JOIN present p ON p.student_id = s.id
+        LEFT JOIN class_days cd ON cd.class_id = COALESCE(s.class_id, 0)
+        WHERE (? IS NULL OR c.name = ?)
+        ORDER BY c.name, s.name''',
+        (*months, *head, *tail, start, end, class_name, class_name)).fetchall()
+    conn.close()
+    return [StudentRate(name, cls, present, days, _rate(present, days)) for name, cls, present, days in rows]
+
+
+def student_months(start, end, class_name=None, path=None):
+    """One ``StudentMonth`` per student per month with school days; ``start``/``end`` are days or months."""
+    conn = _connect(path)
+    rows = conn.execute('''
+        WITH class_days (class_id, month, n) AS (
+            SELECT class_id, substr(date, 1, 7) AS month, COUNT(*) FROM daily_class_summary
+            WHERE date BETWEEN ? AND ? GROUP BY class_id, month)
+        SELECT s.name, c.name, cd.month, COALESCE(m.days, 0), cd.n
+        FROM students s LEFT JOIN classes c ON c.id = s.class_id
+        JOIN class_days cd ON cd.class_id = COALESCE(s.class_id, 0)
+        LEFT JOIN student_month_summary m ON m.student_id = s.id AND m.month = cd.month
+        WHERE (? IS NULL OR c.name = ?)
+        ORDER BY c.name, s.name, cd.month''',
+        (*_month_span(start, end), class_name, class_name)).fetchall()
+    conn.close()
+    return [StudentMonth(name, cls, month, present, days, _rate(present, days))
+            for name, cls, month, present, days in rows]
+
+
+# ==================== FILES ====================
+def write_rows(path, header, rows, chunk_rows=50000):
+    """Write ``rows`` (any iterable of tuples) to CSV, gzip CSV or Parquet by extension; returns the count.
+
+    Rows are streamed ``chunk_rows`` at a time, so years of attendance never
+    sit in memory at once.
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = path + '.tmp'
+    if path.endswith('.parquet'):
+        count = _write_parquet(tmp, header, rows, chunk_rows)
+    else:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(tmp, 'wt', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            count = 0
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+    os.replace(tmp, path)
+    return count
+
+
+def _write_parquet(path, header, rows, chunk_rows):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow); use .csv.gz instead")
+    writer, count, rows = None, 0, iter(rows)
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            columns = list(zip(*chunk)) or [()] * len(header)
+            table = pa.table({name: list(column) for name, column in zip(header, columns)})
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+            if chunk:
+                writer.write_table(table.cast(writer.schema))
+                count += len(chunk)
+            if len(chunk) < chunk_rows:
+                break
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def _raw_rows(conn, start, end, class_name, batch=10000):
+    cur = conn.execute(_RAW_SQL, (_day(start), _day(end), class_name, class_name))
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            return
+        yield from rows
+
+
+def export_attendance(out, start, end, class_name=None, path=None):
+    """Every mark in ``start..end`` (optionally one class) to ``out``; returns the row count."""
+    conn = _connect(path)
+    try:
+        count = write_rows(out, ('date', 'time', 'student', 'class'), _raw_rows(conn, start, end, class_name))
+    finally:
+        conn.close()
+    print(f"[EXPORT] {count} rows -> {out}")
+    return count
+
+
+def export_report(out, rows):
+    """Write a list of report namedtuples (``class_rates()`` etc.) to ``out``."""
+    if not rows:
+        print(f"[EXPORT] nothing to write to {out}")
+        return 0
+    count = write_rows(out, rows[0]._fields, rows)
+    print(f"[EXPORT] {count} rows -> {out}")
+    return count
+
+
+# ==================== DAILY EXPORT ====================
+def next_export(now, at=EXPORT_TIME, weekdays=EXPORT_DAYS):
+    """First export slot (``at`` on one of ``weekdays``) after ``now``."""
+    target = datetime.combine(now.date(), at)
+    while target <= now or target.weekday() not in weekdays:
+        target += timedelta(days=1)
+    return target
+
+
+def due_exports(now, lookback_days=31, at=EXPORT_TIME, weekdays=EXPORT_DAYS):
+    """Days of the past ``lookback_days`` whose export slot has already passed, oldest first."""
+    days = []
+    for back in range(lookback_days, -1, -1):
+        day = now.date() - timedelta(days=back)
+        if day.weekday() in weekdays and datetime.combine(day, at) <= now:
+            days.append(_day(day))
+    return days
+
+
+def export_day(day, folder='.', path=None, pattern=EXPORT_PATTERN):
+    """The classic per-day CSV (Student, Class, Time); records the run in ``exports``.
+
+    Returns the file written, or None when nobody was marked that day.
+    """
+    day = _day(day)
+    conn = _connect(path)
+    try:
+        rows = [(name, cls, t) for _, t, name, cls in _raw_rows(conn, day, day, None)]
+        out = os.path.join(folder, pattern.format(date=day)) if rows else None
+        if out:
+            write_rows(out, ('Student', 'Class', 'Time'), rows)
+            print(f"[EXPORTED] {out}")
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO exports (date, rows, path, exported_at) VALUES (?, ?, ?, ?)",
+                         (day, len(rows), out, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    finally:
+        conn.close()
+    return out
+
+
+def export_missed(now=None, folder='.', path=None, lookback_days=31):
+    """Export every slot in the last ``lookback_days`` that has no ``exports`` row
+    (the app was closed at 5 PM, the machine slept...); returns the files written."""
+    now = now or datetime.now()
+    due = due_exports(now, lookback_days)
+    conn = _connect(path)
+    done = {d for (d,) in conn.execute("SELECT date FROM exports WHERE date >= ?", (due[0],))} if due else set()
+    conn.close()
+    missed = [d for d in due if d not in done]
+    if missed:
+        print(f"[EXPORT] Catching up {len(missed)} missed export(s): {missed[0]} .. {missed[-1]}")
+    return [out for out in (export_day(d, folder, path) for d in missed) if out]
+
+
+# ==================== CLI ====================
+def _print_rows(rows):
+    if not rows:
+        print("(no rows)")
+        return
+    widths = [max(len(str(v)) for v in col) for col in zip(rows[0]._fields, *rows)]
+    for row in [rows[0]._fields, *rows]:
+        print("  ".join(str('-' if v is None else v).ljust(w) for v, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance reports and exports")
+    parser.add_argument('--db', default=None, help=f"default: {database.DB_NAME}")
+    sub = parser.add_subparsers(dest='command', required=True)
+    today = _day(date.today())
+    for name, helptext in [('classes', "attendance rate per class"),
+                           ('students', "attendance rate per student"),
+                           ('months', "attendance rate per class per month"),
+                           ('student-months', "attendance rate per student per month"),
+                           ('export', "every mark in the range")]:
+        p = sub.add_parser(name, help=helptext)
+        p.add_argument('--from', dest='start', default=today[:4] + '-01-01')
+        p.add_argument('--to', dest='end', default=today)
+        p.add_argument('--class', dest='class_name', default=None)
+        p.add_argument('--out', default=None, help=".csv, .csv.gz or .parquet"
+                       + (" (required)" if name == 'export' else " (default: print)"))
+    back = sub.add_parser('backfill', help="write the daily CSVs the scheduler missed")
+    back.add_argument('--days', type=int, default=31)
+    back.add_argument('--folder', default='.')
+    args = parser.parse_args()
+
+    database.init_db(args.db)       # creates/backfills the summaries on older databases
+    if args.command == 'backfill':
+        written = export_missed(folder=args.folder, path=args.db, lookback_days=args.days)
+        print(f"[EXPORT] {len(written)} file(s) written")
+        return
+    if args.command == 'export':
+        if not args.out:
+            parser.error("export needs --out")
+        export_attendance(args.out, args.start, args.end, args.class_name, args.db)
+        return
+    report = {'classes': class_rates, 'students': student_rates,
+              'months': monthly_rates, 'student-months': student_months}[args.command]
+    rows = report(args.start, args.end, args.class_name, args.db)
+    if args.out:
+        export_report(args.out, rows)
+    else:
+        _print_rows(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 # setup_demo.py
+import argparse
+import json
 import os
+import random
 from PIL import Image, ImageDraw, ImageFont
 
 def create_dummy_face(name, path):
@@ -29,7 +32,118 @@ def create_dummy_face(name, path):
     img.save(path)
     print(f"Created: {path}")
 
+# ==================== SYNTHETIC FACES (benchmarks) ====================
+BACKGROUND = (20, 20, 20)   # dark backdrop, so faces are easy to find as bright blobs
+
+def face_params(name):
+    """Proportions and colours of one synthetic identity, fixed by its name."""
+    rng = random.Random(name)
+    return {
+        'skin': tuple(rng.randint(150, 235) for _ in range(3)),
+        'width': rng.uniform(0.60, 0.80), 'height': rng.uniform(0.78, 0.94),
+        'eye_y': rng.uniform(0.08, 0.22), 'eye_dx': rng.uniform(0.16, 0.30),
+        'eye_r': rng.uniform(0.03, 0.07), 'eye': tuple(rng.randint(0, 110) for _ in range(3)),
+        'nose': rng.uniform(0.05, 0.18), 'mouth_y': rng.uniform(0.18, 0.32),
+        'mouth_w': rng.uniform(0.12, 0.30), 'smile': rng.uniform(0.0, 0.08),
+        'hair': tuple(rng.randint(0, 140) for _ in range(3)), 'hair_h': rng.uniform(0.05, 0.30),
+    }
+
+def draw_face(params, size=160, jitter=None):
+    """Render an identity; ``jitter`` (a random.Random) varies light and position slightly."""
+    p = params
+    shift = jitter.uniform(-0.03, 0.03) * size if jitter else 0.0
+    light = jitter.uniform(0.85, 1.1) if jitter else 1.0
+    tone = lambda c: tuple(min(255, int(v * light)) for v in c)
+    img = Image.new('RGB', (size, size), BACKGROUND)
+    d = ImageDraw.Draw(img)
+    cx, cy = size / 2 + shift, size / 2 + shift / 2
+    w, h = p['width'] * size, p['height'] * size
+    top = cy - h / 2
+    d.ellipse([cx - w / 2, top, cx + w / 2, cy + h / 2], fill=tone(p['skin']))
+    d.chord([cx - w / 2, top, cx + w / 2, top + 2 * p['hair_h'] * h + 1], 180, 360, fill=tone(p['hair']))
+    eye_y, r = cy - p['eye_y'] * h, p['eye_r'] * size
+    for side in (-1, 1):
+        ex = cx + side * p['eye_dx'] * w * 1.3
+        d.ellipse([ex - r, eye_y - 0.7 * r, ex + r, eye_y + 0.7 * r], fill=tone(p['eye']))
+    d.line([cx, eye_y + r, cx, eye_y + r + p['nose'] * h], fill=tone(p['eye']), width=max(1, size // 60))
+    my, mw = cy + p['mouth_y'] * h, p['mouth_w'] * w * 1.5
+    d.arc([cx - mw, my - p['smile'] * h - 2, cx + mw, my + p['smile'] * h + 2], 0, 180,
+          fill=tone(p['eye']), width=max(1, size // 50))
+    return img
+
+def generate_gallery(base, classes=4, per_class=50, size=160, samples=1):
+    """``classes`` class folders of ``per_class`` synthetic students; returns {class: [names]}."""
+    roster = {}
+    for c in range(classes):
+        cls = f"Class_{c + 1:02d}"
+        os.makedirs(os.path.join(base, cls), exist_ok=True)
+        roster[cls] = [f"{cls}_s{i:05d}" for i in range(per_class)]
+        for name in roster[cls]:
+            params = face_params(name)
+            if samples == 1:
+                draw_face(params, size).save(os.path.join(base, cls, f"{name}.jpg"), quality=92)
+                continue
+            os.makedirs(os.path.join(base, cls, name), exist_ok=True)
+            for k in range(samples):
+                draw_face(params, size, random.Random(f"{name}/{k}")).save(
+                    os.path.join(base, cls, name, f"{k}.jpg"), quality=92)
+    return roster
+
+def synthetic_frame(names, frame_size=(640, 480), face_size=110, seed=0):
+    """A classroom-like frame with ``names`` laid out on a grid; returns (image, boxes)."""
+    rng = random.Random(seed)
+    W, H = frame_size
+    img = Image.new('RGB', frame_size, BACKGROUND)
+    cols = max(1, W // (face_size + 20))
+    boxes = []
+    for i, name in enumerate(names):
+        x = 10 + (i % cols) * (face_size + 20) + rng.randint(0, 8)
+        y = 10 + (i // cols) * (face_size + 20) + rng.randint(0, 8)
+        if y + face_size > H:
+            break
+        img.paste(draw_face(face_params(name), face_size, rng), (x, y))
+        boxes.append({'name': name, 'box': [x, y, face_size, face_size]})
+    return img, boxes
+
+def generate_frames(out_dir, roster, count=20, faces_per_frame=4, frame_size=(640, 480), seed=0):
+    """Write ``count`` synthetic frames plus ``frames.json`` with the true names and boxes."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    everyone = [n for names in roster.values() for n in names]
+    truth = {}
+    for i in range(count):
+        names = rng.sample(everyone, min(faces_per_frame, len(everyone)))
+        img, boxes = synthetic_frame(names, frame_size, seed=seed * 100003 + i)
+        path = f"frame_{i:05d}.jpg"
+        img.save(os.path.join(out_dir, path), quality=92)
+        truth[path] = boxes
+    with open(os.path.join(out_dir, 'frames.json'), 'w') as f:
+        json.dump(truth, f, indent=1)
+    return truth
+
+def main_synthetic(args):
+    roster = generate_gallery(args.out, args.classes, args.per_class, samples=args.samples)
+    print(f"Created {args.classes} classes x {args.per_class} synthetic students in {args.out}/")
+    if args.frames:
+        frames_dir = args.frames_dir or os.path.join(os.path.dirname(args.out.rstrip('/')) or '.', 'frames')
+        generate_frames(frames_dir, roster, args.frames, args.faces_per_frame)
+        print(f"Created {args.frames} frames with {args.faces_per_frame} faces each in {frames_dir}/")
+
 def main():
+    parser = argparse.ArgumentParser(description="Create demo (or synthetic benchmark) enrollment photos")
+    parser.add_argument('--synthetic', action='store_true', help="generate a synthetic gallery instead")
+    parser.add_argument('--out', default='bench_data/ImagesAttendance')
+    parser.add_argument('--classes', type=int, default=4)
+    parser.add_argument('--per-class', type=int, default=50)
+    parser.add_argument('--samples', type=int, default=1, help="photos per student")
+    parser.add_argument('--frames', type=int, default=0, help="also write this many test frames")
+    parser.add_argument('--faces-per-frame', type=int, default=4)
+    parser.add_argument('--frames-dir', default=None)
+    args = parser.parse_args()
+    if args.synthetic:
+        main_synthetic(args)
+        return
+
     base = "ImagesAttendance"
     os.makedirs(base, exist_ok=True)
 
@@ -0,0 +1,292 @@
+# shared_gallery.py
+"""The recognition gallery shared between processes through memory-mapped files.
+
+The process that enrolls publishes each class shard as one float32 ``.npy``
+file (centroid rows, then the extra samples of multi-sample students) with
+a JSON sidecar of names, in ``/dev/shm`` where there is one so the pages
+never reach the disk.  An 8-byte header file holds the gallery version.
+
+Worker processes map the shard files read-only: every worker searches the
+same physical pages, so a worker's private memory hardly grows with the
+gallery.  A shard with a trained IVF index is published with its rows in
+cell order plus a small centroid file, so workers search it approximately
+from the same pages instead of falling back to an exact scan.  Before each search a worker compares the header with the
+version it has mapped and remaps only the shards that changed.
+
+    publisher = GalleryPublisher(recognizer.gallery)    # parent: republishes on every change
+    FaceRecognizer(gallery=attach(publisher.path))      # each worker (read-only)
+"""
+import itertools
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from gallery import Gallery, IVFIndex, ShardedGallery
+from metrics import metrics
+
+_HEADER = struct.Struct('<q')       # published version
+
+
+def default_folder():
+    shm = '/dev/shm'
+    return shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else tempfile.gettempdir()
+
+
+def _write_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class GalleryPublisher:
+    """Publish a ShardedGallery for worker processes and keep it current.
+
+    Every shard load or update in ``gallery`` republishes: only the shards
+    whose object changed (updates swap in a new copy) are rewritten, then
+    a new directory file is written and the header version bumped.
+    Superseded files are removed right away; workers that still map them
+    keep their pages until they remap.
+    """
+
+    def __init__(self, gallery, name=None, folder=None):
+        self.gallery = gallery
+        self.folder = folder or default_folder()
+        self.name = name or f"attendance-gallery-{os.getpid()}"
+        self.path = os.path.join(self.folder, f"{self.name}.head")
+        self.version = 0
+        self._published = {}    # class -> Gallery object last written
+        self._files = {}        # class -> (npy, json[, ivf npy]) of that shard
+        self._ids = {}          # class -> number used in its file names
+        self._next_id = itertools.count()
+        self._directory = None
+        self._stale = []        # files to delete (retried where mapped files cannot be)
+        self._lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self.path, 'wb') as f:
+            f.write(bytes(_HEADER.size))
+        self._head_file = open(self.path, 'r+b')
+        self._head = mmap.mmap(self._head_file.fileno(), _HEADER.size)
+        gallery.listeners.append(self._changed)
+        self.publish()
+
+    def _changed(self, class_name):
+        self.publish()
+
+    def publish(self):
+        """Write the shards changed since the last publish and bump the version; returns the version."""
+        with self._lock:
+            shards = dict(self.gallery.shards)
+            changed = [c for c, g in shards.items() if self._published.get(c) is not g]
+            removed = [c for c in self._published if c not in shards]
+            if self.version and not changed and not removed:
+                return self.version
+            start = time.perf_counter()
+            version = self.version + 1
+            for class_name in removed:
+                self._stale.extend(self._files.pop(class_name))
+                del self._published[class_name]
+            for class_name in changed:
+                old = self._files.get(class_name)
+                self._files[class_name] = self._write_shard(class_name, shards[class_name], version)
+                self._published[class_name] = shards[class_name]
+                if old:
+                    self._stale.extend(old)
+            directory = os.path.join(self.folder, f"{self.name}.v{version}.json")
+            _write_json(directory, {'version': version,
+                                    'classes': list(self.gallery.known_classes),
+                                    'shards': {c: os.path.basename(files[0])
+                                               for c, files in self._files.items()}})
+            _HEADER.pack_into(self._head, 0, version)
+            if self._directory:
+                self._stale.append(self._directory)
+            self._directory, self.version = directory, version
+            self._remove_stale()
+        metrics.record('shared_gallery.publish', time.perf_counter() - start)
+        return version
+
+    def _write_shard(self, class_name, gallery, version):
+        if class_name not in self._ids:
+            self._ids[class_name] = next(self._next_id)
+        base = os.path.join(self.folder, f"{self.name}.s{self._ids[class_name]}.v{version}")
+        names, classes, matrix, samples = gallery.arrays()
+        files, ivf = [base + '.npy', base + '.json'], None
+        index = gallery.index
+        if index is not None and index.ready(len(matrix)):
+            # rows in cell order: workers scan each probed cell straight from the map
+            order, offsets = index.cell_order(len(matrix))
+            new_row = np.empty(len(order), np.int64)
+            new_row[order] = np.arange(len(order))
+            names, classes, matrix = [names[i] for i in order], [classes[i] for i in order], matrix[order]
+            samples = {int(new_row[row]): entry for row, entry in samples.items()}
+            np.save(base + '.ivf.npy', index.centroids.astype(np.float32, copy=False))
+            files.append(base + '.ivf.npy')
+            ivf = {'offsets': offsets.tolist(), 'nprobe': index.nprobe, 'min_size': index.min_size}
+        blocks, extra, start = [matrix], [], len(matrix)
+        for row, (qualities, vectors) in sorted(samples.items()):
+            blocks.append(vectors)
+            extra.append([row, start, len(vectors), qualities])
+            start += len(vectors)
+        dim = matrix.shape[1] if len(matrix) else 0
+        block = np.concatenate(blocks).astype(np.float32, copy=False) if dim else np.zeros((0, 0), np.float32)
+        with open(base + '.npy.tmp', 'wb') as f:
+            np.save(f, block)
+        os.replace(base + '.npy.tmp', base + '.npy')
+        # a shard holds one class: store it once rather than per row
+        same = all(c == class_name for c in classes)
+        _write_json(base + '.json', {'class': class_name, 'names': names,
+                                     'classes': None if same else classes, 'samples': extra, 'ivf': ivf})
+        return tuple(files)
+
+    def _remove_stale(self):
+        keep = []
+        for path in self._stale:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                keep.append(path)       # still mapped somewhere (Windows); try again next time
+        self._stale = keep
+
+    def close(self):
+        """Stop publishing and delete every published file."""
+        with self._lock:
+            if self._changed in self.gallery.listeners:
+                self.gallery.listeners.remove(self._changed)
+            self._stale.extend(path for files in self._files.values() for path in files)
+            if self._directory:
+                self._stale.append(self._directory)
+            self._files, self._published, self._directory = {}, {}, None
+            self._head.close()
+            self._head_file.close()
+            self._stale.append(self.path)
+            self._remove_stale()
+
+
+def _no_loader(class_name, gallery):
+    """Classes nobody has published do not exist here."""
+    return False
+
+
+def _load_shard(npy_path):
+    # plain ndarray views of the read-only map: nothing is copied
+    block = np.load(npy_path, mmap_mode='r').view(np.ndarray)
+    with open(npy_path[:-len('.npy')] + '.json') as f:
+        meta = json.load(f)
+    n = len(meta['names'])
+    samples = {row: (qualities, block[start:start + count])
+               for row, start, count, qualities in meta['samples']}
+    classes = meta['classes'] or [meta['class']] * n
+    index = None
+    if meta.get('ivf'):
+        index = IVFIndex(nprobe=meta['ivf']['nprobe'], min_size=meta['ivf']['min_size'])
+        centroids = np.load(npy_path[:-len('.npy')] + '.ivf.npy', mmap_mode='r').view(np.ndarray)
+        index.attach(centroids, meta['ivf']['offsets'], block[:n])
+    return Gallery.from_arrays(meta['names'], classes, block[:n], samples, index=index)
+
+
+class SharedGalleryReader:
+    """Read-only, zero-copy view of a published gallery with the ShardedGallery
+    interface FaceRecognizer searches through.
+
+    Each search first checks the header (one 8-byte read) and, after a
+    publish, maps the new directory, reusing the shards that did not change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.folder = os.path.dirname(path)
+        self.name = os.path.basename(path)[:-len('.head')]
+        with open(path, 'rb') as f:
+            self._head = mmap.mmap(f.fileno(), _HEADER.size, access=mmap.ACCESS_READ)
+        self.version = 0
+        self.remaps = 0
+        self._files = {}        # class -> npy file name currently mapped
+        self._view = ShardedGallery(_no_loader)
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def published_version(self):
+        return _HEADER.unpack_from(self._head)[0]
+
+    def refresh(self):
+        """Map the latest publish if it is newer; returns True if anything was remapped."""
+        if self.published_version() == self.version:
+            return False
+        with self._lock:
+            for _ in range(50):
+                version = self.published_version()
+                if version == self.version:
+                    return False
+                try:
+                    self._attach(version)
+                    return True
+                except FileNotFoundError:
+                    time.sleep(0.01)    # superseded while we were reading it: take the newer one
+        raise RuntimeError(f"Could not map shared gallery {self.path}")
+
+    def _attach(self, version):
+        with open(os.path.join(self.folder, f"{self.name}.v{version}.json")) as f:
+            directory = json.load(f)
+        current = self._view.shards
+        shards = {}
+        for class_name, npy in directory['shards'].items():
+            if self._files.get(class_name) == npy and class_name in current:
+                shards[class_name] = current[class_name]
+            else:
+                shards[class_name] = _load_shard(os.path.join(self.folder, npy))
+        view = ShardedGallery(_no_loader)
+        view.known_classes = list(directory['classes'])
+        view.shards = shards
+        self._view, self.version = view, version
+        self._files = dict(directory['shards'])
+        self.remaps += 1
+        metrics.incr('shared_gallery.remaps')
+
+    # ---------- the ShardedGallery interface ----------
+    @property
+    def known_classes(self):
+        self.refresh()
+        return self._view.known_classes
+
+    @property
+    def shards(self):
+        return self._view.shards
+
+    def __len__(self):
+        return len(self._view)
+
+    def register(self, class_name):
+        pass
+
+    def shard(self, class_name):
+        self.refresh()
+        return self._view.shard(class_name)
+
+    def load_all(self):
+        self.refresh()
+
+    def match(self, queries, k=1, class_name=None, fallback=False, threshold=0.0):
+        self.refresh()
+        return self._view.match(queries, k, class_name, fallback, threshold)
+
+    def update_shard(self, class_name, fn):
+        raise RuntimeError("The shared gallery is read-only here; enroll in the process that publishes it")
+
+    def add(self, name, embedding, class_name):
+        return self.update_shard(class_name, None)
+
+    def remove(self, name, class_name):
+        return self.update_shard(class_name, None)
+
+
+def attach(path):
+    """Map the gallery published at ``path`` (a GalleryPublisher's ``path``)."""
+    return SharedGalleryReader(path)
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from attendance import AttendanceLog, PresenceCache
+
+DAY = datetime(2026, 3, 2, 9, 0, 0)
+NEXT_DAY = datetime(2026, 3, 3, 9, 0, 0)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_marks_once_per_day_and_class(tmp_path):
+    log = AttendanceLog(str(tmp_path / 'Attendance_{date}.csv'))
+    assert log.mark('Kunal', DAY, 'Core_A')
+    assert not log.mark('Kunal', DAY, 'Core_A')
+    assert log.mark('Kunal', DAY, 'Core A')         # a namesake in another class
+    assert log.mark('Kunal', NEXT_DAY, 'Core_A')    # rotates to the next day's file
+    log.close()
+    assert read(tmp_path / 'Attendance_2026-03-02.csv') == [
+        'Name,Date,Time,Class', 'Kunal,2026-03-02,09:00:00,Core_A', 'Kunal,2026-03-02,09:00:00,Core A']
+    assert len(read(tmp_path / 'Attendance_2026-03-03.csv')) == 2
+
+
+def test_recovers_todays_marks_after_restart(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    with open(path, 'w') as f:
+        f.write("Name,Date,Time,Class\nOld,2026-03-01,09:00:00,C\nAnn,2026-03-02,08:00:00,C\n")
+    log = AttendanceLog(path)
+    assert not log.mark('Ann', DAY, 'C')
+    assert log.mark('Old', DAY, 'C')                # marked on an earlier day only
+    log.close()
+
+
+def test_torn_last_line_is_cut(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    with open(path, 'w') as f:
+        f.write("Name,Date,Time,Class\nAnn,2026-03-02,08:00:00,C\nBo,2026-03-0")
+    log = AttendanceLog(path)
+    assert log.mark('Bo', DAY, 'C')
+    assert not log.mark('Ann', DAY, 'C')
+    log.close()
+    assert read(path) == ['Name,Date,Time,Class', 'Ann,2026-03-02,08:00:00,C', 'Bo,2026-03-02,09:00:00,C']
+
+
+def test_complete_row_missing_newline_is_kept(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    with open(path, 'w') as f:
+        f.write("Name,Date,Time,Class\nAnn,2026-03-02,08:00:00,C")
+    log = AttendanceLog(path)
+    assert not log.mark('Ann', DAY, 'C')
+    assert log.mark('Bo', DAY, 'C')
+    log.close()
+    assert read(path)[1:] == ['Ann,2026-03-02,08:00:00,C', 'Bo,2026-03-02,09:00:00,C']
+
+
+def test_old_three_column_files_keep_their_format(tmp_path):
+    path = str(tmp_path / 'log.csv')
+    with open(path, 'w') as f:
+        f.write("Name,Date,Time\nAnn,2026-03-02,08:00:00\n")
+    log = AttendanceLog(path)
+    assert not log.mark('Ann', DAY, 'C')            # a name-only row covers every class
+    assert log.mark('Bo', DAY, 'C')
+    log.close()
+    assert read(path)[-1] == 'Bo,2026-03-02,09:00:00'
+
+
+def test_presence_cache_pending_until_written():
+    cache = PresenceCache()
+    key = ('Ann', 'C')
+    assert cache.check_and_add(key, DAY)
+    assert not cache.check_and_add(key, DAY)        # in flight
+    cache.release(key)                              # the write recorded nothing
+    assert cache.check_and_add(key, DAY)
+    cache.add(key, '2026-03-02')
+    assert not cache.check_and_add(key, DAY)
+    assert cache.stats()['present'] == 1 and cache.stats()['pending'] == 0
+
+
+def test_presence_cache_day_rollover_reseeds():
+    seeded = []
+
+    def seed(date_str):
+        seeded.append(date_str)
+        return {('Ann', 'C')} if date_str == '2026-03-02' else set()
+
+    cache = PresenceCache(seed=seed)
+    assert not cache.check_and_add(('Ann', 'C'), DAY)       # already in the database
+    assert cache.check_and_add(('Bo', 'C'), DAY)
+    cache.add(('Bo', 'C'), '2026-03-02')
+    assert cache.check_and_add(('Ann', 'C'), NEXT_DAY)      # midnight: everyone is new again
+    assert cache.check_and_add(('Bo', 'C'), NEXT_DAY)
+    cache.add(('Late', 'C'), '2026-03-02')                  # a write for yesterday is not today
+    assert cache.check_and_add(('Late', 'C'), NEXT_DAY)
+    assert seeded == ['2026-03-02', '2026-03-03']
@@ -0,0 +1,108 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'test.db')
+    database.init_db(path)
+    return path
+
+
+def write(path, marks, **kwargs):
+    inserted, failed = [], []
+    writer = database.AttendanceWriter(path, batch_interval=0.01, on_inserted=inserted.extend,
+                                       on_failed=failed.extend, **kwargs)
+    for mark in marks:
+        writer.mark(*mark)
+    writer.close()
+    return writer, inserted, failed
+
+
+def test_init_db_dedupes_once_and_is_repeatable(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE attendance (id INTEGER PRIMARY KEY, student_id INTEGER, date TEXT, time TEXT)")
+    conn.executemany("INSERT INTO attendance (student_id, date, time) VALUES (?, ?, ?)",
+                     [(1, '2026-03-02', '09:00:00'), (1, '2026-03-02', '10:00:00'), (2, '2026-03-02', '09:00:00')])
+    conn.commit()
+    conn.close()
+    database.init_db(path)
+    database.init_db(path)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT student_id, time FROM attendance ORDER BY id").fetchall() == [
+        (1, '09:00:00'), (2, '09:00:00')]
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO attendance (student_id, date, time) VALUES (1, '2026-03-02', '11:00:00')")
+    conn.close()
+
+
+def test_writer_dedupes_within_and_across_batches(db):
+    database.add_student('Ann', 'C', path=db)
+    when = datetime(2026, 3, 2, 9, 0, 0)
+    writer, inserted, _ = write(db, [('Ann', 'C', when), ('Ann', 'C', when)])
+    assert inserted == [('Ann', 'C', '2026-03-02', '09:00:00')]
+    assert writer.stats['duplicates'] == 1
+    _, inserted, _ = write(db, [('Ann', 'C', when.replace(hour=10))])
+    assert inserted == []
+    assert database.present_students('2026-03-02', db) == [('Ann', 'C')]
+
+
+def test_writer_resolves_namesakes_by_class(db):
+    core_a = database.add_student('Kunal', 'Core_A', path=db)
+    database.add_student('Kunal', 'Core A', path=db)
+    when = datetime(2026, 3, 2, 9, 0, 0)
+    writer, inserted, failed = write(db, [('Kunal', 'Core_A', when), ('Kunal', 'Core B', when),
+                                          ('Ghost', None, when)])
+    assert inserted == [('Kunal', 'Core_A', '2026-03-02', '09:00:00')]
+    # another class's namesake is not a match: the mark is unknown and handed back
+    assert [(n, c) for n, c, _ in failed] == [('Kunal', 'Core B'), ('Ghost', None)]
+    assert writer.stats['unknown'] == 2
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT student_id FROM attendance").fetchall() == [(core_a,)]
+    conn.close()
+
+
+def test_writer_without_class_uses_the_name(db):
+    database.add_student('Ann', 'C', path=db)
+    _, inserted, _ = write(db, [('Ann', None, datetime(2026, 3, 2, 9))])
+    assert [row[:2] for row in inserted] == [('Ann', None)]
+
+
+def summaries(path):
+    conn = sqlite3.connect(path)
+    daily = conn.execute("SELECT date, class_id, present FROM daily_class_summary ORDER BY 1, 2").fetchall()
+    monthly = conn.execute("SELECT student_id, month, days FROM student_month_summary ORDER BY 1, 2").fetchall()
+    conn.close()
+    return daily, monthly
+
+
+def test_summary_triggers_follow_inserts_updates_and_deletes(db):
+    a = database.add_student('Ann', 'C', path=db)
+    b = database.add_student('Bo', 'C', path=db)
+    conn = sqlite3.connect(db)
+    class_id = conn.execute("SELECT id FROM classes WHERE name = 'C'").fetchone()[0]
+    with conn:
+        conn.executemany("INSERT INTO attendance (student_id, date, time) VALUES (?, ?, '09:00:00')",
+                         [(a, '2026-03-02'), (b, '2026-03-02'), (a, '2026-03-03'), (a, '2026-04-01')])
+    assert summaries(db) == (
+        [('2026-03-02', class_id, 2), ('2026-03-03', class_id, 1), ('2026-04-01', class_id, 1)],
+        [(a, '2026-03', 2), (a, '2026-04', 1), (b, '2026-03', 1)])
+
+    with conn:
+        conn.execute("UPDATE attendance SET date = '2026-03-04' WHERE student_id = ? AND date = '2026-03-03'", (a,))
+        conn.execute("DELETE FROM attendance WHERE date = '2026-04-01'")
+    # a day nobody is left marked on disappears
+    assert summaries(db) == (
+        [('2026-03-02', class_id, 2), ('2026-03-04', class_id, 1)],
+        [(a, '2026-03', 2), (b, '2026-03', 1)])
+
+    expected = summaries(db)
+    database.rebuild_summaries(conn)
+    conn.commit()
+    conn.close()
+    assert summaries(db) == expected
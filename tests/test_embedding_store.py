@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+
+def photo(tmp_path, name, data=b'face'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_miss_then_hit_after_reload(tmp_path):
+    path = photo(tmp_path, 'a.jpg')
+    store = EmbeddingStore(str(tmp_path / 'cache'), 'stub')
+    assert store.lookup('C/a.jpg', path) == (False, None)
+    store.put('C/a.jpg', path, [1.0, 2.0], quality=0.8)
+    store.put('C/none.jpg', path, None)
+    store.save()
+    assert not [f for f in os.listdir(tmp_path / 'cache') if f.endswith('.tmp') or f.startswith('tmp')]
+
+    again = EmbeddingStore(str(tmp_path / 'cache'), 'stub')
+    hit, emb = again.lookup('C/a.jpg', path)
+    assert hit and np.allclose(emb, [1.0, 2.0])
+    assert again.quality('C/a.jpg') == 0.8
+    assert again.lookup('C/none.jpg', path) == (True, None)    # cached "no face"
+    assert (again.hits, again.misses) == (2, 0)
+
+
+def test_changed_file_misses_touched_file_hits(tmp_path):
+    path = photo(tmp_path, 'a.jpg')
+    store = EmbeddingStore(str(tmp_path), 'stub')
+    store.put('a', path, [1.0])
+    # same content, new mtime: the hash says it is unchanged
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert store.lookup('a', path)[0]
+    # new content of the same size
+    photo(tmp_path, 'a.jpg', b'FACE')
+    assert store.lookup('a', path) == (False, None)
+
+
+def test_signature_separates_models_and_settings(tmp_path):
+    path = photo(tmp_path, 'a.jpg')
+    store = EmbeddingStore(str(tmp_path), 'stub', {'detector': 'x'})
+    store.put('a', path, [1.0])
+    store.save()
+    assert EmbeddingStore(str(tmp_path), 'stub', {'detector': 'x'}).lookup('a', path)[0]
+    assert not EmbeddingStore(str(tmp_path), 'stub', {'detector': 'y'}).lookup('a', path)[0]
+    assert not EmbeddingStore(str(tmp_path), 'other', {'detector': 'x'}).lookup('a', path)[0]
+
+
+def test_forget_and_prune(tmp_path):
+    path = photo(tmp_path, 'a.jpg')
+    store = EmbeddingStore(str(tmp_path), 'stub')
+    for key in ('A/a.jpg', 'A/b.jpg', 'B/c.jpg'):
+        store.put(key, path, [1.0])
+    store.forget('A/a.jpg')
+    store.prune(['A/x.jpg'], prefix='A/')
+    assert sorted(store.entries) == ['B/c.jpg']
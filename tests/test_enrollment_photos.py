@@ -0,0 +1,27 @@
+import os
+
+from core_recognition import enrollment_photos
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KNOWN_FOLDER = os.path.join(ROOT, 'ImagesAttendance')
+
+
+def test_class_folders_hold_students():
+    """The repo's own layout: ImagesAttendance/<class>/<student>.jpg."""
+    photos = list(enrollment_photos(KNOWN_FOLDER))
+    found = {(class_name, name) for _, _, name, class_name in photos}
+    assert {('Core_A', 'Kunal'), ('Core_A', 'daksh'), ('Core_A', 'himanshu'), ('Core_A', 'unnati'),
+            ('Core A', 'Daksh'), ('Core A', 'Kunal')} <= found
+    # a class is never mistaken for a person, and non-images are skipped
+    assert not {name for _, name in found} & {'Core_A', 'Core A'}
+    assert all(path.lower().endswith(('.png', '.jpg', '.jpeg')) for _, path, _, _ in photos)
+
+
+def test_student_folders_and_loose_photos(tmp_path):
+    (tmp_path / 'Class_1' / 'ann').mkdir(parents=True)
+    for rel in ['Class_1/bob.jpg', 'Class_1/ann/1.jpg', 'Class_1/ann/2.png', 'Class_1/notes.txt',
+                'Class_1/.hidden.jpg', 'loose.jpg']:
+        (tmp_path / rel).write_bytes(b'')
+    photos = sorted((key, name, class_name) for key, _, name, class_name in enrollment_photos(str(tmp_path)))
+    assert photos == [('Class_1/ann/1.jpg', 'ann', 'Class_1'), ('Class_1/ann/2.png', 'ann', 'Class_1'),
+                      ('Class_1/bob.jpg', 'bob', 'Class_1'), ('loose.jpg', 'loose', None)]
@@ -0,0 +1,121 @@
+import numpy as np
+
+from gallery import Gallery, IVFIndex, ShardedGallery, l2_normalize
+
+
+def vectors(n, dim=32, seed=0):
+    return l2_normalize(np.random.default_rng(seed).normal(size=(n, dim)))
+
+
+def test_add_match_remove():
+    v = vectors(5)
+    g = Gallery()
+    g.add_many(['a', 'b', 'c', 'd', 'e'], v, ['C'] * 5)
+    assert len(g) == 5
+    top = g.match(v[2:3], k=2)[0]
+    assert top[0].name == 'c' and top[0].class_name == 'C'
+    assert abs(top[0].score - 1.0) < 1e-5
+    assert top[0].margin == top[0].score - top[1].score
+
+    # the last row moves into the hole and still matches itself
+    assert g.remove('b', 'C')
+    assert not g.remove('b', 'C')
+    assert len(g) == 4 and ('C', 'b') not in g
+    assert [g.match(v[i:i + 1])[0][0].name for i in (0, 2, 3, 4)] == ['a', 'c', 'd', 'e']
+
+
+def test_add_replaces_same_identity():
+    v = vectors(2)
+    g = Gallery()
+    g.add('a', v[0], 'C')
+    g.add('a', v[1], 'C')
+    assert len(g) == 1
+    assert g.match(v[1:2])[0][0].score > 0.99
+
+
+def test_samples_rerank_and_cap():
+    v = vectors(4)
+    g = Gallery(max_samples=2)
+    g.add_sample('a', v[0], 'C', quality=1.0, sample_id='front')
+    g.add_sample('a', v[1], 'C', quality=0.5, sample_id='side')
+    g.add('b', v[2], 'C')
+    # the centroid is between the samples, but re-ranking scores the closest one
+    assert g.match(v[1:2])[0][0].name == 'a'
+    assert g.match(v[1:2])[0][0].score > 0.99
+    # over max_samples the lowest quality sample is dropped
+    assert g.add_sample('a', v[3], 'C', quality=0.9, sample_id='new')
+    assert sorted(g.samples('a', 'C')) == [('front', 1.0), ('new', 0.9)]
+    assert not g.add_sample('a', v[1], 'C', quality=0.1, sample_id='blurry')
+    assert g.remove_sample('a', 'C', 'front') and g.remove_sample('a', 'C', 'new')
+    assert ('C', 'a') not in g
+
+
+def test_copy_leaves_original_untouched():
+    v = vectors(3)
+    g = Gallery()
+    g.add_many(['a', 'b'], v[:2], ['C', 'C'])
+    before = g.matrix.copy()
+    h = g.copy()
+    h.add('c', v[2], 'C')
+    h.remove('a', 'C')
+    h.add_sample('b', v[0], 'C', sample_id='x')
+    assert len(g) == 2 and ('C', 'a') in g
+    assert np.array_equal(g.matrix, before)
+    assert g.samples('b', 'C') == [(None, 1.0)]
+
+
+def test_ivf_recall():
+    v = vectors(4000, dim=64, seed=1)
+    rng = np.random.default_rng(2)
+    queries = l2_normalize(v[:200] + 0.05 * rng.normal(size=(200, 64)))
+    g = Gallery(index=IVFIndex(nprobe=8, min_size=1000))
+    g.add_many([f"s{i}" for i in range(len(v))], v, ['C'] * len(v))
+    assert g.build_index()
+    assert g.index.ready(len(g))
+    found = [m[0].name for m in g.match(queries)]
+    recall = np.mean([name == f"s{i}" for i, name in enumerate(found)])
+    assert recall >= 0.95
+
+    # rows added after training are searchable right away
+    g.add('late', v[0] * -1, 'C')
+    assert g.match(-v[0:1])[0][0].name == 'late'
+
+
+def test_sharded_gallery_loads_once_and_ignores_unknown_classes():
+    v = vectors(4)
+    calls = []
+
+    def loader(class_name, gallery):
+        calls.append(class_name)
+        if class_name not in ('A', 'B'):
+            return False
+        i = 0 if class_name == 'A' else 2
+        gallery.add_many([f"{class_name}{j}" for j in range(2)], v[i:i + 2], [class_name] * 2)
+
+    sharded = ShardedGallery(loader)
+    sharded.register('A')
+    sharded.register('B')
+    assert sharded.match(v[2:3], class_name='B')[0][0].name == 'B0'
+    assert sharded.match(v[0:1])[0][0].name == 'A0'
+    assert sorted(calls) == ['A', 'B']
+
+    # a mistyped class is searched as empty but never becomes known
+    assert sharded.match(v[0:1], class_name='Typo') == [[]]
+    assert sharded.known_classes == ['A', 'B'] and 'Typo' not in sharded.shards
+
+    # fallback retries the other classes when the class has no good match
+    top = sharded.match(v[0:1], class_name='B', fallback=True, threshold=0.9)[0][0]
+    assert top.name == 'A0'
+
+
+def test_update_shard_swaps_a_copy():
+    v = vectors(2)
+    sharded = ShardedGallery(lambda c, g: g.add('a', v[0], c))
+    old = sharded.shard('A')
+    seen = []
+    sharded.listeners.append(seen.append)
+    sharded.add('b', v[1], 'A')
+    assert len(old) == 1 and len(sharded.shard('A')) == 2
+    assert seen == ['A']
+    sharded.add('x', v[1], 'New')
+    assert 'New' in sharded.known_classes
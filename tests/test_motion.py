@@ -0,0 +1,56 @@
+import numpy as np
+
+from motion import MotionGate, merge_boxes
+
+
+def frame(square=None):
+    img = np.zeros((480, 640, 3), np.uint8)
+    if square is not None:
+        x, y = square
+        img[y:y + 80, x:x + 80] = 255
+    return img
+
+
+def test_first_frame_is_a_full_detection_then_static_frames_skip():
+    gate = MotionGate(refresh_interval=1e9)
+    first = gate.check(frame())
+    assert not first.skip and first.rois is None
+    assert all(gate.check(frame()).skip for _ in range(5))
+    assert gate.stats()['skipped'] == 5
+
+
+def test_local_change_gives_its_region_only():
+    gate = MotionGate(refresh_interval=1e9)
+    gate.check(frame())
+    motion = gate.check(frame((400, 300)))
+    assert not motion.skip and len(motion.rois) == 1
+    x, y, w, h = motion.rois[0]
+    assert x <= 400 and y <= 300 and x + w >= 480 and y + h >= 380
+    assert w * h < 640 * 480 / 2
+
+
+def test_large_change_and_refresh_force_full_detection():
+    gate = MotionGate(refresh_interval=1e9)
+    gate.check(frame())
+    lights_on = np.full((480, 640, 3), 200, np.uint8)
+    assert gate.check(lights_on).rois is None
+
+    gate = MotionGate(refresh_interval=0.0)
+    gate.check(frame())
+    refreshed = gate.check(frame())
+    assert not refreshed.skip and refreshed.rois is None
+    assert gate.stats()['refresh'] == 1
+
+
+def test_reset_forgets_the_background():
+    gate = MotionGate(refresh_interval=1e9)
+    gate.check(frame())
+    gate.reset()
+    assert gate.check(frame()).rois is None
+
+
+def test_merge_boxes_keeps_boxes_outside_the_searched_regions():
+    previous = [(10, 10, 50, 50), (400, 300, 80, 80)]
+    found = [(405, 302, 80, 80)]
+    merged = merge_boxes(previous, found, rois=[(350, 250, 200, 200)])
+    assert merged == [(10, 10, 50, 50), (405, 302, 80, 80)]
@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+import pytest
+
+import benchmark
+from core_recognition import check_folder_name
+from setup_demo import generate_gallery, synthetic_frame
+
+
+@pytest.fixture
+def gallery_dir(tmp_path):
+    generate_gallery(str(tmp_path / 'gallery'), classes=2, per_class=4)
+    return str(tmp_path / 'gallery')
+
+
+def recognizer(gallery_dir, tmp_path, **kwargs):
+    return benchmark.stub_recognizer(gallery_dir, str(tmp_path / 'cache'), **kwargs)
+
+
+def bgr(names, seed=0):
+    img, boxes = synthetic_frame(names, seed=seed)
+    return cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR), boxes
+
+
+def test_recognizes_within_the_class(gallery_dir, tmp_path):
+    rec = recognizer(gallery_dir, tmp_path)
+    frame, _ = bgr(['Class_01_s00001', 'Class_01_s00003'])
+    found = sorted((r.name, r.class_name) for r in rec.recognize(frame, 'Class_01'))
+    assert found == [('Class_01_s00001', 'Class_01'), ('Class_01_s00003', 'Class_01')]
+    # only the searched class was loaded
+    assert list(rec.gallery.shards) == ['Class_01']
+    assert rec.known_classes == ['Class_01', 'Class_02']
+
+
+def test_embeddings_are_cached_between_runs(gallery_dir, tmp_path):
+    recognizer(gallery_dir, tmp_path).preload()
+    again = recognizer(gallery_dir, tmp_path)
+    again.preload()
+    assert again.store.misses == 0 and again.store.hits == 8
+
+
+def test_unknown_class_is_not_registered(gallery_dir, tmp_path):
+    rec = recognizer(gallery_dir, tmp_path)
+    frame, _ = bgr(['Class_01_s00001'])
+    assert all(r.name == 'Unknown' for r in rec.recognize(frame, 'Clas_01'))
+    assert 'Clas_01' not in rec.known_classes
+
+
+def test_enroll_and_unenroll(gallery_dir, tmp_path):
+    rec = recognizer(gallery_dir, tmp_path)
+    photo, _ = bgr(['Class_02_s00000'])
+    rec.enroll('New', 'Class_01', photo, record=False)
+    frame, _ = bgr(['Class_02_s00000'], seed=3)
+    assert [r.name for r in rec.recognize(frame, 'Class_01')] == ['New']
+    with pytest.raises(ValueError):
+        rec.enroll('New', 'Class_01', photo, record=False)
+    assert rec.unenroll('New', 'Class_01')
+    assert [r.name for r in rec.recognize(frame, 'Class_01')] != ['New']
+
+
+@pytest.mark.parametrize('name', ['../evil', 'a/b', 'a\\b', '.hidden', '..', '', 'x..y'])
+def test_enroll_rejects_unsafe_names(gallery_dir, tmp_path, name):
+    with pytest.raises(ValueError):
+        check_folder_name(name)
+    rec = recognizer(gallery_dir, tmp_path)
+    photo, _ = bgr(['Class_01_s00000'])
+    with pytest.raises(ValueError):
+        rec.enroll(name, 'Class_01', photo, record=False)
+    with pytest.raises(ValueError):
+        rec.enroll('ok', name, photo, record=False)
+
+
+def test_live_samples_are_capped(gallery_dir, tmp_path):
+    rec = recognizer(gallery_dir, tmp_path, auto_capture=True, capture_score=0.0, capture_margin=-1.0,
+                     capture_quality=0.0, capture_interval=0.0, live_samples=2)
+    frame, _ = bgr(['Class_01_s00002'])
+    for _ in range(4):
+        rec.recognize(frame, 'Class_01')
+    samples = rec.gallery.shard('Class_01').samples('Class_01_s00002', 'Class_01')
+    assert len([s for s, _ in samples if str(s).startswith('live:')]) == 2
@@ -0,0 +1,75 @@
+import csv
+import gzip
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import database
+import reports
+
+MARKS = {
+    'C': {'Ann': ['2026-02-27', '2026-03-02', '2026-03-03', '2026-04-01'],
+          'Bo': ['2026-02-27', '2026-03-02', '2026-03-31'],
+          'Cy': ['2026-03-02']},
+    'D': {'Dee': ['2026-03-02']},
+}
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'reports.db')
+    database.init_db(path)
+    marks = [(database.add_student(name, class_name, path=path), day)
+             for class_name, students in MARKS.items() for name, days in students.items() for day in days]
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany("INSERT INTO attendance (student_id, date, time) VALUES (?, ?, '09:00:00')", marks)
+    conn.close()
+    return path
+
+
+def test_class_rates(db):
+    rows = reports.class_rates('2026-03-01', '2026-03-31', path=db)
+    assert rows == [reports.ClassRate('C', 3, 3, 5, round(5 / 9, 4)), reports.ClassRate('D', 1, 1, 1, 1.0)]
+    assert reports.class_rates('2026-03-01', '2026-03-31', 'D', path=db) == rows[1:]
+
+
+def test_monthly_rates(db):
+    rows = reports.monthly_rates('2026-02', '2026-04', 'C', path=db)
+    assert [(r.month, r.days, r.present, r.rate) for r in rows] == [
+        ('2026-02', 1, 2, round(2 / 3, 4)), ('2026-03', 3, 5, round(5 / 9, 4)), ('2026-04', 1, 1, round(1 / 3, 4))]
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    # partial month at both ends around a whole month read from the summary
+    ('2026-02-27', '2026-04-01', {'Ann': (4, 5), 'Bo': (3, 5), 'Cy': (1, 5), 'Dee': (1, 1)}),
+    # inside one month
+    ('2026-03-02', '2026-03-03', {'Ann': (2, 2), 'Bo': (1, 2), 'Cy': (1, 2), 'Dee': (1, 1)}),
+    # exactly one whole month
+    ('2026-03-01', '2026-03-31', {'Ann': (2, 3), 'Bo': (2, 3), 'Cy': (1, 3), 'Dee': (1, 1)}),
+])
+def test_student_rates(db, start, end, expected):
+    rows = reports.student_rates(start, end, path=db)
+    assert {r.name: (r.present, r.days) for r in rows} == expected
+    assert all(r.rate == round(r.present / r.days, 4) for r in rows)
+
+
+def test_student_months(db):
+    rows = reports.student_months('2026-02', '2026-04', 'C', path=db)
+    bo = [(r.month, r.present, r.days) for r in rows if r.name == 'Bo']
+    assert bo == [('2026-02', 1, 1), ('2026-03', 2, 3), ('2026-04', 0, 1)]
+
+
+def test_write_rows_gzip_round_trip(tmp_path):
+    out = str(tmp_path / 'sub' / 'rows.csv.gz')
+    assert reports.write_rows(out, ('a', 'b'), iter([(1, 'x'), (2, 'y')]), chunk_rows=1) == 2
+    with gzip.open(out, 'rt', newline='') as f:
+        assert list(csv.reader(f)) == [['a', 'b'], ['1', 'x'], ['2', 'y']]
+
+
+def test_export_schedule():
+    friday_evening = datetime(2026, 3, 6, 18, 0)
+    assert reports.next_export(friday_evening) == datetime(2026, 3, 9, 17, 0)
+    assert reports.next_export(datetime(2026, 3, 9, 8, 0)) == datetime(2026, 3, 9, 17, 0)
+    assert reports.due_exports(datetime(2026, 3, 9, 16, 0), lookback_days=3) == ['2026-03-06']
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from gallery import ShardedGallery, l2_normalize
+from shared_gallery import GalleryPublisher, attach
+
+
+def vectors(n, dim=32, seed=0):
+    return l2_normalize(np.random.default_rng(seed).normal(size=(n, dim)))
+
+
+@pytest.fixture
+def published(tmp_path):
+    v = vectors(6)
+    sharded = ShardedGallery(lambda c, g: None)
+    sharded.shard('A').add_many(['a0', 'a1'], v[:2], ['A', 'A'])
+    sharded.shard('B').add_many(['b0', 'b1'], v[2:4], ['B', 'B'])
+    publisher = GalleryPublisher(sharded, name='test', folder=str(tmp_path))
+    yield sharded, publisher, v
+    publisher.close()
+
+
+def test_reader_searches_the_published_gallery(published):
+    sharded, publisher, v = published
+    reader = attach(publisher.path)
+    assert reader.version == publisher.version == 1
+    assert sorted(reader.known_classes) == ['A', 'B']
+    assert reader.match(v[3:4])[0][0].name == 'b1'
+    assert reader.match(v[0:1], class_name='A')[0][0].name == 'a0'
+    # the rows are a read-only map, not a private copy
+    assert not reader.shard('A').matrix.flags.writeable
+    with pytest.raises(RuntimeError):
+        reader.add('x', v[0], 'A')
+
+
+def test_update_remaps_only_the_changed_shard(published):
+    sharded, publisher, v = published
+    reader = attach(publisher.path)
+    untouched = reader.shard('B')
+    sharded.add('a2', v[4], 'A')                # swaps in a new A shard -> republish
+    assert publisher.version == 2
+    assert reader.match(v[4:5], class_name='A')[0][0].name == 'a2'
+    assert reader.version == 2 and reader.remaps == 2
+    assert reader.shard('B') is untouched
+    # nothing new published: no remap
+    reader.match(v[4:5])
+    assert reader.remaps == 2
+
+
+def test_unpublished_classes_stay_unknown(published):
+    _, publisher, v = published
+    reader = attach(publisher.path)
+    assert reader.match(v[0:1], class_name='Typo') == [[]]
+    assert 'Typo' not in reader.known_classes
+
+
+def test_multi_sample_identities_survive_publishing(published):
+    sharded, publisher, v = published
+    sharded.update_shard('A', lambda g: (g.add_sample('a0', v[0], 'A', 1.0, 'x'),
+                                         g.add_sample('a0', v[5], 'A', 0.5, 'y')))
+    reader = attach(publisher.path)
+    top = reader.match(v[5:6], class_name='A')[0][0]
+    assert top.name == 'a0' and top.score > 0.99
+
+
+def test_ivf_index_is_published(tmp_path):
+    v = vectors(3000, dim=64, seed=1)
+    sharded = ShardedGallery(lambda c, g: None, index='ivf')
+    shard = sharded.shard('A')
+    shard.add_many([f"s{i}" for i in range(len(v))], v, ['A'] * len(v))
+    shard.build_index()
+    publisher = GalleryPublisher(sharded, name='ivf', folder=str(tmp_path))
+    try:
+        worker = attach(publisher.path).shard('A')
+        assert worker.index is not None and worker.index.ready(len(worker))
+        queries = l2_normalize(v[:100] + 0.05 * np.random.default_rng(2).normal(size=(100, 64)))
+        assert [m[0].name for m in worker.match(queries)] == [m[0].name for m in shard.match(queries)]
+    finally:
+        publisher.close()
@@ -0,0 +1,67 @@
+from tracking import FaceTracker, iou
+
+BOX = (100, 100, 80, 80)
+
+
+def run(tracker, scores, name='Ann', class_name='C'):
+    """Feed one steady face; returns the frame its identity was confirmed on."""
+    for frame, score in enumerate(scores, 1):
+        todo, _ = tracker.split(tracker.update([BOX]))
+        for track in todo:
+            if tracker.assign(track, name, score, class_name):
+                return frame
+    return None
+
+
+def test_iou():
+    assert iou(BOX, BOX) == 1.0
+    assert iou(BOX, (300, 300, 10, 10)) == 0.0
+    assert abs(iou((0, 0, 10, 10), (5, 0, 10, 10)) - 1 / 3) < 1e-9
+
+
+def test_strong_and_weak_matches_confirm_equally_fast():
+    assert run(FaceTracker(votes_needed=3, min_score=0.45), [0.8] * 100) == 3
+    assert run(FaceTracker(votes_needed=3, min_score=0.45), [0.5] * 100) == 3
+
+
+def test_confirmed_track_is_only_rechecked_every_reverify_frames():
+    tracker = FaceTracker(votes_needed=2, reverify_every=10, min_score=0.45)
+    assert run(tracker, [0.9] * 2) == 2
+    checked = [bool(tracker.split(tracker.update([BOX]))[0]) for _ in range(10)]
+    assert checked == [False] * 9 + [True]
+    assert tracker.embeddings_saved == 9
+
+
+def test_votes_pick_the_majority_identity():
+    tracker = FaceTracker(votes_needed=3)
+    track = tracker.update([BOX])[0]
+    assert not tracker.assign(track, 'Ann', 0.9, 'C')
+    assert not tracker.assign(track, 'Bo', 0.9, 'C')
+    assert not tracker.assign(track, 'Ann', 0.9, 'C')
+    assert (track.name, track.class_name) == ('Ann', 'C')
+    assert tracker.assign(track, 'Ann', 0.9, 'C')
+    assert track.confirmed
+    # namesakes in different classes are different votes
+    other = tracker.update([BOX, (400, 100, 80, 80)])[1]
+    tracker.assign(other, 'Ann', 0.9, 'C')
+    tracker.assign(other, 'Ann', 0.9, 'D')
+    assert other.votes[('Ann', 'C')] == other.votes[('Ann', 'D')] == 1
+
+
+def test_unknown_faces_are_retried_on_a_schedule():
+    tracker = FaceTracker(retry_unknown_every=5)
+    track = tracker.update([BOX])[0]
+    tracker.assign(track, 'Unknown', 0.1)
+    retried = [bool(tracker.split(tracker.update([BOX]))[0]) for _ in range(5)]
+    assert retried == [False] * 4 + [True]
+
+
+def test_tracks_follow_moving_boxes_and_expire():
+    tracker = FaceTracker(max_misses=2)
+    first = tracker.update([BOX])[0]
+    moved = tracker.update([(110, 104, 80, 80)])[0]
+    assert moved is first
+    for _ in range(3):
+        tracker.update([])
+    assert tracker.tracks == []
+    assert tracker.update([BOX])[0].id != first.id
@@ -0,0 +1,151 @@
+# tracking.py
+import itertools
+from collections import Counter
+
+import numpy as np
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+class KalmanBox:
+    """Constant-velocity Kalman filter over box centre and size."""
+
+    _F = np.eye(8) + np.eye(8, k=4)
+    _H = np.eye(4, 8)
+    _Q = np.diag([1, 1, 1, 1, 0.5, 0.5, 0.25, 0.25])
+    _R = np.diag([4, 4, 9, 9])
+
+    def __init__(self, box):
+        x, y, w, h = box
+        self.x = np.array([x + w / 2, y + h / 2, w, h, 0, 0, 0, 0], float)
+        self.P = np.diag([10, 10, 10, 10, 100, 100, 100, 100]).astype(float)
+
+    def predict(self):
+        self.x = self._F @ self.x
+        self.P = self._F @ self.P @ self._F.T + self._Q
+        return self.box()
+
+    def update(self, box):
+        x, y, w, h = box
+        z = np.array([x + w / 2, y + h / 2, w, h], float)
+        S = self._H @ self.P @ self._H.T + self._R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self._H @ self.x)
+        self.P = (np.eye(8) - K @ self._H) @ self.P
+
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        w, h = max(w, 1.0), max(h, 1.0)
+        return (int(cx - w / 2), int(cy - h / 2), int(w), int(h))
+
+
+class Track:
+    def __init__(self, track_id, box, frame_no):
+        self.id = track_id
+        self.box = box                  # last detected box
+        self.kalman = KalmanBox(box)
+        self.name = None                # best-voted identity so far
+        self.class_name = None
+        self.score = 0.0
+        self.votes = Counter()          # (name, class_name) -> recognitions
+        self.confirmed = False
+        self.misses = 0
+        self.last_seen = frame_no
+        self.last_verified = None
+
+
+class FaceTracker:
+    """Gives detections stable track IDs so each face is recognised once, not every frame.
+
+    A track is sent to the embedding model on every frame until its identity
+    is confirmed by ``votes_needed`` agreeing recognitions (unknown faces are
+    retried every ``retry_unknown_every`` frames).  A confirmed track is only
+    re-checked when its last score was weak or ``reverify_every`` frames
+    have passed.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=10, reverify_every=30,
+                 retry_unknown_every=5, min_score=0.55, votes_needed=3):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.reverify_every = reverify_every
+        self.retry_unknown_every = retry_unknown_every
+        self.min_score = min_score
+        self.votes_needed = votes_needed
+        self.tracks = []
+        self.frame_no = 0
+        self.embeddings_saved = 0
+        self._ids = itertools.count(1)
+
+    def update(self, boxes):
+        """Associate this frame's boxes with tracks; returns the tracks seen in this frame."""
+        self.frame_no += 1
+        predicted = [t.kalman.predict() for t in self.tracks]
+
+        # greedy IoU association, best overlaps first
+        pairs = sorted(((iou(p, b), ti, bi) for ti, p in enumerate(predicted)
+                        for bi, b in enumerate(boxes)), reverse=True)
+        used_t, used_b = set(), set()
+        for score, ti, bi in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti in used_t or bi in used_b:
+                continue
+            used_t.add(ti)
+            used_b.add(bi)
+            track = self.tracks[ti]
+            track.kalman.update(boxes[bi])
+            track.box = tuple(boxes[bi])
+            track.misses = 0
+            track.last_seen = self.frame_no
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_t:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for bi, box in enumerate(boxes):
+            if bi not in used_b:
+                self.tracks.append(Track(next(self._ids), tuple(box), self.frame_no))
+        return [t for t in self.tracks if t.last_seen == self.frame_no]
+
+    def needs_recognition(self, track):
+        if track.last_verified is None:
+            return True
+        age = self.frame_no - track.last_verified
+        if track.name is None:
+            return age >= self.retry_unknown_every
+        if not track.confirmed:
+            return True             # still collecting votes
+        return track.score < self.min_score or age >= self.reverify_every
+
+    def split(self, tracks):
+        """``(to_recognize, carried_forward)`` for the tracks of this frame."""
+        todo = [t for t in tracks if self.needs_recognition(t)]
+        self.embeddings_saved += len(tracks) - len(todo)
+        return todo, [t for t in tracks if t not in todo]
+
+    def assign(self, track, name, score, class_name=None):
+        """Record one recognition; returns True when this vote confirms the identity."""
+        track.last_verified = self.frame_no
+        if name in ("Unknown", "Error"):
+            if not track.confirmed:
+                track.name, track.score = None, score
+            return False
+        track.votes[(name, class_name)] += 1
+        (best_name, best_class), count = track.votes.most_common(1)[0]
+        track.name, track.class_name = best_name, best_class
+        track.score = score if (name, class_name) == (best_name, best_class) else 0.0
+        if not track.confirmed and count >= self.votes_needed:
+            track.confirmed = True
+            return True
+        return False